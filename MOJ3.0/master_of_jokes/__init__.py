@@ -51,6 +51,7 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE=os.path.join(app.instance_path, 'master_of_jokes.sqlite'),
+        STREAM_PAGES=True,
     )
     logger.info("Database configured at: %s", app.config['DATABASE'])
 
@@ -78,6 +79,46 @@ def create_app(test_config=None):
     db.init_app(app)
     logger.info("Database functions registered")
 
+    from . import maintenance
+    maintenance.init_app(app)
+
+    from . import migrations
+    migrations.init_app(app)
+
+    from . import assets
+    assets.init_app(app)
+    app.register_blueprint(assets.bp)
+
+    from . import compress
+    compress.init_app(app)
+
+    from . import querystats
+    querystats.init_app(app)
+
+    from . import timeouts
+    timeouts.init_app(app)
+
+    from . import recommend
+    recommend.init_app(app)
+
+    from . import duplicates
+    duplicates.init_app(app)
+
+    from . import moderation
+    moderation.init_app(app)
+
+    from . import suggest
+    suggest.init_app(app)
+
+    from . import availability
+    availability.init_app(app)
+
+    from . import tags
+    tags.init_app(app)
+
+    from . import throttle
+    throttle.init_app(app)
+
     # Register blueprints
     from . import auth
     app.register_blueprint(auth.bp)
@@ -128,4 +169,11 @@ def create_app(test_config=None):
     from . import report_api
     app.register_blueprint(report_api.bp)
 
+    from . import api
+    app.register_blueprint(api.bp)
+
+    # Last, so it wraps the finished WSGI app
+    from . import admission
+    admission.init_app(app)
+
     return app
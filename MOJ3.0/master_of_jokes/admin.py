@@ -1,13 +1,20 @@
 # master_of_jokes/admin.py
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for
+    Blueprint, current_app, flash, g, redirect, render_template, request, url_for
 )
+from master_of_jokes import moderation
+from master_of_jokes import suggest
 from master_of_jokes.db import get_db
 from master_of_jokes.auth import login_required
+from master_of_jokes.querystats import query_budget
 import logging
 bp = Blueprint('moderator', __name__, url_prefix='/admin')
 logger = logging.getLogger(__name__)
 
+# How many moderators are left, off user_role
+MODERATOR_COUNT = "SELECT COUNT(*) FROM user WHERE role = 'moderator'"
+
+
 def moderator_required(view):
     from functools import wraps
     
@@ -24,16 +31,28 @@ def moderator_required(view):
 
 
 @bp.route('/')
+@query_budget(queries=2)
 @login_required
 @moderator_required
 def dashboard():
     logger.info("Moderator Dashboard started")
     db = get_db()
-    users = db.execute("SELECT id, nickname, role, joke_balance FROM user").fetchall()
+    q = request.args.get('q', '').strip()
+    if q:
+        # Read off the user_nickname_nocase index
+        users = db.execute(
+            "SELECT id, nickname, role, joke_balance FROM user"
+            " WHERE nickname LIKE ? ESCAPE '\\'"
+            " ORDER BY nickname COLLATE NOCASE LIMIT 50",
+            (suggest.like_prefix(q),),
+        ).fetchall()
+    else:
+        users = db.execute("SELECT id, nickname, role, joke_balance FROM user").fetchall()
     logger.debug("Showing %s dashboard",g.user['nickname'])
-    return render_template('admin/dashboard.html', users=users)
+    return render_template('admin/dashboard.html', users=users, q=q)
 
 @bp.route('/promote', methods=['POST'])
+@query_budget(queries=2, rows=1)
 @login_required
 @moderator_required
 def promote():
@@ -48,6 +67,7 @@ def promote():
 
 
 @bp.route('/demote', methods=['POST'])
+@query_budget(queries=3, rows=2)
 @login_required
 @moderator_required
 def demote():
@@ -55,7 +75,7 @@ def demote():
     user_id = request.form['user_id']
     db = get_db()
     # Ensure we are not removing the last moderator
-    count = db.execute("SELECT COUNT(*) FROM user WHERE role = 'moderator'").fetchone()[0]
+    count = db.execute(MODERATOR_COUNT).fetchone()[0]
     if count > 1:
         db.execute("UPDATE user SET role = 'user' WHERE id = ?", (user_id,))
         db.commit()
@@ -67,6 +87,7 @@ def demote():
     return redirect(url_for('moderator.dashboard'))
 
 @bp.route('/update-balance', methods=['POST'])
+@query_budget(queries=2, rows=1)
 @login_required
 @moderator_required
 def update_balance():
@@ -79,3 +100,24 @@ def update_balance():
     flash("Balance updated.")
     return redirect(url_for('moderator.dashboard'))
 
+
+@bp.route('/banned-terms', methods=['GET', 'POST'])
+@query_budget(queries=1, rows=1)
+@login_required
+@moderator_required
+def banned_terms():
+    """Edit the banned terms list; the filter picks it up on its own."""
+    path = current_app.config['MODERATION_TERMS']
+    if request.method == 'POST':
+        terms = request.form['terms'].replace('\r\n', '\n').strip() + '\n'
+        moderation.write_terms(path, terms)
+        logger.info("Banned terms updated by %s", g.user['nickname'])
+        flash("Banned terms saved.")
+        return redirect(url_for('moderator.banned_terms'))
+
+    try:
+        with open(path, encoding='utf-8') as f:
+            terms = f.read()
+    except FileNotFoundError:
+        terms = ''
+    return render_template('admin/banned_terms.html', terms=terms)
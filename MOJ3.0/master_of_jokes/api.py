@@ -0,0 +1,296 @@
+import json
+
+from flask import Blueprint, current_app, g, request
+from werkzeug.exceptions import HTTPException, abort
+
+from master_of_jokes.db import get_db
+from master_of_jokes.querystats import query_budget
+
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the json module is used without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, only JSON is offered without it
+    msgpack = None
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Most jokes, ids or ratings in one request or response
+MAX_BATCH = 100
+DEFAULT_LIMIT = 20
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+# What ?fields= can pick, as the SQL reading it; only those picked are
+# selected. A joke's body is only given to its author and to users who
+# took it, as on /<id>/view, so the API doesn't get around the balance.
+JOKE_FIELDS = {
+    'id': 'j.id',
+    'title': 'j.title',
+    'body': '''CASE WHEN j.author_id = :user_id OR EXISTS (
+                 SELECT 1 FROM joke_view v
+                 WHERE v.joke_id = j.id AND v.user_id = :user_id)
+               THEN j.body END''',
+    'created': 'j.created',
+    'author': 'u.nickname',
+    'avg_rating': '''(SELECT COALESCE(AVG(r.rating), 0.0) FROM joke_rating r
+                     WHERE r.joke_id = j.id)''',
+    'rating_count': '(SELECT COUNT(*) FROM joke_rating r WHERE r.joke_id = j.id)',
+    'tags': '''(SELECT json_group_array(t.name) FROM joke_tag jt
+               JOIN tag t ON t.id = jt.tag_id WHERE jt.joke_id = j.id)''',
+}
+USER_FIELDS = {
+    'id': 'u.id',
+    'nickname': 'u.nickname',
+    'joke_count': '(SELECT COUNT(*) FROM joke WHERE author_id = u.id)',
+    'ratings_received': '''(SELECT COUNT(*) FROM joke j
+                           JOIN joke_rating r ON r.joke_id = j.id
+                           WHERE j.author_id = u.id)''',
+}
+# Read back from SQLite as JSON text
+JSON_FIELDS = frozenset({'tags'})
+
+# Upsert the user's ratings of the jokes they took; the author can't
+# have, so their own jokes are left out too
+RATE = '''INSERT INTO joke_rating (joke_id, user_id, rating)
+          SELECT v.joke_id, v.user_id, json_extract(r.value, '$[1]')
+          FROM json_each(:ratings) AS r
+          JOIN joke_view v ON v.joke_id = json_extract(r.value, '$[0]')
+           AND v.user_id = :user_id
+          WHERE true
+          ON CONFLICT (joke_id, user_id) DO UPDATE SET rating = excluded.rating'''
+
+# Each rated joke's average and count, off joke_rating's primary key
+SCORES = '''SELECT joke_id, AVG(rating), COUNT(*) FROM joke_rating
+            WHERE joke_id IN (SELECT value FROM json_each(?))
+            GROUP BY joke_id'''
+
+
+def _mimetype():
+    """The response type the client prefers, None if nothing offered."""
+    if not request.accept_mimetypes:
+        return JSON
+    offered = [JSON, MSGPACK] if msgpack is not None else [JSON]
+    return request.accept_mimetypes.best_match(offered)
+
+
+def dumps(data, mimetype):
+    if mimetype == MSGPACK:
+        return msgpack.packb(data, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def respond(data, status=200):
+    """Serialize data as the client negotiated, or answer 406."""
+    mimetype = _mimetype()
+    if mimetype is None:
+        status, data, mimetype = 406, {'error': 'Accepts application/json'}, JSON
+        if msgpack is not None:
+            data['error'] += ' or application/msgpack'
+    response = current_app.response_class(dumps(data, mimetype), status, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+
+def payload():
+    """The request body, an object, msgpack if it says so, otherwise
+    JSON."""
+    if request.mimetype == MSGPACK and msgpack is not None:
+        try:
+            return _object(msgpack.unpackb(request.get_data()))
+        except ValueError:
+            abort(400, "The body isn't valid msgpack.")
+    data = request.get_json(force=True, silent=True)
+    if data is None:
+        abort(400, 'Send a JSON or msgpack body.')
+    return _object(data)
+
+
+def _object(data):
+    if not isinstance(data, dict):
+        abort(400, 'The body must be an object.')
+    return data
+
+
+def fields(available):
+    """The ?fields= picked from available, all by default."""
+    picked = request.args.get('fields')
+    if not picked:
+        return list(available)
+    picked = list(dict.fromkeys(name.strip() for name in picked.split(',')))
+    unknown = [name for name in picked if name not in available]
+    if unknown:
+        abort(400, 'Unknown fields %s; choose from %s.'
+              % (', '.join(unknown), ', '.join(available)))
+    return picked
+
+
+def select(available, names):
+    return ', '.join('%s AS %s' % (available[name], name) for name in names)
+
+
+def objects(rows, names):
+    """Rows as dicts of names, JSON fields decoded."""
+    decode = [name for name in names if name in JSON_FIELDS]
+    result = []
+    for row in rows:
+        item = dict(zip(names, row))
+        for name in decode:
+            item[name] = json.loads(item[name])
+        result.append(item)
+    return result
+
+
+def int_arg(name, default, low, high):
+    value = request.args.get(name, default, type=int)
+    if value is None or not low <= value <= high:
+        abort(400, '%s must be a whole number from %d to %d.' % (name, low, high))
+    return value
+
+
+@bp.before_request
+def login_required():
+    """Answer 401 instead of redirecting to the login page."""
+    if g.user is None:
+        abort(401, 'Log in first.')
+
+
+@bp.errorhandler(HTTPException)
+def error(e):
+    return respond({'error': e.description}, e.code)
+
+
+@bp.route('/jokes')
+@query_budget(queries=2, rows=1 + MAX_BATCH)
+def jokes():
+    """Newest jokes first, ?limit= at a time from ?offset=, or with
+    ?ids=1,2,3 those jokes in one query, in the order asked for; ids not
+    found are listed under missing."""
+    names = fields(JOKE_FIELDS)
+    # the id is read anyway to put the batch in order
+    columns = select(JOKE_FIELDS, ['id'] + names)
+    db = get_db()
+
+    if 'ids' in request.args:
+        try:
+            ids = list(dict.fromkeys(int(id) for id in request.args['ids'].split(',')))
+        except ValueError:
+            abort(400, 'ids must be comma separated joke ids.')
+        if len(ids) > MAX_BATCH:
+            abort(400, 'Ask for at most %d jokes at a time.' % MAX_BATCH)
+        rows = db.execute(
+            'SELECT %s FROM joke j JOIN user u ON u.id = j.author_id'
+            ' WHERE j.id IN (SELECT value FROM json_each(:ids))' % columns,
+            {'ids': json.dumps(ids), 'user_id': g.user['id']}
+        ).fetchall()
+        found = {row[0]: row[1:] for row in rows}
+        return respond({
+            'jokes': objects([found[id] for id in ids if id in found], names),
+            'missing': [id for id in ids if id not in found],
+        })
+
+    limit = int_arg('limit', DEFAULT_LIMIT, 1, MAX_BATCH)
+    offset = int_arg('offset', 0, 0, 2**31)
+    rows = db.execute(
+        'SELECT %s FROM joke j JOIN user u ON u.id = j.author_id'
+        ' ORDER BY j.created DESC LIMIT :limit OFFSET :offset' % columns,
+        {'limit': limit, 'offset': offset, 'user_id': g.user['id']}
+    ).fetchall()
+    return respond({'jokes': objects([row[1:] for row in rows], names)})
+
+
+@bp.route('/jokes/<int:id>')
+@query_budget(queries=2, rows=2)
+def joke(id):
+    names = fields(JOKE_FIELDS)
+    row = get_db().execute(
+        'SELECT %s FROM joke j JOIN user u ON u.id = j.author_id'
+        ' WHERE j.id = :id' % select(JOKE_FIELDS, names),
+        {'id': id, 'user_id': g.user['id']}
+    ).fetchone()
+    if row is None:
+        abort(404, "Joke id %d doesn't exist." % id)
+    return respond(objects([row], names)[0])
+
+
+@bp.route('/users/<nickname>')
+@query_budget(queries=2, rows=2)
+def user(nickname):
+    names = fields(USER_FIELDS)
+    row = get_db().execute(
+        'SELECT %s FROM user u WHERE u.nickname = ?' % select(USER_FIELDS, names),
+        (nickname,)
+    ).fetchone()
+    if row is None:
+        abort(404, "User %s doesn't exist." % nickname)
+    return respond(objects([row], names)[0])
+
+
+def _rate(ratings):
+    """Store the user's {joke_id: rating} with one statement and return
+    {joke_id: (average, count)} of the jokes they could rate."""
+    db = get_db()
+    db.execute(RATE, {'ratings': json.dumps(list(ratings.items())),
+                      'user_id': g.user['id']})
+    scores = {
+        row[0]: (row[1], row[2])
+        for row in db.execute(SCORES, (json.dumps(list(ratings)),))
+    }
+    db.commit()
+    logger.info("User %s rated %d jokes through the API", g.user['nickname'], len(scores))
+    return scores
+
+
+def _check_rating(joke_id, rating):
+    if type(joke_id) is not int or type(rating) is not int or not 1 <= rating <= 5:
+        abort(400, 'Each rating needs an integer joke_id and a rating from 1 to 5.')
+
+
+@bp.route('/jokes/<int:id>/rating', methods=('PUT',))
+@query_budget(queries=3, rows=2)
+def rate(id):
+    """Rate a joke the user took with {"rating": 1-5}."""
+    rating = payload().get('rating')
+    _check_rating(id, rating)
+    scores = _rate({id: rating})
+    if id not in scores:
+        abort(403, 'Take joke %d before rating it.' % id)
+    avg_rating, rating_count = scores[id]
+    return respond({'joke_id': id, 'avg_rating': avg_rating, 'rating_count': rating_count})
+
+
+@bp.route('/ratings', methods=('POST',))
+@query_budget(queries=3, rows=1 + MAX_BATCH)
+def rate_many():
+    """Rate up to MAX_BATCH jokes with {"ratings": [{"joke_id": 1,
+    "rating": 4}, ...]}; a joke rated twice keeps the last. Jokes the
+    user didn't take, or that don't exist, are listed under skipped."""
+    items = payload().get('ratings')
+    if not isinstance(items, list) or not items:
+        abort(400, 'Send a list of ratings.')
+    if len(items) > MAX_BATCH:
+        abort(400, 'Send at most %d ratings at a time.' % MAX_BATCH)
+    ratings = {}
+    for item in items:
+        if not isinstance(item, dict):
+            abort(400, 'Each rating needs an integer joke_id and a rating from 1 to 5.')
+        _check_rating(item.get('joke_id'), item.get('rating'))
+        ratings[item['joke_id']] = item['rating']
+
+    scores = _rate(ratings)
+    return respond({
+        'ratings': [
+            {'joke_id': id, 'avg_rating': avg, 'rating_count': count}
+            for id, (avg, count) in scores.items()
+        ],
+        'skipped': [id for id in ratings if id not in scores],
+    })
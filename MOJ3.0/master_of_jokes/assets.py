@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import (
+    Blueprint, abort, current_app, request, send_from_directory, url_for
+)
+from flask.cli import with_appcontext
+
+from master_of_jokes.querystats import query_budget
+
+try:
+    import brotli
+except ImportError:  # optional, only .gz variants are written without it
+    brotli = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('assets', __name__, url_prefix='/assets')
+
+SOURCES = ['style.css', 'script.js']
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Precompressed variants by content coding, preferred first
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """Strip indentation, blank lines and whole-line // comments only."""
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def build_assets(static_folder, output, sources=SOURCES):
+    """Write minified, fingerprinted and precompressed copies of the
+    sources to output and return the name -> built name manifest."""
+    os.makedirs(output, exist_ok=True)
+    manifest = {}
+
+    for name in sources:
+        root, ext = os.path.splitext(name)
+        with open(os.path.join(static_folder, name), encoding='utf8') as f:
+            data = MINIFIERS[ext](f.read()).encode('utf8')
+
+        built = '%s.%s%s' % (root, hashlib.sha256(data).hexdigest()[:12], ext)
+        path = os.path.join(output, built)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(data))
+
+        logger.info("Built asset %s -> %s", name, built)
+        manifest[name] = built
+
+    with open(os.path.join(output, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def load_manifest(output):
+    try:
+        with open(os.path.join(output, 'manifest.json')) as f:
+            return json.load(f)
+    except OSError:
+        logger.debug("No asset manifest in %s, serving plain static files", output)
+        return {}
+
+
+def asset_url(filename):
+    """url_for('static', ...) that resolves to the fingerprinted build."""
+    built = current_app.extensions['assets'].get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.asset', filename=built)
+
+
+@bp.route('/<path:filename>')
+@query_budget(queries=1, rows=1)
+def asset(filename):
+    if filename not in current_app.extensions['assets'].values():
+        abort(404)
+
+    output = current_app.config['ASSET_OUTPUT']
+    mimetype = mimetypes.guess_type(filename)[0]
+    # Variants there are, brotli first on a tie; q=0 refuses one
+    offered = [
+        candidate
+        for candidate, suffix in SUFFIXES.items()
+        if os.path.exists(os.path.join(output, filename + suffix))
+    ]
+    encoding = request.accept_encodings.best_match(offered)
+    if encoding is not None:
+        filename += SUFFIXES[encoding]
+
+    response = send_from_directory(output, filename, mimetype=mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@click.command('assets-build')
+@with_appcontext
+def assets_build_command():
+    """Minify, fingerprint and precompress the static assets."""
+    logger.info("Ran CLI: assets-build")
+    output = current_app.config['ASSET_OUTPUT']
+    current_app.extensions['assets'] = manifest = build_assets(
+        current_app.static_folder, output
+    )
+    for name, built in manifest.items():
+        click.echo('%s -> %s' % (name, built))
+
+
+def init_app(app):
+    app.config.setdefault('ASSET_OUTPUT', os.path.join(app.static_folder, 'dist'))
+    app.extensions['assets'] = load_manifest(app.config['ASSET_OUTPUT'])
+    app.add_template_global(asset_url)
+    app.cli.add_command(assets_build_command)
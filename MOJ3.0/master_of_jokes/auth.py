@@ -1,6 +1,7 @@
 
 # master_of_jokes/admin.py
 import functools
+import math
 import re
 import logging
 logger = logging.getLogger(__name__)
@@ -8,13 +9,23 @@ import hashlib
 
 
 from flask import (
-    Blueprint, flash, g, redirect, session, render_template, request, url_for
+    Blueprint, current_app, flash, g, jsonify, redirect, session,
+    render_template, request, url_for
 )
+from master_of_jokes import availability
+from master_of_jokes import suggest
+from master_of_jokes import throttle
 from master_of_jokes.db import get_db
+from master_of_jokes.querystats import query_budget
 
 import logging
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 logger = logging.getLogger(__name__)
+
+# A user by email or nickname, off the unique index on each
+USER_BY_NAME = 'SELECT * FROM user WHERE email = ? OR nickname = ?'
+
+
 def login_required(view):
     @functools.wraps(view)
     def wrapped_view(**kwargs):
@@ -41,6 +52,7 @@ def load_logged_in_user():
 
 
 @bp.route('/register', methods=('GET', 'POST'))
+@query_budget(queries=4, rows=3)
 def register():
     if request.method == 'POST':
         logger.debug("Received POST to /register") # DEBUG
@@ -88,6 +100,8 @@ def register():
                 (email, nickname, password_hash, 'user')  # <- add 'user' here
                 )
             db.commit()
+            availability.add(email, nickname)
+            suggest.add(nickname)
             logger.info("Registered new user %s", nickname)
             return redirect(url_for('auth.login'))
         logger.warning("Registration failed: %s", error)
@@ -98,6 +112,7 @@ def register():
 
 
 @bp.route('/login', methods=('GET', 'POST'))
+@query_budget(queries=2, rows=2)
 def login():
     if request.method == 'POST':
         logger.debug("Login POST request received")
@@ -107,10 +122,17 @@ def login():
         db = get_db()
         error = None
 
-        user = db.execute(
-            'SELECT * FROM user WHERE email = ? OR nickname = ?',
-            (username, username)
-        ).fetchone()
+        # Turned away before the lookup and the password hash
+        login_throttle = throttle.get_throttle()
+        key = throttle.normalize(username)
+        address = throttle.client_address()
+        wait = math.ceil(login_throttle.retry_after(key, address))
+        if wait:
+            logger.warning("Login throttled for %s from %s, %ds", username, address, wait)
+            flash('Too many failed attempts. Please try again in %d seconds.' % wait)
+            return render_template('auth/login.html'), 429, {'Retry-After': str(wait)}
+
+        user = db.execute(USER_BY_NAME, (username, username)).fetchone()
 
         if user is None:
             error = 'Incorrect username or password.'
@@ -134,6 +156,11 @@ def login():
                 if stored_hash != computed_hash:
                     error = 'Incorrect username or password.'
 
+        if error is None:
+            login_throttle.succeeded(key)
+        else:
+            login_throttle.failed(key, address)
+
         if error is None:
             session.clear()
             session['user_id'] = user['id']
@@ -147,7 +174,36 @@ def login():
 
 
 
+@bp.route('/users/suggest')
+@query_budget(queries=2)
+def suggest_users():
+    """The first SUGGEST_COUNT nicknames starting with ?q=, for
+    autocomplete; rows are unbounded as the first call fills the index."""
+    prefix = request.args.get('q', '').strip()
+    if not prefix:
+        return jsonify({'q': prefix, 'nicknames': []})
+    nicknames = suggest.suggest(get_db(), prefix, current_app.config['SUGGEST_COUNT'])
+    return jsonify({'q': prefix, 'nicknames': nicknames})
+
+
+@bp.route('/available')
+@query_budget(queries=3)
+def available():
+    """Whether ?email= or ?nickname= is free, for the register form as
+    the user types; most answers need no query."""
+    for field in availability.FIELDS:
+        value = request.args.get(field, '')
+        if value:
+            return jsonify({
+                'field': field,
+                'value': value,
+                'available': availability.is_available(get_db(), field, value),
+            })
+    return jsonify({'message': 'Pass an email or a nickname.'}), 400
+
+
 @bp.route('/logout')
+@query_budget(queries=1, rows=1)
 def logout():
     logger.info("User logged out: %s", g.user['nickname'] if g.user else 'Unknown')
     session.clear()
@@ -0,0 +1,124 @@
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Registration fields, named as their user columns
+FIELDS = ('email', 'nickname')
+
+
+class BloomFilter:
+    """Answers "definitely not in it" for capacity items, in about
+    1.44 * log2(1 / error_rate) bits each; false hits at most error_rate."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # k positions from two 64-bit hashes, h1 + i * h2
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+
+class TakenFilter:
+    """Bloom filter of every email and nickname in use. Filled on first
+    use, kept up by add() on register and by reading newer users every
+    refresh seconds; rebuilt twice as large once over capacity."""
+
+    def __init__(self, capacity, error_rate, refresh):
+        self.error_rate = error_rate
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.last_id = 0
+        self.checked = None
+
+    def add(self, field, value):
+        with self.lock:
+            self.bloom.add('%s:%s' % (field, value))
+
+    def catch_up(self, db):
+        """Read newly registered users if refresh seconds have passed;
+        False if the first fill is still going on in another request."""
+        now = time.monotonic()
+        if self.checked is not None and now - self.checked < self.refresh:
+            return True
+        if not self.lock.acquire(blocking=False):
+            return self.checked is not None
+        try:
+            if self.bloom.count > self.bloom.capacity:
+                logger.info("Growing the taken filter past %d items", self.bloom.capacity)
+                self.bloom = BloomFilter(self.bloom.capacity * 2, self.error_rate)
+                self.last_id = 0
+            rows = db.execute(
+                'SELECT id, email, nickname FROM user WHERE id > ? ORDER BY id',
+                (self.last_id,),
+            ).fetchall()
+            for id, email, nickname in rows:
+                self.bloom.add('email:%s' % email)
+                self.bloom.add('nickname:%s' % nickname)
+            if rows:
+                self.last_id = rows[-1][0]
+            self.checked = now
+        finally:
+            self.lock.release()
+        return True
+
+    def may_be_taken(self, field, value):
+        return '%s:%s' % (field, value) in self.bloom
+
+
+def is_available(db, field, value):
+    """Whether no user has value as their field; asks the database only
+    on a probable hit or while the filter fills."""
+    taken = current_app.extensions.get('taken_filter')
+    if taken is not None and taken.catch_up(db):
+        if not taken.may_be_taken(field, value):
+            return True
+    found = db.execute(
+        'SELECT 1 FROM user WHERE %s = ?' % field, (value,)
+    ).fetchone()
+    return found is None
+
+
+def add(email, nickname):
+    taken = current_app.extensions.get('taken_filter')
+    if taken is not None:
+        taken.add('email', email)
+        taken.add('nickname', nickname)
+
+
+def init_app(app):
+    """Bloom filter of taken emails and nicknames for /auth/available,
+    sized for AVAILABILITY_CAPACITY users; off with AVAILABILITY_BLOOM."""
+    app.config.setdefault('AVAILABILITY_BLOOM', True)
+    app.config.setdefault('AVAILABILITY_CAPACITY', 100_000)
+    app.config.setdefault('AVAILABILITY_ERROR_RATE', 0.01)
+    app.config.setdefault('AVAILABILITY_REFRESH', 5.0)
+    if app.config['AVAILABILITY_BLOOM']:
+        # Two keys per user
+        app.extensions['taken_filter'] = TakenFilter(
+            2 * app.config['AVAILABILITY_CAPACITY'],
+            app.config['AVAILABILITY_ERROR_RATE'],
+            app.config['AVAILABILITY_REFRESH'],
+        )
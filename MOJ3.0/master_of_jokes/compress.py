@@ -0,0 +1,129 @@
+import gzip
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used without it
+    brotli = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class _GzipStream:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        # A sync flush ends a block, so what was sent so far can be decoded
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+def _stream(chunks, iterable, stream, flush_size):
+    """Compress the chunks, flushing the first at once so the page starts
+    rendering, then only once flush_size bytes are waiting; every flush
+    ends a block, which costs bytes."""
+    flushed = False
+    pending = 0
+    try:
+        for data in chunks:
+            if not data:
+                continue
+            output = stream.compress(data)
+            pending += len(data)
+            if not flushed or pending >= flush_size:
+                output += stream.flush()
+                flushed = True
+                pending = 0
+            if output:
+                yield output
+        yield stream.finish()
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+def compress_response(response):
+    """Gzip or brotli HTML and JSON responses the client accepts.
+
+    Already encoded responses and send_file() responses are skipped,
+    buffered ones under COMPRESS_MIN_SIZE too. Streamed responses are
+    compressed as they are produced and sent every COMPRESS_FLUSH_SIZE
+    bytes.
+    """
+    config = current_app.config
+
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in config['COMPRESS_MIMETYPES']
+        or 'no-transform' in response.headers.get('Cache-Control', '')
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(offered)
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        stream = _BrotliStream(config['COMPRESS_BR_QUALITY'])
+    else:
+        stream = _GzipStream(config['COMPRESS_LEVEL'])
+
+    if response.is_streamed:
+        response.response = _stream(response.iter_encoded(), response.response, stream,
+                                    config['COMPRESS_FLUSH_SIZE'])
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        if encoding == 'br':
+            compressed = brotli.compress(data, quality=config['COMPRESS_BR_QUALITY'])
+        else:
+            compressed = gzip.compress(data, config['COMPRESS_LEVEL'], mtime=0)
+        logger.debug("Compressed %s from %d to %d bytes with %s",
+                     request.path, len(data), len(compressed), encoding)
+        response.set_data(compressed)
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_MIMETYPES', {'text/html', 'application/json'})
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_QUALITY', 4)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_FLUSH_SIZE', 16 * 1024)
+    app.after_request(compress_response)
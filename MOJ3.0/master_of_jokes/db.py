@@ -1,9 +1,12 @@
 import sqlite3
+from datetime import datetime, timezone
 
 import click
 from flask import current_app, g
 from flask.cli import with_appcontext
 
+from master_of_jokes import querystats, timeouts
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -11,16 +14,28 @@ logger = logging.getLogger(__name__)
 def get_db():
     if 'db' not in g:
         logger.debug("Opening new DB connection to: %s", current_app.config['DATABASE'])
-        g.db = sqlite3.connect(
+        g.db = querystats.connect(
             current_app.config['DATABASE'],
             detect_types=sqlite3.PARSE_DECLTYPES
         )
         g.db.row_factory = sqlite3.Row
+        timeouts.watch(g.db)
     logger.debug("DB connection established with row factory")
 
     return g.db
 
 
+def convert_timestamp(value):
+    """Decode a TIMESTAMP column: epoch seconds, or the ISO text that rows
+    written before schema version 2 still hold."""
+    if value.isdigit():
+        return datetime.fromtimestamp(int(value), timezone.utc).replace(tzinfo=None)
+    return datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_converter('timestamp', convert_timestamp)
+
+
 def close_db(e=None):
     db = g.pop('db', None)
 
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import random
+import re
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from master_of_jokes.db import get_db
+
+import logging
+logger = logging.getLogger(__name__)
+
+# 64 MinHash permutations in 16 bands of 4; jokes sharing a whole band
+# become candidates from a Jaccard similarity of about 0.5 up
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+
+# Jokes are compared as sets of character 4-grams
+SHINGLE = 4
+
+# Most candidates read back for one new joke
+MAX_CANDIDATES = 50
+
+_PRIME = (1 << 61) - 1
+_random = random.Random(42)
+# Fixed, stored buckets are only comparable under the same permutations
+_PERMUTATIONS = [
+    (_random.randrange(1, _PRIME), _random.randrange(_PRIME))
+    for _ in range(PERMUTATIONS)
+]
+
+# The jokes sharing a bucket with the JSON array of buckets, one per band
+CANDIDATES = '''
+    SELECT id, title, body FROM joke
+    WHERE id IN (SELECT l.joke_id FROM json_each(?) AS b
+                 JOIN joke_lsh l ON l.band = b.key AND l.bucket = b.value)
+    LIMIT ?
+'''
+
+
+def shingles(text):
+    """The 4-grams of text, lowercased, with anything but letters and
+    digits read as one space."""
+    text = ' ' + re.sub(r'[\W_]+', ' ', text.lower()).strip() + ' '
+    return {text[i:i + SHINGLE] for i in range(max(1, len(text) - SHINGLE + 1))}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _hash(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big')
+
+
+def signature(shingle_set):
+    """The smallest value of each permutation over the shingles' hashes."""
+    values = [_hash(shingle.encode()) for shingle in shingle_set]
+    return [min((a * x + b) % _PRIME for x in values) for a, b in _PERMUTATIONS]
+
+
+def buckets(signature):
+    """The LSH bucket of each band, as signed 64-bit ints for SQLite."""
+    return [
+        _hash(repr(signature[band * ROWS:(band + 1) * ROWS]).encode()) - (1 << 63)
+        for band in range(BANDS)
+    ]
+
+
+def buckets_of(text):
+    return buckets(signature(shingles(text)))
+
+
+def find(db, text, threshold):
+    """The (similarity, id, title) of the jokes at least threshold alike
+    text, most alike first, and text's buckets for index()."""
+    shingle_set = shingles(text)
+    text_buckets = buckets(signature(shingle_set))
+    candidates = db.execute(
+        CANDIDATES, (json.dumps(text_buckets), MAX_CANDIDATES)
+    ).fetchall()
+
+    # Checked on the current body, so stale buckets cost nothing more
+    found = []
+    for id, title, body in candidates:
+        similarity = jaccard(shingle_set, shingles(body))
+        if similarity >= threshold:
+            found.append((similarity, id, title))
+    found.sort(reverse=True)
+    return found, text_buckets
+
+
+def index(db, joke_id, joke_buckets):
+    """Add a joke to the LSH index in one statement."""
+    db.execute(
+        'INSERT OR IGNORE INTO joke_lsh (band, bucket, joke_id)'
+        ' SELECT key, value, ? FROM json_each(?)',
+        (joke_id, json.dumps(joke_buckets)),
+    )
+
+
+def rebuild(db, batch_size, report):
+    """Rebuild the index from every joke, committing each batch."""
+    total = db.execute('SELECT COUNT(*) FROM joke').fetchone()[0]
+    with db:
+        db.execute('DELETE FROM joke_lsh')
+
+    done = last = 0
+    while True:
+        rows = db.execute(
+            'SELECT id, body FROM joke WHERE id > ? ORDER BY id LIMIT ?',
+            (last, batch_size),
+        ).fetchall()
+        if not rows:
+            return
+        with db:
+            for joke_id, body in rows:
+                index(db, joke_id, buckets_of(body))
+        last = rows[-1][0]
+        done += len(rows)
+        report(done, total)
+
+
+def clusters(db, threshold, batch_size):
+    """Yield groups of near-duplicate joke ids, reading the shared
+    buckets batch_size at a time."""
+    parent = {}
+
+    def root(id):
+        while parent.setdefault(id, id) != id:
+            parent[id] = parent[parent[id]]
+            id = parent[id]
+        return id
+
+    position = (-1, 0)
+    checked = set()
+    while True:
+        groups = db.execute(
+            '''SELECT band, bucket, group_concat(joke_id) FROM joke_lsh
+               WHERE (band, bucket) > (?, ?)
+               GROUP BY band, bucket
+               HAVING COUNT(*) > 1
+               ORDER BY band, bucket
+               LIMIT ?''',
+            (*position, batch_size),
+        ).fetchall()
+        if not groups:
+            break
+        position = groups[-1][:2]
+
+        pairs = set()
+        for _, _, ids in groups:
+            ids = sorted(int(id) for id in ids.split(','))
+            pairs.update((a, b) for i, a in enumerate(ids) for b in ids[i + 1:])
+        pairs -= checked
+        checked |= pairs
+
+        wanted = sorted({id for pair in pairs for id in pair})
+        shingled = {
+            id: shingles(body) for id, body in db.execute(
+                'SELECT id, body FROM joke WHERE id IN (SELECT value FROM json_each(?))',
+                (json.dumps(wanted),),
+            )
+        }
+        for a, b in pairs:
+            if a in shingled and b in shingled:
+                if jaccard(shingled[a], shingled[b]) >= threshold:
+                    parent[root(a)] = root(b)
+
+    found = {}
+    for id in parent:
+        found.setdefault(root(id), []).append(id)
+    for ids in found.values():
+        if len(ids) > 1:
+            yield sorted(ids)
+
+
+@click.command('find-duplicates')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Jokes or buckets per batch.')
+@click.option('--no-rebuild', is_flag=True, help='Use the index as it is.')
+@with_appcontext
+def find_duplicates_command(batch_size, no_rebuild):
+    """Index every joke for duplicate detection and list near-duplicates."""
+    logger.info("Ran CLI: find-duplicates")
+    db = get_db()
+    start = time.monotonic()
+    if not no_rebuild:
+        rebuild(db, batch_size,
+                lambda done, total: click.echo('  indexed %d/%d jokes' % (done, total)))
+
+    count = 0
+    for ids in clusters(db, current_app.config['DUPLICATE_THRESHOLD'], batch_size):
+        count += 1
+        rows = db.execute(
+            'SELECT id, title FROM joke WHERE id IN (SELECT value FROM json_each(?))'
+            ' ORDER BY id',
+            (json.dumps(ids),),
+        ).fetchall()
+        click.echo('%d alike:' % len(ids))
+        for id, title in rows:
+            click.echo('  #%d %s' % (id, title))
+
+    elapsed = time.monotonic() - start
+    logger.info("Found %d duplicate clusters in %.2fs", count, elapsed)
+    click.echo('Found %d clusters in %.2fs.' % (count, elapsed))
+
+
+def init_app(app):
+    """Register the find-duplicates command; DUPLICATE_THRESHOLD is the
+    Jaccard similarity from which jokes count as the same."""
+    app.config.setdefault('DUPLICATE_THRESHOLD', 0.6)
+    app.cli.add_command(find_duplicates_command)
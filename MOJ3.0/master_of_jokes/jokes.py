@@ -1,18 +1,97 @@
+import json
+
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for
+    Blueprint, current_app, flash, g, get_flashed_messages, redirect,
+    render_template, request, stream_template, url_for
 )
 from werkzeug.exceptions import abort
 
 from master_of_jokes.auth import login_required # type: ignore
+from master_of_jokes import duplicates # type: ignore
+from master_of_jokes import moderation # type: ignore
+from master_of_jokes import tags # type: ignore
+from master_of_jokes import timeouts # type: ignore
 from master_of_jokes.db import get_db # type: ignore
+from master_of_jokes.querystats import query_budget # type: ignore
 
 import logging
 logger = logging.getLogger(__name__)
 
 bp = Blueprint('jokes', __name__)
 
+# The user's own jokes, newest first, off joke_author_created
+MY_JOKES = '''SELECT j.id, title, body, created, author_id, nickname,
+              (SELECT COALESCE(AVG(r.rating), 0) FROM joke_rating r
+               WHERE r.joke_id = j.id) as avg_rating
+              FROM joke j JOIN user u ON j.author_id = u.id
+              WHERE j.author_id = ?
+              ORDER BY created DESC'''
+
+# Everyone else's jokes, newest first, off joke_created
+LIST_JOKES = '''SELECT j.id, title, author_id, nickname,
+                (SELECT COALESCE(AVG(r.rating), 0) FROM joke_rating r
+                 WHERE r.joke_id = j.id) as avg_rating
+                FROM joke j JOIN user u ON j.author_id = u.id
+                WHERE j.author_id != ?
+                ORDER BY created DESC'''
+
+# The jokes in a JSON array of ids, newest first
+TAG_JOKES = '''SELECT j.id, title, author_id, nickname,
+               (SELECT COALESCE(AVG(r.rating), 0) FROM joke_rating r
+                WHERE r.joke_id = j.id) as avg_rating
+               FROM joke j JOIN user u ON j.author_id = u.id
+               WHERE j.id IN (SELECT value FROM json_each(?))
+               ORDER BY created DESC'''
+
+# The user's recommendations they haven't taken yet, best first
+TAKE_QUEUE = '''SELECT j.id, title, nickname
+                FROM joke_recommendation r
+                JOIN joke j ON j.id = r.joke_id
+                JOIN user u ON j.author_id = u.id
+                WHERE r.user_id = ?
+                AND NOT EXISTS (SELECT 1 FROM joke_view v
+                                WHERE v.joke_id = r.joke_id AND v.user_id = r.user_id)
+                ORDER BY r.rank'''
+
+# One joke with its average rating, and the user's view and rating of it
+VIEW_JOKE = '''SELECT j.id, title, body, created, author_id, nickname,
+               COALESCE(AVG(r.rating), 0) as avg_rating
+               FROM joke j JOIN user u ON j.author_id = u.id
+               LEFT JOIN joke_rating r ON j.id = r.joke_id
+               WHERE j.id = ?
+               GROUP BY j.id'''
+VIEW_RECORD = 'SELECT * FROM joke_view WHERE user_id = ? AND joke_id = ?'
+USER_RATING = 'SELECT rating FROM joke_rating WHERE user_id = ? AND joke_id = ?'
+
+# A joke's rows in the other tables, deleted before the joke itself
+DELETE_RELATED = (
+    'DELETE FROM joke_view WHERE joke_id = ?',
+    'DELETE FROM joke_rating WHERE joke_id = ?',
+    'DELETE FROM joke_tag WHERE joke_id = ?',
+)
+
+
+def render_page(template_name, **context):
+    """Stream a page whose context holds lazy row iterators when
+    STREAM_PAGES is set, otherwise render_template."""
+    if not current_app.config['STREAM_PAGES']:
+        return render_template(template_name, **context)
+
+    # The session cookie goes out before the body, so pop flashes now
+    get_flashed_messages()
+    return current_app.response_class(
+        timeouts.cut_short(stream_template(template_name, **context))
+    )
+
+
+def _rows(query, params):
+    """Yield rows as they are read; the query runs on first iteration,
+    on the connection of the context the stream runs in."""
+    yield from get_db().execute(query, params)
+
 
 @bp.route('/')
+@query_budget(queries=1, rows=1)
 def index():
     """Redirect to create joke page if logged in, otherwise to login page."""
     if g.user:
@@ -21,14 +100,17 @@ def index():
 
 
 @bp.route('/create', methods=('GET', 'POST'))
+@query_budget(queries=7, rows=1 + duplicates.MAX_CANDIDATES)
 @login_required
 def create():
-    """Create a new joke."""
+    """Create a new joke; near-duplicates need "post anyway" checked."""
+    alike = []
     if request.method == 'POST':
         logger.debug("Entered create() view for user %s", g.user['nickname'])
 
         title = request.form['title']
         body = request.form['body']
+        names = tags.parse(request.form.get('tags', ''))
         error = None
 
         if not title:
@@ -37,18 +119,31 @@ def create():
             error = 'Body is required.'
         elif len(title.split()) > 10:
             error = 'Title cannot be more than 10 words.'
+        else:
+            error = tags.check(names) or moderation.check(title, body)
         
         if error is None:
             db = get_db()
+            alike, body_buckets = duplicates.find(
+                db, body, current_app.config['DUPLICATE_THRESHOLD']
+            )
+            if alike and not request.form.get('post_anyway'):
+                logger.info("Joke '%s' by %s looks like joke ID %s",
+                            title, g.user['nickname'], alike[0][1])
+                error = "This joke looks a lot like one that's already here."
+
+        if error is None:
             try:
                 logger.info("Joke created: '%s' by %s", title, g.user['nickname'])
 
                 # Insert the joke
-                db.execute(
+                joke_id = db.execute(
                     'INSERT INTO joke (author_id, title, body)'
                     ' VALUES (?, ?, ?)',
                     (g.user['id'], title, body)
-                )
+                ).lastrowid
+                duplicates.index(db, joke_id, body_buckets)
+                tags.add(db, joke_id, names)
                 
                 # Update user's joke balance
                 db.execute(
@@ -66,51 +161,63 @@ def create():
         
         flash(error)
 
-    return render_template('jokes/create.html')
+    return render_template('jokes/create.html', alike=alike)
 
 
 @bp.route('/my-jokes')
+@query_budget(queries=2)
 @login_required
 def my_jokes():
     """Show jokes created by the logged-in user."""
     logger.info("User %s requested their joke list", g.user['nickname'])
 
-    db = get_db()
-    jokes = db.execute(
-        'SELECT j.id, title, body, created, author_id, nickname,'
-        ' COALESCE(AVG(r.rating), 0) as avg_rating'
-        ' FROM joke j JOIN user u ON j.author_id = u.id'
-        ' LEFT JOIN joke_rating r ON j.id = r.joke_id'
-        ' WHERE j.author_id = ?'
-        ' GROUP BY j.id'
-        ' ORDER BY created DESC',
-        (g.user['id'],)
-    ).fetchall()
-    logger.debug("Fetched %d jokes for user %s", len(jokes), g.user['nickname'])
+    jokes = _rows(MY_JOKES, (g.user['id'],))
 
-    return render_template('jokes/my_jokes.html', jokes=jokes)
+    return render_page('jokes/my_jokes.html', jokes=jokes)
 
 
 @bp.route('/list')
+@query_budget(queries=3)
 @login_required
 def list_jokes():
     logger.info("User %s requested list of public jokes", g.user['nickname'])
 
     """List all jokes not authored by the current user."""
-    db = get_db()
-    jokes = db.execute(
-        'SELECT j.id, title, author_id, nickname,'
-        ' COALESCE(AVG(r.rating), 0) as avg_rating'
-        ' FROM joke j JOIN user u ON j.author_id = u.id'
-        ' LEFT JOIN joke_rating r ON j.id = r.joke_id'
-        ' WHERE j.author_id != ?'
-        ' GROUP BY j.id'
-        ' ORDER BY created DESC',
-        (g.user['id'],)
-    ).fetchall()
-    logger.debug("Fetched %d non-authored jokes for user %s", len(jokes), g.user['nickname'])
+    facets = tags.top(current_app.config['TAG_FACETS'])
+    jokes = _rows(LIST_JOKES, (g.user['id'],))
+
+    return render_page('jokes/list.html', jokes=jokes, facets=facets)
+
+
+@bp.route('/tag/<name>')
+@query_budget(queries=4 + tags.MAX_FILTER)
+@login_required
+def tag(name):
+    """Jokes with every tag in name, like /tag/programming+dad, found by
+    intersecting the tags' posting lists, and the other tags among them."""
+    names = list(dict.fromkeys(name.lower().split('+')))
+    if len(names) > tags.MAX_FILTER:
+        abort(404, 'Filter by at most %d tags.' % tags.MAX_FILTER)
+    ids = tags.matching(get_db(), names)
+    if ids is None:
+        abort(404, f"Tag {name} doesn't exist.")
+    logger.info("User %s filtered jokes by %s: %d found", g.user['nickname'], name, len(ids))
+
+    facets = tags.facets(ids, current_app.config['TAG_FACETS'], exclude=names)
+    jokes = _rows(TAG_JOKES, (json.dumps(ids),))
+
+    return render_page('jokes/list.html', jokes=jokes, facets=facets, tag_names=names)
+
+
+@bp.route('/take')
+@query_budget(queries=2)
+@login_required
+def take():
+    """Jokes picked for the user by `flask recommend`, best first, minus
+    the ones they took since it ran."""
+    jokes = _rows(TAKE_QUEUE, (g.user['id'],))
 
-    return render_template('jokes/list.html', jokes=jokes)
+    return render_page('jokes/take.html', jokes=jokes)
 
 
 def get_joke(id, check_author=True):
@@ -118,7 +225,9 @@ def get_joke(id, check_author=True):
     joke = get_db().execute(
         'SELECT j.id, title, body, created, author_id, nickname,'
         ' COALESCE(AVG(r.rating), 0) as avg_rating,'
-        ' COUNT(r.id) as rating_count'
+        ' COUNT(r.rating) as rating_count,'
+        ' (SELECT group_concat(t.name, \' \') FROM joke_tag jt'
+        '  JOIN tag t ON t.id = jt.tag_id WHERE jt.joke_id = j.id) as tags'
         ' FROM joke j JOIN user u ON j.author_id = u.id'
         ' LEFT JOIN joke_rating r ON j.id = r.joke_id'
         ' WHERE j.id = ?'
@@ -136,37 +245,24 @@ def get_joke(id, check_author=True):
 
 
 @bp.route('/<int:id>/view', methods=('GET', 'POST'))
+@query_budget(queries=7, rows=5)
 @login_required
 def view(id):
     logger.info("User %s is viewing joke ID %s", g.user['nickname'], id)
 
     """View a specific joke and handle rating if the user is not the author."""
     db = get_db()
-    joke = db.execute(
-        'SELECT j.id, title, body, created, author_id, nickname,'
-        ' COALESCE(AVG(r.rating), 0) as avg_rating'
-        ' FROM joke j JOIN user u ON j.author_id = u.id'
-        ' LEFT JOIN joke_rating r ON j.id = r.joke_id'
-        ' WHERE j.id = ?'
-        ' GROUP BY j.id',
-        (id,)
-    ).fetchone()
+    joke = db.execute(VIEW_JOKE, (id,)).fetchone()
     
     if joke is None:
         logger.error("Joke not found: ID %s requested by %s", id, g.user['nickname'])
         abort(404, f"Joke id {id} doesn't exist.")
     
     # Check if user has already viewed this joke
-    view_record = db.execute(
-        'SELECT * FROM joke_view WHERE user_id = ? AND joke_id = ?',
-        (g.user['id'], id)
-    ).fetchone()
+    view_record = db.execute(VIEW_RECORD, (g.user['id'], id)).fetchone()
     
     # Get user's current rating if any
-    user_rating = db.execute(
-        'SELECT rating FROM joke_rating WHERE user_id = ? AND joke_id = ?',
-        (g.user['id'], id)
-    ).fetchone()
+    user_rating = db.execute(USER_RATING, (g.user['id'], id)).fetchone()
     
     is_author = joke['author_id'] == g.user['id']
     
@@ -231,6 +327,7 @@ def view(id):
 
 
 @bp.route('/<int:id>/update', methods=('GET', 'POST'))
+@query_budget(queries=7, rows=2)
 @login_required
 def update(id):
     logger.info("User %s is updating joke ID %s", g.user['nickname'], id)
@@ -240,11 +337,14 @@ def update(id):
 
     if request.method == 'POST':
         body = request.form['body']
+        names = tags.parse(request.form.get('tags', ''))
         error = None
 
         if not body:
             logger.warning("Update failed for joke ID %s: body was empty", id)
             error = 'Body is required.'
+        else:
+            error = tags.check(names) or moderation.check(body)
 
         if error is not None:
             flash(error)
@@ -254,6 +354,8 @@ def update(id):
                 'UPDATE joke SET body = ? WHERE id = ?',
                 (body, id)
             )
+            duplicates.index(db, id, duplicates.buckets_of(body))
+            tags.replace(db, id, names)
             logger.info("Joke ID %s updated by %s", id, g.user['nickname'])
 
             db.commit()
@@ -263,6 +365,7 @@ def update(id):
 
 
 @bp.route('/<int:id>/delete', methods=('POST',))
+@query_budget(queries=6, rows=2)
 @login_required
 def delete(id):
     logger.info("User %s is deleting joke ID %s", g.user['nickname'], id)
@@ -271,9 +374,9 @@ def delete(id):
     joke = get_joke(id)
     db = get_db()
     
-    # First delete related records in joke_view and joke_rating
-    db.execute('DELETE FROM joke_view WHERE joke_id = ?', (id,))
-    db.execute('DELETE FROM joke_rating WHERE joke_id = ?', (id,))
+    # First delete related records in joke_view, joke_rating and joke_tag
+    for statement in DELETE_RELATED:
+        db.execute(statement, (id,))
     
     # Then delete the joke
     db.execute('DELETE FROM joke WHERE id = ?', (id,))
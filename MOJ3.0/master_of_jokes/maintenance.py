@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from master_of_jokes.db import get_db
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceeded(Exception):
+    """Raised when a maintenance task runs past its time budget."""
+
+
+def _run_with_budget(db, budget, fn):
+    """Call fn(deadline) with a progress handler that interrupts any
+    statement still running once the budget has passed."""
+    deadline = time.monotonic() + budget
+    db.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    try:
+        return fn(deadline)
+    except sqlite3.OperationalError as e:
+        if 'interrupted' in str(e):
+            raise BudgetExceeded() from e
+        raise
+    finally:
+        db.set_progress_handler(None, 0)
+
+
+def refresh_statistics(db, budget, config):
+    """Re-ANALYZE every table, sampling at most DB_ANALYSIS_LIMIT rows per
+    index. PRAGMA optimize would skip them all on this fresh connection."""
+    def run(deadline):
+        db.execute('PRAGMA analysis_limit = %d' % int(config['DB_ANALYSIS_LIMIT']))
+        db.execute('ANALYZE')
+        db.commit()
+        return 'statistics refreshed'
+
+    return _run_with_budget(db, budget, run)
+
+
+def incremental_vacuum(db, budget, config):
+    """Hand free pages back to the file system a few at a time."""
+    if db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 'skipped, auto_vacuum is not INCREMENTAL'
+
+    step = int(config['DB_VACUUM_PAGES'])
+
+    def run(deadline):
+        freed = 0
+        while time.monotonic() < deadline:
+            free = db.execute('PRAGMA freelist_count').fetchone()[0]
+            if free == 0:
+                break
+            db.execute('PRAGMA incremental_vacuum(%d)' % min(step, free)).fetchall()
+            freed += min(step, free)
+        return '%d pages freed' % freed
+
+    return _run_with_budget(db, budget, run)
+
+
+def checkpoint_wal(db, budget, config):
+    """Truncate the WAL once it grows past DB_WAL_CHECKPOINT_BYTES."""
+    if db.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+        return 'skipped, journal_mode is not WAL'
+
+    path = db.execute('PRAGMA database_list').fetchone()[2]
+    try:
+        size = os.path.getsize(path + '-wal')
+    except OSError:
+        size = 0
+
+    if size <= config['DB_WAL_CHECKPOINT_BYTES']:
+        return 'skipped, WAL is %d bytes' % size
+
+    def run(deadline):
+        db.execute('PRAGMA busy_timeout = %d' % int(budget * 1000))
+        busy, log, done = db.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        if busy:
+            return 'partial, %d of %d frames checkpointed' % (done, log)
+        return 'checkpointed %d bytes' % size
+
+    return _run_with_budget(db, budget, run)
+
+
+TASKS = {
+    'analyze': refresh_statistics,
+    'vacuum': incremental_vacuum,
+    'checkpoint': checkpoint_wal,
+}
+
+
+def run_maintenance(db, config, tasks=None, budget=None):
+    """Run the maintenance tasks and return (task, outcome) pairs."""
+    if budget is None:
+        budget = config['DB_MAINTENANCE_BUDGET']
+
+    results = []
+    for name, task in TASKS.items():
+        if tasks and name not in tasks:
+            continue
+        try:
+            outcome = task(db, budget, config)
+        except BudgetExceeded:
+            logger.warning("Maintenance task %s ran over its %ss budget", name, budget)
+            outcome = 'stopped after %ss budget' % budget
+        except sqlite3.OperationalError as e:
+            logger.error("Maintenance task %s failed: %s", name, e)
+            outcome = 'failed, %s' % e
+        logger.info("Maintenance %s: %s", name, outcome)
+        results.append((name, outcome))
+
+    return results
+
+
+class MaintenanceThread(threading.Thread):
+    """Runs every maintenance task each DB_MAINTENANCE_INTERVAL seconds."""
+
+    def __init__(self, app):
+        super().__init__(name='db-maintenance', daemon=True)
+        self.config = app.config
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.config['DB_MAINTENANCE_INTERVAL']):
+            db = sqlite3.connect(self.config['DATABASE'])
+            try:
+                run_maintenance(db, self.config)
+            finally:
+                db.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+@click.command('db-maintain')
+@click.option('--task', 'tasks', multiple=True, type=click.Choice(list(TASKS)),
+              help='Only run this task. May be given more than once.')
+@click.option('--budget', type=float, help='Seconds each task may run.')
+@with_appcontext
+def db_maintain_command(tasks, budget):
+    """Refresh statistics, vacuum free pages and checkpoint the WAL."""
+    logger.info("Ran CLI: db-maintain")
+    for name, outcome in run_maintenance(get_db(), current_app.config, tasks, budget):
+        click.echo('%s: %s' % (name, outcome))
+
+
+def init_app(app):
+    app.config.setdefault('DB_MAINTENANCE_INTERVAL', 0)
+    app.config.setdefault('DB_MAINTENANCE_BUDGET', 0.25)
+    app.config.setdefault('DB_ANALYSIS_LIMIT', 400)
+    app.config.setdefault('DB_VACUUM_PAGES', 256)
+    app.config.setdefault('DB_WAL_CHECKPOINT_BYTES', 4 * 1024 * 1024)
+    app.cli.add_command(db_maintain_command)
+
+    if app.config['DB_MAINTENANCE_INTERVAL'] > 0:
+        logger.info("Starting DB maintenance thread every %ss",
+                    app.config['DB_MAINTENANCE_INTERVAL'])
+        app.extensions['db_maintenance'] = MaintenanceThread(app)
+        app.extensions['db_maintenance'].start()
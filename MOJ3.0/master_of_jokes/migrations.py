@@ -0,0 +1,195 @@
+import sqlite3
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+import logging
+logger = logging.getLogger(__name__)
+
+EPOCH_DEFAULT = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+
+def epoch(column):
+    """SQL converting a CURRENT_TIMESTAMP text column to epoch seconds,
+    leaving values that already are numbers alone."""
+    return ("CASE WHEN typeof({0}) = 'text'"
+            " THEN CAST(strftime('%s', {0}) AS INTEGER) ELSE {0} END").format(column)
+
+
+def rebuild(table, definition, select):
+    """Step that recreates table as CREATE TABLE table definition and
+    copies the old rows over with SELECT select FROM table.
+
+    The copy holds the write lock until the migration commits. The
+    AUTOINCREMENT counter carries over; indexes go with the old table.
+    """
+    def step(db):
+        sequence = db.execute(
+            'SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)
+        ).fetchone()
+        db.execute('CREATE TABLE %s_rebuild %s' % (table, definition))
+        db.execute('INSERT INTO %s_rebuild SELECT %s FROM %s' % (table, select, table))
+        db.execute('DROP TABLE %s' % table)
+        db.execute('ALTER TABLE %s_rebuild RENAME TO %s' % (table, table))
+        if sequence is not None:
+            db.execute(
+                'UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?',
+                (sequence[0], table)
+            )
+        logger.info("Rebuilt table %s", table)
+
+    return step
+
+
+# Ordered (version, description, steps); a step is SQL or a callable
+# taking the connection. Each migration runs in one transaction.
+MIGRATIONS = [
+    (1, 'add secondary indexes', [
+        'CREATE INDEX IF NOT EXISTS user_role ON user (role)',
+        'CREATE INDEX IF NOT EXISTS joke_author_created ON joke (author_id, created)',
+        'CREATE INDEX IF NOT EXISTS joke_created ON joke (created)',
+        'CREATE INDEX IF NOT EXISTS joke_rating_joke ON joke_rating (joke_id, rating)',
+        'CREATE INDEX IF NOT EXISTS joke_view_joke ON joke_view (joke_id)',
+    ]),
+    (2, 'store timestamps as epoch seconds, cluster link tables on their key', [
+        rebuild('joke', '''(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            author_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            body TEXT NOT NULL,
+            created TIMESTAMP NOT NULL DEFAULT %s,
+            FOREIGN KEY (author_id) REFERENCES user (id),
+            UNIQUE (author_id, title)
+        )''' % EPOCH_DEFAULT, 'id, author_id, title, body, ' + epoch('created')),
+        rebuild('joke_view', '''(
+            joke_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            viewed_at TIMESTAMP NOT NULL DEFAULT %s,
+            PRIMARY KEY (joke_id, user_id),
+            FOREIGN KEY (user_id) REFERENCES user (id),
+            FOREIGN KEY (joke_id) REFERENCES joke (id)
+        ) WITHOUT ROWID''' % EPOCH_DEFAULT, 'joke_id, user_id, ' + epoch('viewed_at')),
+        rebuild('joke_rating', '''(
+            joke_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL CHECK (rating BETWEEN 1 AND 5),
+            rated_at TIMESTAMP NOT NULL DEFAULT %s,
+            PRIMARY KEY (joke_id, user_id),
+            FOREIGN KEY (user_id) REFERENCES user (id),
+            FOREIGN KEY (joke_id) REFERENCES joke (id)
+        ) WITHOUT ROWID''' % EPOCH_DEFAULT, 'joke_id, user_id, rating, ' + epoch('rated_at')),
+        'CREATE INDEX IF NOT EXISTS joke_author_created ON joke (author_id, created)',
+        'CREATE INDEX IF NOT EXISTS joke_created ON joke (created)',
+    ]),
+    (3, 'add recommendation tables', [
+        '''CREATE TABLE IF NOT EXISTS joke_neighbor (
+            joke_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            similarity REAL NOT NULL,
+            PRIMARY KEY (joke_id, rank),
+            FOREIGN KEY (joke_id) REFERENCES joke (id),
+            FOREIGN KEY (neighbor_id) REFERENCES joke (id)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS joke_recommendation (
+            user_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            joke_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (user_id, rank),
+            FOREIGN KEY (user_id) REFERENCES user (id),
+            FOREIGN KEY (joke_id) REFERENCES joke (id)
+        ) WITHOUT ROWID''',
+    ]),
+    (4, 'add near-duplicate index (fill it with flask find-duplicates)', [
+        '''CREATE TABLE IF NOT EXISTS joke_lsh (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            joke_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, joke_id)
+        ) WITHOUT ROWID''',
+    ]),
+    (5, 'add case-insensitive nickname index', [
+        'CREATE INDEX IF NOT EXISTS user_nickname_nocase ON user (nickname COLLATE NOCASE)',
+    ]),
+    (6, 'add tags', [
+        '''CREATE TABLE IF NOT EXISTS tag (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            post_count INTEGER NOT NULL DEFAULT 0
+        )''',
+        '''CREATE TABLE IF NOT EXISTS joke_tag (
+            tag_id INTEGER NOT NULL,
+            joke_id INTEGER NOT NULL,
+            PRIMARY KEY (tag_id, joke_id),
+            FOREIGN KEY (tag_id) REFERENCES tag (id),
+            FOREIGN KEY (joke_id) REFERENCES joke (id)
+        ) WITHOUT ROWID''',
+        '''CREATE TRIGGER IF NOT EXISTS joke_tag_added AFTER INSERT ON joke_tag BEGIN
+            UPDATE tag SET post_count = post_count + 1 WHERE id = new.tag_id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS joke_tag_removed AFTER DELETE ON joke_tag BEGIN
+            UPDATE tag SET post_count = post_count - 1 WHERE id = old.tag_id;
+        END''',
+        'CREATE INDEX IF NOT EXISTS joke_tag_joke ON joke_tag (joke_id)',
+        'CREATE INDEX IF NOT EXISTS tag_post_count ON tag (post_count DESC, name)',
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(db):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+
+def upgrade(db):
+    """Apply every migration newer than the database's user_version and
+    return the versions applied. db must be opened with
+    isolation_level=None."""
+    applied = []
+
+    for version, description, steps in MIGRATIONS:
+        if version <= get_version(db):
+            continue
+
+        logger.info("Applying migration %d: %s", version, description)
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            for step in steps:
+                if callable(step):
+                    step(db)
+                else:
+                    db.execute(step)
+            db.execute('PRAGMA user_version = %d' % version)
+        except BaseException:
+            logger.exception("Migration %d failed, rolled back", version)
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        applied.append(version)
+
+    return applied
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Apply pending schema migrations."""
+    logger.info("Ran CLI: db-upgrade")
+    db = sqlite3.connect(current_app.config['DATABASE'], isolation_level=None)
+    try:
+        version = get_version(db)
+        applied = upgrade(db)
+        if not applied:
+            click.echo('Database is up to date at version %d.' % version)
+        descriptions = {number: text for number, text, steps in MIGRATIONS}
+        for number in applied:
+            click.echo('Applied %d: %s' % (number, descriptions[number]))
+    finally:
+        db.close()
+
+
+def init_app(app):
+    app.cli.add_command(db_upgrade_command)
@@ -0,0 +1,186 @@
+import sqlite3
+from collections import namedtuple
+from contextlib import contextmanager
+
+from flask import current_app, has_request_context, request
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Most statements, rows and seconds of SQL a view may use, None for no
+# limit (for seconds, the QUERY_TIME_BUDGET default)
+Budget = namedtuple('Budget', ('queries', 'rows', 'seconds'), defaults=(None,))
+
+_ENVIRON_KEY = 'master_of_jokes.query_stats'
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more queries or read more rows than its budget."""
+
+
+def query_budget(queries=None, rows=None, seconds=None):
+    """Declare how many statements and rows a view may use per request,
+    counting load_logged_in_user. seconds is enforced by timeouts.py even
+    when queries aren't counted."""
+    def decorator(view):
+        view.query_budget = Budget(queries, rows, seconds)
+        return view
+    return decorator
+
+
+class QueryStats:
+    """Statements run and rows read by one request, streamed body included."""
+
+    def __init__(self, endpoint, budget, strict):
+        self.endpoint = endpoint
+        self.budget = budget
+        self.strict = strict
+        self.queries = 0
+        self.rows = 0
+        self.violation = None
+
+    def query(self):
+        self.queries += 1
+        limit = self.budget and self.budget.queries
+        if limit is not None and self.queries > limit:
+            self._exceeded(f'ran {self.queries} queries, budget is {limit}')
+
+    def read(self, rows):
+        self.rows += rows
+        limit = self.budget and self.budget.rows
+        if limit is not None and self.rows > limit:
+            self._exceeded(f'read {self.rows} rows, budget is {limit}')
+
+    def _exceeded(self, what):
+        first = self.violation is None
+        self.violation = f'{self.endpoint} {what}'
+        if self.strict:
+            raise QueryBudgetExceeded(self.violation)
+        if first:
+            logger.warning("Query budget exceeded: %s", self.violation)
+
+
+class CountingCursor(sqlite3.Cursor):
+    # Counts toward the request current when the statement runs, which
+    # isn't always the one that opened the connection
+    stats = None
+
+    def _count(self):
+        self.stats = current_stats()
+        if self.stats is not None:
+            self.stats.query()
+
+    def _read(self, rows):
+        if self.stats is not None:
+            self.stats.read(rows)
+
+    def execute(self, sql, parameters=()):
+        self._count()
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._count()
+        return super().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._count()
+        return super().executescript(sql_script)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._read(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._read(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._read(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self._read(1)
+        return row
+
+
+class CountingConnection(sqlite3.Connection):
+    # Connection.execute() makes its cursor in C, so route it through ours
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def current_stats():
+    """The request's QueryStats, or None outside a request or with
+    QUERY_STATS off. Kept in the environ so a streamed body, which runs
+    in a new app context, adds to the same stats."""
+    if not has_request_context() or not current_app.config['QUERY_STATS']:
+        return None
+
+    stats = request.environ.get(_ENVIRON_KEY)
+    if stats is None:
+        view = current_app.view_functions.get(request.endpoint)
+        stats = QueryStats(
+            request.endpoint,
+            getattr(view, 'query_budget', None),
+            current_app.config['QUERY_BUDGET_STRICT'],
+        )
+        request.environ[_ENVIRON_KEY] = stats
+        for captured in current_app.extensions['query_stats']:
+            captured.append(stats)
+    return stats
+
+
+def connect(database, **kwargs):
+    """sqlite3.connect() that counts toward the request's stats."""
+    if current_stats() is None:
+        return sqlite3.connect(database, **kwargs)
+    return sqlite3.connect(database, factory=CountingConnection, **kwargs)
+
+
+@contextmanager
+def capture(app):
+    """Collect the QueryStats of the requests made inside the block."""
+    captured = []
+    app.extensions['query_stats'].append(captured)
+    try:
+        yield captured
+    finally:
+        app.extensions['query_stats'].remove(captured)
+
+
+def check_stats(response):
+    stats = current_stats()
+    if stats is None:
+        return response
+
+    # Fail even when the view caught the exception
+    if stats.violation is not None and stats.strict:
+        raise QueryBudgetExceeded(stats.violation)
+
+    if current_app.config['QUERY_STATS_HEADER']:
+        # Queries of a streamed body run later and aren't included
+        response.headers['X-Query-Count'] = str(stats.queries)
+        response.headers['X-Query-Rows'] = str(stats.rows)
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('QUERY_STATS', app.debug or app.testing)
+    app.config.setdefault('QUERY_STATS_HEADER', app.debug)
+    app.config.setdefault('QUERY_BUDGET_STRICT', app.testing)
+    app.extensions['query_stats'] = []
+    app.after_request(check_stats)
@@ -0,0 +1,199 @@
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from master_of_jokes.db import get_db
+
+try:
+    import numpy as np
+except ImportError:  # optional, only the recommend job needs it
+    np = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _expand(starts, lengths):
+    """Pair each index i of starts with every position in
+    starts[i]:starts[i] + lengths[i], as (owner, position) arrays."""
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(owner.size) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owner, starts[owner] + offsets
+
+
+def _sum_by_key(keys, values):
+    """The distinct keys and the sum of their values."""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=values, minlength=keys.size)
+
+
+def _top(groups, others, scores, count):
+    """The count best positive scores of each group as (group, rank,
+    other, score) arrays, ordered by group and rank."""
+    keep = scores > 0
+    groups, others, scores = groups[keep], others[keep], scores[keep]
+    order = np.lexsort((others, -scores, groups))
+    groups, others, scores = groups[order], others[order], scores[order]
+    firsts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    lengths = np.diff(np.r_[firsts, groups.size])
+    ranks = np.arange(groups.size) - np.repeat(firsts, lengths)
+    keep = ranks < count
+    return groups[keep], ranks[keep], others[keep], scores[keep]
+
+
+def center(users, ratings):
+    """Ratings minus their user's mean, so what counts is whether a joke
+    was liked more or less than usual."""
+    counts = np.bincount(users)
+    means = np.bincount(users, weights=ratings) / np.maximum(counts, 1)
+    return ratings - means[users]
+
+
+def similar_items(users, items, values, n_items, count, max_pairs=4_000_000):
+    """The count most similar items of every item, as (item, rank,
+    neighbor, similarity) arrays, by cosine of their centered rating
+    columns. users, items and values are the sparse matrix as triples
+    numbered from 0. Only pairs some user rated are generated, a batch of
+    about max_pairs at a time, never the dense item x item matrix."""
+    norms = np.sqrt(np.bincount(items, weights=values**2, minlength=n_items))
+
+    order = np.argsort(users, kind='stable')
+    users, items, values = users[order], items[order], values[order]
+    firsts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    lengths = np.diff(np.r_[firsts, users.size])
+
+    # a user with n ratings makes n * n pairs
+    batch = (np.cumsum(lengths**2) - 1) // max_pairs
+    splits = np.flatnonzero(np.diff(batch)) + 1
+    keys, dots = [], []
+    for batch_firsts, batch_lengths in zip(
+        np.split(firsts, splits), np.split(lengths, splits)
+    ):
+        # each of the batch's ratings with every rating of the same user
+        left = _expand(batch_firsts, batch_lengths)[1]
+        owner, right = _expand(
+            np.repeat(batch_firsts, batch_lengths), np.repeat(batch_lengths, batch_lengths)
+        )
+        left = left[owner]
+        pair = left != right
+        left, right = left[pair], right[pair]
+        batch_keys, batch_dots = _sum_by_key(
+            items[left] * n_items + items[right], values[left] * values[right]
+        )
+        keys.append(batch_keys)
+        dots.append(batch_dots)
+
+    keys, dots = _sum_by_key(
+        np.concatenate(keys or [np.zeros(0, np.int64)]),
+        np.concatenate(dots or [np.zeros(0)]),
+    )
+    item, neighbor = np.divmod(keys, n_items)
+    scale = norms[item] * norms[neighbor]
+    similarity = np.divide(dots, scale, out=np.zeros_like(dots), where=scale > 0)
+    return _top(item, neighbor, similarity, count)
+
+
+def recommend_items(users, items, values, neighbors, n_items, count, exclude=()):
+    """The count best items for every user as (user, rank, item, score)
+    arrays. An item scores its similarity to each rated item times that
+    centered rating, summed, using only the rated items' precomputed
+    neighbors. Rated items and the user * n_items + item keys in exclude
+    are skipped."""
+    item, _, neighbor, similarity = neighbors
+    starts = np.searchsorted(item, np.arange(n_items))
+    lengths = np.bincount(item, minlength=n_items)
+
+    owner, position = _expand(starts[items], lengths[items])
+    keys, scores = _sum_by_key(
+        users[owner] * n_items + neighbor[position],
+        similarity[position] * values[owner],
+    )
+    seen = np.concatenate([users * n_items + items, np.asarray(exclude, np.int64)])
+    keep = ~np.isin(keys, seen)
+    user, candidate = np.divmod(keys[keep], n_items)
+    return _top(user, candidate, scores[keep], count)
+
+
+def rebuild(db, neighbors, count):
+    """Recompute similar jokes and every user's take queue from
+    joke_rating, replacing joke_neighbor and joke_recommendation. Jokes
+    a user wrote or already took are left out of their queue. Returns
+    how many jokes and users got rows."""
+    ratings = np.array(
+        db.execute('SELECT user_id, joke_id, rating FROM joke_rating').fetchall(),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    user_ids, users = np.unique(ratings[:, 0], return_inverse=True)
+    joke_ids, items = np.unique(ratings[:, 1], return_inverse=True)
+    values = center(users, ratings[:, 2].astype(np.float64))
+
+    taken = np.array(
+        db.execute(
+            'SELECT author_id, id FROM joke'
+            ' UNION ALL SELECT user_id, joke_id FROM joke_view'
+        ).fetchall(),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    taken = taken[np.isin(taken[:, 0], user_ids) & np.isin(taken[:, 1], joke_ids)]
+    exclude = (
+        np.searchsorted(user_ids, taken[:, 0]) * joke_ids.size
+        + np.searchsorted(joke_ids, taken[:, 1])
+    )
+
+    similar = similar_items(users, items, values, joke_ids.size, neighbors)
+    recommended = recommend_items(
+        users, items, values, similar, joke_ids.size, count, exclude
+    )
+
+    item, rank, neighbor, similarity = similar
+    user, user_rank, joke, score = recommended
+    with db:
+        db.execute('DELETE FROM joke_neighbor')
+        db.executemany(
+            'INSERT INTO joke_neighbor (joke_id, rank, neighbor_id, similarity)'
+            ' VALUES (?, ?, ?, ?)',
+            zip(joke_ids[item].tolist(), rank.tolist(),
+                joke_ids[neighbor].tolist(), similarity.tolist()),
+        )
+        db.execute('DELETE FROM joke_recommendation')
+        db.executemany(
+            'INSERT INTO joke_recommendation (user_id, rank, joke_id, score)'
+            ' VALUES (?, ?, ?, ?)',
+            zip(user_ids[user].tolist(), user_rank.tolist(),
+                joke_ids[joke].tolist(), score.tolist()),
+        )
+
+    return np.unique(item).size, np.unique(user).size
+
+
+@click.command('recommend')
+@click.option('--neighbors', type=int, help='Similar jokes kept per joke.')
+@click.option('--count', type=int, help='Jokes kept in each take queue.')
+@with_appcontext
+def recommend_command(neighbors, count):
+    """Recompute similar jokes and the recommended take queues."""
+    logger.info("Ran CLI: recommend")
+    if np is None:
+        raise click.ClickException('The recommend job needs numpy: pip install numpy')
+
+    config = current_app.config
+    start = time.monotonic()
+    jokes, users = rebuild(
+        get_db(),
+        neighbors or config['RECOMMEND_NEIGHBORS'],
+        count or config['RECOMMEND_COUNT'],
+    )
+    elapsed = time.monotonic() - start
+    logger.info("Recommended jokes for %d users in %.2fs", users, elapsed)
+    click.echo('Found similar jokes for %d jokes and take queues for %d users'
+               ' in %.2fs.' % (jokes, users, elapsed))
+
+
+def init_app(app):
+    """Register the recommend command, meant to run offline from cron;
+    /take only reads what it wrote."""
+    app.config.setdefault('RECOMMEND_NEIGHBORS', 20)
+    app.config.setdefault('RECOMMEND_COUNT', 10)
+    app.cli.add_command(recommend_command)
@@ -1,16 +1,38 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, jsonify
 from master_of_jokes.db import get_db
+from master_of_jokes.querystats import query_budget
 
 bp = Blueprint('report_api', __name__, url_prefix='/api/status')
 
 @bp.route('/users')
+@query_budget(queries=2, rows=2)
 def user_count():
     db = get_db()
     count = db.execute('SELECT COUNT(*) FROM user').fetchone()[0]
     return jsonify({'count': count})
 
 @bp.route('/jokes')
+@query_budget(queries=2, rows=2)
 def joke_count():
     db = get_db()
     count = db.execute('SELECT COUNT(*) FROM joke').fetchone()[0]
     return jsonify({'count': count})
+
+@bp.route('/timeouts')
+@query_budget(queries=1, rows=1)
+def query_timeouts():
+    """Queries cancelled for running past their time budget, and requests
+    turned away while their page cooled down, per endpoint."""
+    return jsonify(current_app.extensions['query_timeouts'].snapshot())
+
+@bp.route('/admission')
+@query_budget(queries=1, rows=1)
+def admission():
+    """Requests in flight, waiting, admitted and shed by priority."""
+    return jsonify(current_app.extensions['admission'].snapshot())
+
+@bp.route('/logins')
+@query_budget(queries=1, rows=1)
+def logins():
+    """Failed logins counted, attempts throttled and keys tracked."""
+    return jsonify(current_app.extensions['login_throttle'].snapshot())
@@ -1,8 +1,19 @@
+-- Free pages are reclaimed by `flask db-maintain`; the VACUUM below
+-- applies these settings to databases created before they existed.
+PRAGMA auto_vacuum = INCREMENTAL;
+PRAGMA journal_mode = WAL;
+
 DROP TABLE IF EXISTS user;
 DROP TABLE IF EXISTS joke;
 DROP TABLE IF EXISTS joke_view;
 DROP TABLE IF EXISTS joke_rating;
+DROP TABLE IF EXISTS joke_neighbor;
+DROP TABLE IF EXISTS joke_recommendation;
+DROP TABLE IF EXISTS joke_lsh;
+DROP TABLE IF EXISTS joke_tag;
+DROP TABLE IF EXISTS tag;
 DROP TABLE IF EXISTS user;
+VACUUM;
 
 CREATE TABLE user (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -15,34 +26,103 @@ CREATE TABLE user (
   joke_balance INTEGER NOT NULL DEFAULT 0
 );
 
+-- Timestamps are epoch seconds (UTC), decoded by the converter in
+-- db.py. The link tables are clustered on their natural key instead of
+-- carrying a rowid and a separate UNIQUE index.
 CREATE TABLE joke (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   author_id INTEGER NOT NULL,
   title TEXT NOT NULL,
   body TEXT NOT NULL,
-  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  created TIMESTAMP NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
   FOREIGN KEY (author_id) REFERENCES user (id),
   UNIQUE (author_id, title)
 );
 
 CREATE TABLE joke_view (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  user_id INTEGER NOT NULL,
   joke_id INTEGER NOT NULL,
-  viewed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  user_id INTEGER NOT NULL,
+  viewed_at TIMESTAMP NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+  PRIMARY KEY (joke_id, user_id),
   FOREIGN KEY (user_id) REFERENCES user (id),
-  FOREIGN KEY (joke_id) REFERENCES joke (id),
-  UNIQUE (user_id, joke_id)
-);
+  FOREIGN KEY (joke_id) REFERENCES joke (id)
+) WITHOUT ROWID;
 
 CREATE TABLE joke_rating (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  user_id INTEGER NOT NULL,
   joke_id INTEGER NOT NULL,
+  user_id INTEGER NOT NULL,
   rating INTEGER NOT NULL CHECK (rating BETWEEN 1 AND 5),
-  rated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  rated_at TIMESTAMP NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+  PRIMARY KEY (joke_id, user_id),
   FOREIGN KEY (user_id) REFERENCES user (id),
+  FOREIGN KEY (joke_id) REFERENCES joke (id)
+) WITHOUT ROWID;
+
+-- Written by `flask recommend`: each joke's most similar jokes and each
+-- user's take queue, read back in rank order.
+CREATE TABLE joke_neighbor (
+  joke_id INTEGER NOT NULL,
+  rank INTEGER NOT NULL,
+  neighbor_id INTEGER NOT NULL,
+  similarity REAL NOT NULL,
+  PRIMARY KEY (joke_id, rank),
   FOREIGN KEY (joke_id) REFERENCES joke (id),
-  UNIQUE (user_id, joke_id)
+  FOREIGN KEY (neighbor_id) REFERENCES joke (id)
+) WITHOUT ROWID;
+
+CREATE TABLE joke_recommendation (
+  user_id INTEGER NOT NULL,
+  rank INTEGER NOT NULL,
+  joke_id INTEGER NOT NULL,
+  score REAL NOT NULL,
+  PRIMARY KEY (user_id, rank),
+  FOREIGN KEY (user_id) REFERENCES user (id),
+  FOREIGN KEY (joke_id) REFERENCES joke (id)
+) WITHOUT ROWID;
+
+-- Secondary indexes, matched to the lookups in jokes.py and admin.py.
+-- joke_view and joke_rating are looked up by their primary key only.
+CREATE INDEX user_role ON user (role);
+-- Nickname LIKE 'prefix%' for suggestions and the dashboard search
+CREATE INDEX user_nickname_nocase ON user (nickname COLLATE NOCASE);
+CREATE INDEX joke_author_created ON joke (author_id, created);
+CREATE INDEX joke_created ON joke (created);
+
+-- MinHash LSH buckets of each joke's body, one per band (duplicates.py)
+CREATE TABLE joke_lsh (
+  band INTEGER NOT NULL,
+  bucket INTEGER NOT NULL,
+  joke_id INTEGER NOT NULL,
+  PRIMARY KEY (band, bucket, joke_id)
+) WITHOUT ROWID;
+
+-- Tags with the number of jokes carrying each, kept by the triggers
+-- below, and their inverted index: a tag's postings are read in joke_id
+-- order off the primary key (tags.py).
+CREATE TABLE tag (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT UNIQUE NOT NULL,
+  post_count INTEGER NOT NULL DEFAULT 0
 );
 
+CREATE TABLE joke_tag (
+  tag_id INTEGER NOT NULL,
+  joke_id INTEGER NOT NULL,
+  PRIMARY KEY (tag_id, joke_id),
+  FOREIGN KEY (tag_id) REFERENCES tag (id),
+  FOREIGN KEY (joke_id) REFERENCES joke (id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER joke_tag_added AFTER INSERT ON joke_tag BEGIN
+  UPDATE tag SET post_count = post_count + 1 WHERE id = new.tag_id;
+END;
+
+CREATE TRIGGER joke_tag_removed AFTER DELETE ON joke_tag BEGIN
+  UPDATE tag SET post_count = post_count - 1 WHERE id = old.tag_id;
+END;
+
+CREATE INDEX joke_tag_joke ON joke_tag (joke_id);
+CREATE INDEX tag_post_count ON tag (post_count DESC, name);
+
+-- Must match the newest version in migrations.py.
+PRAGMA user_version = 6;
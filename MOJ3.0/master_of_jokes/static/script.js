@@ -18,4 +18,56 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     }
-});
\ No newline at end of file
+
+    // Nickname suggestions as the moderator types
+    const userSearch = document.querySelector('input[data-suggest]');
+    if (userSearch) {
+        const suggestions = document.getElementById(userSearch.getAttribute('list'));
+        let latest = '';
+        userSearch.addEventListener('input', function() {
+            const query = this.value.trim();
+            latest = query;
+            if (!query) {
+                suggestions.replaceChildren();
+                return;
+            }
+            fetch(this.dataset.suggest + '?q=' + encodeURIComponent(query))
+                .then(function(response) { return response.json(); })
+                .then(function(data) {
+                    // Keep only the answer to the latest keystroke
+                    if (data.q !== latest) return;
+                    suggestions.replaceChildren(...data.nicknames.map(function(nickname) {
+                        const option = document.createElement('option');
+                        option.value = nickname;
+                        return option;
+                    }));
+                });
+        });
+    }
+
+    // Whether the email and nickname are free, while they're typed
+    document.querySelectorAll('input[data-available]').forEach(function(input) {
+        const status = document.createElement('small');
+        status.className = 'availability';
+        input.parentNode.appendChild(status);
+        let timer = null;
+
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            status.textContent = '';
+            const value = input.value;
+            if (!value || !input.checkValidity()) return;
+            timer = setTimeout(function() {
+                fetch(input.dataset.available + '?' + input.name + '=' + encodeURIComponent(value))
+                    .then(function(response) { return response.json(); })
+                    .then(function(data) {
+                        // Skip answers for what's no longer typed
+                        if (data.value !== input.value) return;
+                        status.textContent = data.available
+                            ? input.name + ' is free' : input.name + ' is taken';
+                        status.classList.toggle('taken', !data.available);
+                    });
+            }, 150);
+        });
+    });
+});
@@ -0,0 +1,113 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import current_app
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Nicknames starting with ? in case-insensitive order, off the
+# user_nickname_nocase index; \ escapes % and _
+LIKE = '''SELECT nickname FROM user
+          WHERE nickname LIKE ? ESCAPE '\\'
+          ORDER BY nickname COLLATE NOCASE
+          LIMIT ?'''
+
+# NOCASE only folds ASCII letters, so the in-memory order does too
+_NOCASE = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def nocase(text):
+    return text.translate(_NOCASE)
+
+
+def like_prefix(prefix):
+    """The LIKE pattern for strings starting with prefix."""
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+class NicknameIndex:
+    """Nicknames sorted case-insensitively, searched by bisection. Filled
+    on first use, then kept up by add() on register and by reading the
+    users registered since, by id, every refresh seconds."""
+
+    def __init__(self, refresh):
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.entries = []
+        self.last_id = 0
+        self.checked = None
+
+    def _insert(self, nickname):
+        """Insert nickname unless it's there already, as when catch_up
+        reads a user add was given. Call with the lock held."""
+        entry = (nocase(nickname), nickname)
+        i = bisect_left(self.entries, entry)
+        if i == len(self.entries) or self.entries[i] != entry:
+            self.entries.insert(i, entry)
+
+    def add(self, nickname):
+        with self.lock:
+            self._insert(nickname)
+
+    def catch_up(self, db):
+        """Read newly registered users if refresh seconds have passed;
+        False if the first fill is still going on in another request."""
+        now = time.monotonic()
+        if self.checked is not None and now - self.checked < self.refresh:
+            return True
+        if not self.lock.acquire(blocking=False):
+            return self.checked is not None
+        try:
+            rows = db.execute(
+                'SELECT id, nickname FROM user WHERE id > ? ORDER BY id',
+                (self.last_id,),
+            ).fetchall()
+            for id, nickname in rows:
+                self._insert(nickname)
+            if rows:
+                self.last_id = rows[-1][0]
+            if self.checked is None:
+                logger.info("Loaded %d nicknames for suggestions", len(self.entries))
+            self.checked = now
+        finally:
+            self.lock.release()
+        return True
+
+    def search(self, prefix, count):
+        key = nocase(prefix)
+        entries = self.entries
+        found = []
+        i = bisect_left(entries, (key,))
+        while i < len(entries) and len(found) < count:
+            folded, nickname = entries[i]
+            if not folded.startswith(key):
+                break
+            found.append(nickname)
+            i += 1
+        return found
+
+
+def suggest(db, prefix, count):
+    """Up to count nicknames starting with prefix, from memory, or from
+    the database while the index fills or if SUGGEST_IN_MEMORY is off."""
+    index = current_app.extensions.get('nickname_index')
+    if index is not None and index.catch_up(db):
+        return index.search(prefix, count)
+    return [row[0] for row in db.execute(LIKE, (like_prefix(prefix), count))]
+
+
+def add(nickname):
+    index = current_app.extensions.get('nickname_index')
+    if index is not None:
+        index.add(nickname)
+
+
+def init_app(app):
+    app.config.setdefault('SUGGEST_IN_MEMORY', True)
+    app.config.setdefault('SUGGEST_REFRESH', 5.0)
+    app.config.setdefault('SUGGEST_COUNT', 8)
+    if app.config['SUGGEST_IN_MEMORY']:
+        app.extensions['nickname_index'] = NicknameIndex(app.config['SUGGEST_REFRESH'])
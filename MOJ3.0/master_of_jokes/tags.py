@@ -0,0 +1,142 @@
+import json
+import re
+from bisect import bisect_left
+
+from master_of_jokes.db import get_db
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Most tags on one joke, and in one /tag/a+b filter
+MAX_TAGS = 5
+MAX_FILTER = 3
+
+# Lowercase words joined by single dashes, like knock-knock
+NAME = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*')
+MAX_LENGTH = 30
+
+# The most used tags for the list's facets, off tag_post_count
+TOP = '''SELECT name, post_count FROM tag
+         WHERE post_count > 0
+         ORDER BY post_count DESC, name
+         LIMIT ?'''
+
+# The tags among a set of jokes and how many of them carry each
+FACETS = '''SELECT t.name, COUNT(*) AS post_count
+            FROM json_each(?) AS j
+            JOIN joke_tag jt ON jt.joke_id = j.value
+            JOIN tag t ON t.id = jt.tag_id
+            GROUP BY t.id
+            ORDER BY post_count DESC, t.name
+            LIMIT ?'''
+
+# Part of a tag's posting list, in id order off joke_tag's primary key
+POSTINGS = '''SELECT joke_id FROM joke_tag
+              WHERE tag_id = ? AND joke_id BETWEEN ? AND ?
+              ORDER BY joke_id'''
+
+
+def parse(text):
+    """Tag names in text, split on commas or spaces, lowercased, without
+    a leading # or repeats."""
+    names = []
+    for word in re.split(r'[\s,]+', text.lower()):
+        word = word.lstrip('#')
+        if word and word not in names:
+            names.append(word)
+    return names
+
+
+def check(names):
+    """Why names can't be a joke's tags, or None."""
+    if len(names) > MAX_TAGS:
+        return 'A joke can have at most %d tags.' % MAX_TAGS
+    for name in names:
+        if len(name) > MAX_LENGTH or not NAME.fullmatch(name):
+            return ("Tag '%s' must be up to %d letters, numbers and single dashes."
+                    % (name, MAX_LENGTH))
+    return None
+
+
+def add(db, joke_id, names):
+    """Tag a new joke; triggers on joke_tag keep post_count."""
+    if not names:
+        return
+    names = json.dumps(names)
+    db.execute('INSERT OR IGNORE INTO tag (name) SELECT value FROM json_each(?)', (names,))
+    db.execute(
+        'INSERT OR IGNORE INTO joke_tag (tag_id, joke_id)'
+        ' SELECT id, ? FROM tag WHERE name IN (SELECT value FROM json_each(?))',
+        (joke_id, names)
+    )
+
+
+def replace(db, joke_id, names):
+    """Make names the tags of an existing joke."""
+    db.execute(
+        'DELETE FROM joke_tag WHERE joke_id = ?'
+        ' AND tag_id NOT IN (SELECT id FROM tag'
+        '  WHERE name IN (SELECT value FROM json_each(?)))',
+        (joke_id, json.dumps(names))
+    )
+    add(db, joke_id, names)
+
+
+def intersect(lists):
+    """Ids in every one of the ascending lists: the shortest is walked
+    and each id bisected for in the others, from where the last one was."""
+    if not lists:
+        return []
+    lists = sorted(lists, key=len)
+    found = lists[0]
+    for other in lists[1:]:
+        kept = []
+        i = 0
+        for id in found:
+            i = bisect_left(other, id, i)
+            if i == len(other):
+                break
+            if other[i] == id:
+                kept.append(id)
+        found = kept
+        if not found:
+            break
+    return found
+
+
+def matching(db, names):
+    """Ascending ids of the jokes with all of names, or None if a tag
+    doesn't exist. Rarest tag first; the others are read only between
+    the lowest and highest id left, and not at all once none are."""
+    tags = db.execute(
+        'SELECT id FROM tag WHERE name IN (SELECT value FROM json_each(?))'
+        ' ORDER BY post_count',
+        (json.dumps(names),)
+    ).fetchall()
+    if len(tags) < len(names):
+        return None
+
+    found = None
+    for tag in tags:
+        low, high = (found[0], found[-1]) if found else (0, 2**63 - 1)
+        postings = [row[0] for row in db.execute(POSTINGS, (tag['id'], low, high))]
+        found = postings if found is None else intersect([found, postings])
+        if not found:
+            return []
+    return found
+
+
+def top(count):
+    """The most used tags; the query runs on first iteration."""
+    yield from get_db().execute(TOP, (count,))
+
+
+def facets(ids, count, exclude=()):
+    """The tags most common among the jokes ids, minus exclude."""
+    for facet in get_db().execute(FACETS, (json.dumps(ids), count + len(exclude))):
+        if facet['name'] not in exclude:
+            yield facet
+
+
+def init_app(app):
+    app.config.setdefault('TAG_FACETS', 12)
@@ -0,0 +1,46 @@
+import pytest
+
+from master_of_jokes import create_app
+from master_of_jokes.admission import CRITICAL, LOW, NORMAL, classifier
+
+
+@pytest.mark.parametrize(('method', 'path', 'cookie', 'priority'), (
+    ('GET', '/', '', LOW),
+    ('GET', '/', 'session=abc', NORMAL),
+    ('GET', '/list', 'session=abc', NORMAL),
+    ('GET', '/api/status/jokes', '', LOW),
+    ('GET', '/auth/login', '', CRITICAL),
+    ('POST', '/1/view', 'session=abc', CRITICAL),
+    ('GET', '/assets/style.css', '', None),
+    ('GET', '/api/status/admission', '', None),
+))
+def test_classify(method, path, cookie, priority):
+    environ = {'REQUEST_METHOD': method, 'PATH_INFO': path, 'HTTP_COOKIE': cookie}
+    assert classifier('session')(environ) == priority
+
+
+def test_status_polls_shed_before_writes(app):
+    assert app.config['ADMISSION_LIMIT'] == 0
+
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': app.config['DATABASE'],
+        'ADMISSION_LIMIT': 2,
+        'ADMISSION_CRITICAL_WAIT': 0.01,
+    })
+    admission = app.extensions['admission']
+    client = app.test_client()
+    admission.acquire(CRITICAL)
+
+    response = client.get('/api/status/jokes')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+
+    response = client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+    assert response.status_code == 302
+    response.close()
+
+    metrics = client.get('/api/status/admission').json
+    assert metrics['shed'] == {'critical': 0, 'normal': 0, 'low': 1}
+    assert metrics['admitted']['critical'] == 2
+    assert metrics['inflight'] == 1
@@ -0,0 +1,112 @@
+import pytest
+
+from master_of_jokes.db import get_db
+
+
+@pytest.fixture
+def taken(app):
+    """test took other's joke 2."""
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO joke_view (joke_id, user_id) VALUES (2, 1)')
+        db.execute(
+            "INSERT INTO joke (author_id, title, body, created) VALUES (2, 'third', 'x', 1514937600)"
+        )
+        db.commit()
+    return app
+
+
+def test_login_required(client):
+    response = client.get('/api/v1/jokes')
+    assert response.status_code == 401
+    assert response.json == {'error': 'Log in first.'}
+
+
+def test_jokes_by_id_in_order(client, auth, taken):
+    auth.login()
+    response = client.get('/api/v1/jokes?ids=3,9,1&fields=title,tags')
+
+    assert response.mimetype == 'application/json'
+    assert response.json == {
+        'jokes': [{'title': 'third', 'tags': []}, {'title': 'test title', 'tags': []}],
+        'missing': [9],
+    }
+    assert client.get('/api/v1/jokes?ids=1,x').status_code == 400
+
+
+def test_body_only_once_taken(client, auth, taken):
+    auth.login()
+    jokes = client.get('/api/v1/jokes?fields=id,body').json['jokes']
+
+    # newest first; joke 3 isn't taken yet
+    assert jokes == [
+        {'id': 3, 'body': None},
+        {'id': 2, 'body': 'other body'},
+        {'id': 1, 'body': 'test body'},
+    ]
+    assert client.get('/api/v1/jokes?limit=1&offset=2&fields=id').json == {'jokes': [{'id': 1}]}
+
+
+def test_fields(client, auth):
+    auth.login()
+    assert client.get('/api/v1/jokes/1?fields=id, author').json == {'id': 1, 'author': 'test'}
+    response = client.get('/api/v1/jokes/1?fields=id,password')
+    assert response.status_code == 400
+    assert 'password' in response.json['error']
+    assert client.get('/api/v1/jokes/9').status_code == 404
+
+
+def test_user(client, auth):
+    auth.login()
+    assert client.get('/api/v1/users/other').json == {
+        'id': 2, 'nickname': 'other', 'joke_count': 1, 'ratings_received': 0,
+    }
+    assert client.get('/api/v1/users/nobody').status_code == 404
+
+
+def test_batch_rating(client, auth, taken):
+    auth.login()
+    response = client.post('/api/v1/ratings', json={'ratings': [
+        {'joke_id': 2, 'rating': 5},
+        {'joke_id': 1, 'rating': 5},
+        {'joke_id': 3, 'rating': 5},
+        {'joke_id': 2, 'rating': 3},
+    ]})
+
+    # own joke 1 and joke 3, not taken, are skipped
+    assert response.json == {
+        'ratings': [{'joke_id': 2, 'avg_rating': 3.0, 'rating_count': 1}],
+        'skipped': [1, 3],
+    }
+    bad = {'ratings': [{'joke_id': 2, 'rating': 6}]}
+    assert client.post('/api/v1/ratings', json=bad).status_code == 400
+    assert client.post('/api/v1/ratings', data='nope').status_code == 400
+
+
+def test_single_rating(client, auth, taken):
+    auth.login()
+    response = client.put('/api/v1/jokes/2/rating', json={'rating': 4})
+    assert response.json == {'joke_id': 2, 'avg_rating': 4.0, 'rating_count': 1}
+    assert client.put('/api/v1/jokes/3/rating', json={'rating': 4}).status_code == 403
+
+
+@pytest.mark.parametrize('body', ('[4]', '4', '"x"', 'null'))
+def test_body_must_be_an_object(client, auth, taken, body):
+    auth.login()
+
+    for method, url in (('put', '/api/v1/jokes/2/rating'), ('post', '/api/v1/ratings')):
+        response = getattr(client, method)(url, data=body, content_type='application/json')
+        assert response.status_code == 400
+        assert 'error' in response.json
+
+
+def test_content_negotiation(client, auth):
+    msgpack = pytest.importorskip('msgpack')
+    auth.login()
+
+    response = client.get('/api/v1/jokes/1?fields=id', headers={'Accept': 'application/msgpack'})
+    assert response.mimetype == 'application/msgpack'
+    assert msgpack.unpackb(response.data) == {'id': 1}
+    assert 'Accept' in response.vary
+
+    assert client.get('/api/v1/jokes/1', headers={'Accept': 'text/html'}).status_code == 406
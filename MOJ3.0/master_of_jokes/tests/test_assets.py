@@ -0,0 +1,23 @@
+import gzip
+
+from master_of_jokes.assets import build_assets
+
+
+def test_built_assets_are_served_immutable(app, client, tmp_path):
+    app.config['ASSET_OUTPUT'] = str(tmp_path)
+    app.extensions['assets'] = manifest = build_assets(app.static_folder, str(tmp_path))
+
+    page = client.get('/auth/login').data.decode()
+    assert '/assets/%s' % manifest['style.css'] in page
+    assert '/assets/%s' % manifest['script.js'] in page
+
+    response = client.get('/assets/%s' % manifest['script.js'],
+                          headers={'Accept-Encoding': 'gzip, br;q=0'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert b'DOMContentLoaded' in gzip.decompress(response.data)
+
+    response = client.get('/assets/%s' % manifest['script.js'],
+                          headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in response.headers
+    assert b'DOMContentLoaded' in response.data
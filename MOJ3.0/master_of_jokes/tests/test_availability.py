@@ -0,0 +1,55 @@
+import pytest
+
+from master_of_jokes import create_app
+from master_of_jokes.availability import BloomFilter
+from master_of_jokes.db import get_db
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(500, 0.01)
+    for i in range(500):
+        bloom.add('user%d' % i)
+    assert all('user%d' % i in bloom for i in range(500))
+    assert sum('other%d' % i in bloom for i in range(5000)) < 100
+
+
+@pytest.mark.parametrize(('query', 'available'), (
+    ('email=test%40example.com', False),
+    ('email=new%40example.com', True),
+    ('nickname=other', False),
+    ('nickname=newbie', True),
+))
+def test_available(client, query, available):
+    assert client.get('/auth/available?' + query).json['available'] is available
+
+
+def test_free_answer_skips_database(app, client):
+    statements = []
+    app.before_request(lambda: get_db().set_trace_callback(statements.append))
+    # The first call fills the filter
+    client.get('/auth/available?nickname=test')
+    statements.clear()
+
+    assert client.get('/auth/available?nickname=newbie').json['available']
+    assert statements == []
+    assert not client.get('/auth/available?nickname=test').json['available']
+    assert len(statements) == 1
+
+
+def test_registered_user_is_taken(client):
+    client.post('/auth/register', data={
+        'email': 'new@example.com', 'nickname': 'newbie', 'password': 'secret',
+    })
+    assert not client.get('/auth/available?email=new@example.com').json['available']
+    assert not client.get('/auth/available?nickname=newbie').json['available']
+
+
+def test_without_bloom_filter(app):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': app.config['DATABASE'],
+        'AVAILABILITY_BLOOM': False,
+    })
+    client = app.test_client()
+    assert not client.get('/auth/available?nickname=test').json['available']
+    assert client.get('/auth/available').status_code == 400
@@ -0,0 +1,37 @@
+import gzip
+
+from master_of_jokes.db import get_db
+
+
+def test_html_is_compressed(client, auth):
+    auth.login()
+    plain = client.get('/my-jokes')
+    response = client.get('/my-jokes', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == plain.data
+
+
+def test_small_json_is_not_compressed(client):
+    response = client.get('/api/status/users', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.json == {'count': 2}
+
+
+def test_streamed_page_compresses_like_a_buffered_one(app, client, auth):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO joke (author_id, title, body) VALUES (1, ?, ?)',
+            [('joke %d' % i, 'Why did chicken %d cross the road?' % i) for i in range(150)]
+        )
+        db.commit()
+    auth.login()
+
+    headers = {'Accept-Encoding': 'gzip'}
+    streamed = client.get('/my-jokes', headers=headers)
+    app.config['STREAM_PAGES'] = False
+    buffered = client.get('/my-jokes', headers=headers)
+
+    assert gzip.decompress(streamed.data) == gzip.decompress(buffered.data)
+    assert len(streamed.data) < len(buffered.data) * 1.1
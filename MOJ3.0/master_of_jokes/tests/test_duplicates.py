@@ -0,0 +1,58 @@
+from master_of_jokes import duplicates
+from master_of_jokes.db import get_db
+
+ATOMS = "Why don't scientists trust atoms?\nBecause they make up everything!"
+PASTA = 'What do you call a fake noodle?\nAn impasta!'
+CHEESE = "What do you call cheese that isn't yours?\nNacho cheese!"
+
+
+def test_similarity():
+    assert duplicates.jaccard(
+        duplicates.shingles(ATOMS), duplicates.shingles(ATOMS.lower() + '!!')
+    ) == 1.0
+    # same setup, different joke
+    assert duplicates.jaccard(
+        duplicates.shingles(PASTA), duplicates.shingles(CHEESE)
+    ) < 0.4
+
+
+def test_create_flags_duplicate(client, auth, app):
+    auth.login()
+    response = client.post('/create', data={'title': 'atoms', 'body': ATOMS})
+    assert response.status_code == 302
+
+    response = client.post('/create', data={'title': 'science', 'body': ATOMS})
+    assert b'looks a lot like' in response.data
+    assert b'name="post_anyway"' in response.data
+
+    response = client.post(
+        '/create', data={'title': 'science', 'body': ATOMS, 'post_anyway': '1'}
+    )
+    assert response.status_code == 302
+
+    with app.app_context():
+        db = get_db()
+        titles = [row[0] for row in db.execute('SELECT title FROM joke ORDER BY id')]
+        balance = db.execute('SELECT joke_balance FROM user WHERE id = 1').fetchone()[0]
+    assert titles == ['test title', 'other title', 'atoms', 'science']
+    assert balance == 3
+
+
+def test_find_duplicates_command(runner, app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO joke (author_id, title, body) VALUES (1, ?, ?)',
+            [('atoms', ATOMS), ('pasta', PASTA), ('cheese', CHEESE),
+             ('atoms again', ATOMS.upper()),
+             ('pasta again', PASTA.replace('noodle', 'noodle, really'))],
+        )
+        db.commit()
+
+    result = runner.invoke(args=['find-duplicates', '--batch-size', '2'])
+
+    assert 'indexed 7/7 jokes' in result.output
+    assert 'Found 2 clusters' in result.output
+    assert '#3 atoms\n  #6 atoms again\n' in result.output
+    assert '#4 pasta\n  #7 pasta again\n' in result.output
+    assert 'cheese' not in result.output
@@ -0,0 +1,14 @@
+def test_joke_lists_are_streamed(client, auth):
+    auth.login()
+    for path, title in (('/my-jokes', b'test title'), ('/list', b'other title')):
+        response = client.get(path)
+        assert 'Content-Length' not in response.headers
+        assert title in response.data
+
+
+def test_joke_lists_can_be_buffered(app, client, auth):
+    app.config['STREAM_PAGES'] = False
+    auth.login()
+    response = client.get('/my-jokes')
+    assert 'Content-Length' in response.headers
+    assert b'test title' in response.data
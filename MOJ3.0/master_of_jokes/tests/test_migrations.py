@@ -0,0 +1,66 @@
+import sqlite3
+from datetime import datetime
+
+from master_of_jokes.db import get_db
+from master_of_jokes.migrations import SCHEMA_VERSION, get_version, upgrade
+
+# joke, joke_view and joke_rating at schema version 1
+VERSION_1 = """
+CREATE TABLE user (id INTEGER PRIMARY KEY AUTOINCREMENT, nickname TEXT, role TEXT);
+CREATE TABLE joke (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  author_id INTEGER NOT NULL,
+  title TEXT NOT NULL,
+  body TEXT NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE (author_id, title)
+);
+CREATE TABLE joke_view (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  joke_id INTEGER NOT NULL,
+  viewed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE (user_id, joke_id)
+);
+CREATE TABLE joke_rating (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  joke_id INTEGER NOT NULL,
+  rating INTEGER NOT NULL,
+  rated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE (user_id, joke_id)
+);
+INSERT INTO joke (author_id, title, body, created)
+  VALUES (1, 'old', 'joke', '2018-01-01 00:00:00');
+INSERT INTO joke_view (user_id, joke_id, viewed_at)
+  VALUES (2, 1, '2018-01-02 00:00:00');
+INSERT INTO joke_rating (user_id, joke_id, rating, rated_at)
+  VALUES (2, 1, 4, '2018-01-02 00:00:00');
+PRAGMA user_version = 1;
+"""
+
+
+def test_fresh_schema_is_current(app, runner):
+    with app.app_context():
+        assert get_version(get_db()) == SCHEMA_VERSION
+    assert 'up to date' in runner.invoke(args=['db-upgrade']).output
+
+
+def test_upgrade_to_compact_storage(tmp_path):
+    db = sqlite3.connect(tmp_path / 'v1.sqlite', isolation_level=None,
+                         detect_types=sqlite3.PARSE_DECLTYPES)
+    db.executescript(VERSION_1)
+
+    assert upgrade(db) == [2, 3, 4, 5, 6]
+
+    assert db.execute('SELECT typeof(created), created FROM joke').fetchone() == (
+        'integer', datetime(2018, 1, 1))
+    assert db.execute('SELECT * FROM joke_rating').fetchone() == (
+        1, 2, 4, datetime(2018, 1, 2))
+    assert db.execute('SELECT * FROM joke_view').fetchone() == (
+        1, 2, datetime(2018, 1, 2))
+    for table in ('joke_view', 'joke_rating'):
+        sql = db.execute('SELECT sql FROM sqlite_master WHERE name = ?', (table,)).fetchone()[0]
+        assert sql.endswith('WITHOUT ROWID')
+    assert upgrade(db) == []
+    db.close()
@@ -0,0 +1,57 @@
+import pytest
+
+from master_of_jokes import create_app
+from master_of_jokes.db import get_db
+from master_of_jokes.moderation import ContentFilter
+
+
+@pytest.mark.parametrize(('text', 'allowed'), (
+    ('what a darn good joke', False),
+    ('D4RN', False),
+    ('the darnedest thing', True),
+    ('heckin', False),
+    ('see http://a.example and https://www.b.example', True),
+    ('http://a http://b www.c', False),
+    ('lol!!!!!!!!!!!', False),
+))
+def test_content_filter(text, allowed):
+    content_filter = ContentFilter(['darn', 'heck*'], 2, 10)
+    assert (content_filter.check(text) is None) == allowed
+
+
+@pytest.fixture
+def moderated(app, tmp_path):
+    return create_app({
+        'TESTING': True,
+        'DATABASE': app.config['DATABASE'],
+        'MODERATION_TERMS': str(tmp_path / 'banned_terms.txt'),
+        'MODERATION_RELOAD_INTERVAL': 0,
+    })
+
+
+def test_moderator_edits_terms(moderated):
+    client = moderated.test_client()
+    client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+
+    assert client.post('/create', data={'title': 'ok', 'body': 'darn'}).status_code == 302
+
+    response = client.post('/admin/banned-terms', data={'terms': '# words\r\ndarn'})
+    assert response.status_code == 302
+    assert 'darn' in client.get('/admin/banned-terms').get_data(as_text=True)
+
+    response = client.post('/create', data={'title': 'again', 'body': 'darn it'})
+    assert b'keep it friendly' in response.data
+    response = client.post('/1/update', data={'body': 'Darn.'})
+    assert b'keep it friendly' in response.data
+
+    with moderated.app_context():
+        db = get_db()
+        assert db.execute('SELECT COUNT(*) FROM joke').fetchone()[0] == 3
+        assert db.execute('SELECT body FROM joke WHERE id = 1').fetchone()[0] == 'test body'
+
+
+def test_only_moderators_edit_terms(moderated, tmp_path):
+    client = moderated.test_client()
+    client.post('/auth/login', data={'username': 'other', 'password': 'other'})
+    client.post('/admin/banned-terms', data={'terms': 'joke'})
+    assert not (tmp_path / 'banned_terms.txt').exists()
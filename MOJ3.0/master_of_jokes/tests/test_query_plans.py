@@ -0,0 +1,67 @@
+import pytest
+from master_of_jokes import admin
+from master_of_jokes import api
+from master_of_jokes import auth
+from master_of_jokes import duplicates
+from master_of_jokes import jokes
+from master_of_jokes import suggest
+from master_of_jokes import tags
+from master_of_jokes.db import get_db
+from master_of_jokes.migrations import SCHEMA_VERSION
+
+# (query, params, tables that may be read in full)
+HOT_QUERIES = {
+    'my jokes': (jokes.MY_JOKES, (1,), set()),
+    'list jokes': (jokes.LIST_JOKES, (1,), {'j USING INDEX joke_created'}),
+    'tag list': (jokes.TAG_JOKES, ('[1, 2]',), {'json_each VIRTUAL TABLE INDEX 1:'}),
+    'top tags': (tags.TOP, (12,), set()),
+    'tag postings': (tags.POSTINGS, (1, 0, 100), set()),
+    'tag facets': (tags.FACETS, ('[1, 2]', 12), {'j VIRTUAL TABLE INDEX 1:'}),
+    'view joke': (jokes.VIEW_JOKE, (1,), set()),
+    'joke view record': (jokes.VIEW_RECORD, (1, 1), set()),
+    'user rating': (jokes.USER_RATING, (1, 1), set()),
+    **{
+        'delete from %s' % statement.split()[2]: (statement, (1,), set())
+        for statement in jokes.DELETE_RELATED
+    },
+    'take queue': (jokes.TAKE_QUEUE, (1,), set()),
+    # b is the list of buckets passed in
+    'duplicate candidates': (
+        duplicates.CANDIDATES,
+        ('[1, 2]', 50),
+        {'b VIRTUAL TABLE INDEX 1:'},
+    ),
+    # r is the list of ratings passed in
+    'api rate': (
+        api.RATE,
+        {'ratings': '[[1, 4]]', 'user_id': 1},
+        {'r VIRTUAL TABLE INDEX 1:'},
+    ),
+    'api scores': (api.SCORES, ('[1, 2]',), {'json_each VIRTUAL TABLE INDEX 1:'}),
+    'nickname prefix': (suggest.LIKE, ('te%', 8), set()),
+    'login lookup': (auth.USER_BY_NAME, ('test', 'test'), set()),
+    'moderator count': (admin.MODERATOR_COUNT, (), set()),
+}
+
+
+def scans(db, query, params):
+    """Return the full-table reads in the query plan."""
+    plan = db.execute('EXPLAIN QUERY PLAN ' + query, params).fetchall()
+    return {
+        row['detail'][len('SCAN '):]
+        for row in plan
+        if row['detail'].startswith('SCAN ')
+    }
+
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_uses_index(app, name):
+    query, params, allowed = HOT_QUERIES[name]
+
+    with app.app_context():
+        assert scans(get_db(), query, params) <= allowed
+
+
+def test_schema_version(app):
+    with app.app_context():
+        assert get_db().execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
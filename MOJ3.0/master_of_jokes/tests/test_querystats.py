@@ -0,0 +1,83 @@
+import pytest
+
+from master_of_jokes import querystats
+from master_of_jokes.querystats import QueryBudgetExceeded
+
+# (method, path, form data), run in order as the logged in moderator
+ROUTES = [
+    ('get', '/', None),
+    ('get', '/create', None),
+    ('post', '/create', {'title': 'new', 'body': 'joke', 'tags': 'dad pun'}),
+    ('get', '/tag/dad+pun', None),
+    ('get', '/my-jokes', None),
+    ('get', '/list', None),
+    ('get', '/take', None),
+    ('get', '/2/view', None),
+    ('post', '/2/view', {'rating': '4'}),
+    ('get', '/1/update', None),
+    ('post', '/1/update', {'body': 'updated'}),
+    ('post', '/1/delete', None),
+    ('get', '/admin/', None),
+    ('post', '/admin/promote', {'user_id': '2'}),
+    ('post', '/admin/demote', {'user_id': '2'}),
+    ('post', '/admin/update-balance', {'user_id': '2', 'new_balance': '3'}),
+    ('get', '/admin/banned-terms', None),
+    ('get', '/admin/?q=te', None),
+    ('get', '/auth/users/suggest?q=te', None),
+    ('get', '/auth/available?nickname=test', None),
+    ('get', '/api/status/users', None),
+    ('get', '/api/status/jokes', None),
+    ('get', '/api/status/timeouts', None),
+    ('get', '/api/status/admission', None),
+    ('get', '/api/status/logins', None),
+    ('get', '/api/v1/jokes?ids=2,9', None),
+    ('get', '/api/v1/jokes/2', None),
+    ('get', '/api/v1/users/other', None),
+    ('put', '/api/v1/jokes/2/rating', '{"rating": 5}'),
+    ('post', '/api/v1/ratings', '{"ratings": [{"joke_id": 2, "rating": 3}]}'),
+    ('get', '/assets/style.css', None),
+    ('get', '/auth/logout', None),
+    ('get', '/auth/register', None),
+    ('post', '/auth/register', {
+        'email': 'new@example.com', 'nickname': 'new', 'password': 'secret',
+    }),
+    ('get', '/auth/login', None),
+    ('post', '/auth/login', {'username': 'test', 'password': 'test'}),
+]
+
+
+def test_every_route_has_a_budget(app):
+    for endpoint, view in app.view_functions.items():
+        if endpoint != 'static':
+            assert hasattr(view, 'query_budget'), endpoint
+
+
+def test_every_route_within_budget(app, client, auth):
+    auth.login()
+
+    with querystats.capture(app) as captured:
+        for method, path, data in ROUTES:
+            getattr(client, method)(path, data=data).get_data()
+
+    assert {stats.endpoint for stats in captured} == set(app.view_functions) - {'static'}
+
+
+def test_streamed_queries_count(app, client, auth):
+    auth.login()
+
+    with querystats.capture(app) as captured:
+        client.get('/list').get_data()
+
+    # The user, the tag facets and the list
+    assert (captured[0].queries, captured[0].rows) == (3, 2)
+
+
+def test_header_and_strict_budget(app, client, auth, monkeypatch):
+    app.config['QUERY_STATS_HEADER'] = True
+    response = client.get('/api/status/jokes')
+    assert response.headers['X-Query-Count'] == '1'
+
+    view = app.view_functions['report_api.joke_count']
+    monkeypatch.setattr(view, 'query_budget', querystats.Budget(0, None))
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/api/status/jokes')
@@ -0,0 +1,63 @@
+import pytest
+
+from master_of_jokes import recommend
+from master_of_jokes.db import get_db
+
+
+def test_take_queue(app, client, auth):
+    pytest.importorskip('numpy')
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO user (email, nickname, password) VALUES (?, ?, 'x')",
+            [('%d@example.com' % i, 'rater%d' % i) for i in range(3, 6)],
+        )
+        db.executemany(
+            "INSERT INTO joke (author_id, title, body) VALUES (3, ?, '')",
+            [('liked too',), ('disliked one',), ('already taken',)],
+        )
+        # users 3 to 5 like jokes 1, 2, 3 and 5 together and dislike 4;
+        # user 1 liked joke 2, wrote joke 1 and took joke 5
+        db.executemany(
+            'INSERT INTO joke_rating (joke_id, user_id, rating) VALUES (?, ?, ?)',
+            [(joke, user, stars) for user in (3, 4, 5)
+             for joke, stars in ((1, 5), (2, 5), (3, 5), (4, 1), (5, 5))]
+            + [(2, 1, 5), (4, 1, 1)],
+        )
+        db.execute('INSERT INTO joke_view (joke_id, user_id) VALUES (5, 1)')
+        db.commit()
+
+    result = app.test_cli_runner().invoke(args=['recommend'])
+    assert 'take queues for 1 users' in result.output
+
+    with app.app_context():
+        rows = get_db().execute(
+            'SELECT user_id, joke_id FROM joke_recommendation ORDER BY rank'
+        ).fetchall()
+    assert [tuple(row) for row in rows] == [(1, 3)]
+
+    auth.login()
+    page = client.get('/take').get_data(as_text=True)
+    assert 'liked too' in page
+    assert 'already taken' not in page
+
+
+def test_take_skips_jokes_taken_since(app, client, auth):
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            'INSERT INTO joke_recommendation (user_id, rank, joke_id, score)'
+            ' VALUES (1, 0, 2, 1.0)'
+        )
+        db.commit()
+
+    auth.login()
+    assert 'other title' in client.get('/take').get_data(as_text=True)
+
+    client.get('/2/view')
+    assert 'other title' not in client.get('/take').get_data(as_text=True)
+
+
+def test_recommend_needs_numpy(runner, monkeypatch):
+    monkeypatch.setattr(recommend, 'np', None)
+    assert 'needs numpy' in runner.invoke(args=['recommend']).output
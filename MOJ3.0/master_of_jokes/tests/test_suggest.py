@@ -0,0 +1,59 @@
+import pytest
+
+from master_of_jokes import create_app
+from master_of_jokes.db import get_db
+from master_of_jokes.suggest import NicknameIndex
+
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO user (email, nickname, password) VALUES (?, ?, '')",
+            [('%s@example.com' % n, n) for n in ('Tess', 'tex_1', 'Émile', 'émilie')],
+        )
+        db.commit()
+
+
+def test_index_search():
+    index = NicknameIndex(refresh=60)
+    for nickname in ('bob', 'Bobby', 'bo_', 'al'):
+        index.add(nickname)
+    assert index.search('BO', 10) == ['bo_', 'bob', 'Bobby']
+    assert index.search('b', 1) == ['bo_']
+
+
+@pytest.mark.parametrize('in_memory', (True, False))
+def test_suggest(app, users, in_memory):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': app.config['DATABASE'],
+        'SUGGEST_IN_MEMORY': in_memory,
+    })
+    client = app.test_client()
+
+    assert client.get('/auth/users/suggest?q=te').json['nicknames'] == [
+        'Tess', 'test', 'tex_1']
+    assert client.get('/auth/users/suggest?q=tex_').json['nicknames'] == ['tex_1']
+    # Like SQLite's NOCASE, only ASCII letters are folded
+    assert client.get('/auth/users/suggest?q=émil').json['nicknames'] == ['émilie']
+
+
+def test_registered_user_is_not_caught_up_twice(app, client):
+    app.extensions['nickname_index'].refresh = 0
+    client.get('/auth/users/suggest?q=ne')
+
+    client.post('/auth/register', data={
+        'email': 'newbie@example.com', 'nickname': 'newbie', 'password': 'secret',
+    })
+
+    assert client.get('/auth/users/suggest?q=ne').json['nicknames'] == ['newbie']
+
+
+def test_dashboard_search(client, auth, users):
+    auth.login()
+    page = client.get('/admin/?q=TE').get_data(as_text=True)
+    assert 'tex_1' in page
+    assert 'Tess' in page
+    assert 'other' not in page
@@ -0,0 +1,41 @@
+from master_of_jokes import tags
+from master_of_jokes.db import get_db
+
+
+def test_parse_and_check():
+    assert tags.parse('#Dad, pun dad') == ['dad', 'pun']
+    assert tags.check(['knock-knock']) is None
+    assert 'at most' in tags.check(list('abcdef'))
+    assert 'dashes' in tags.check(['a--b'])
+
+
+def test_intersect():
+    assert tags.intersect([[1, 3, 5, 9], [3, 5, 9, 12], [5, 9]]) == [5, 9]
+    assert tags.intersect([[1], [2]]) == []
+
+
+def counts(db):
+    return dict(db.execute('SELECT name, post_count FROM tag').fetchall())
+
+
+def test_tags_on_write(app, client, auth):
+    auth.login()
+    client.post('/create', data={'title': 'new', 'body': 'a joke', 'tags': 'dad, pun'})
+    with app.app_context():
+        db = get_db()
+        tags.add(db, 2, ['dad'])
+        db.commit()
+        assert counts(db) == {'dad': 2, 'pun': 1}
+        assert tags.matching(db, ['pun', 'dad']) == [3]
+        assert tags.matching(db, ['science']) is None
+
+    page = client.get('/tag/dad').data
+    assert b'other title' in page and b'new' in page
+    assert b'/tag/dad+pun' in page
+    assert b'/tag/dad' in client.get('/list').data
+    assert client.get('/tag/science').status_code == 404
+
+    client.post('/3/update', data={'body': 'a joke', 'tags': 'pun'})
+    client.post('/3/delete')
+    with app.app_context():
+        assert counts(get_db()) == {'dad': 1, 'pun': 0}
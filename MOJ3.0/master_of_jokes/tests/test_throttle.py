@@ -0,0 +1,82 @@
+import pytest
+from werkzeug import security
+
+from master_of_jokes.throttle import ADDRESS, IDENTIFIER, LoginThrottle
+
+
+def make_throttle(max_keys=100):
+    return LoginThrottle(60, {IDENTIFIER: 3, ADDRESS: 5}, 1, 8, max_keys)
+
+
+def test_backoff_doubles_up_to_cap():
+    throttle = make_throttle()
+    for _ in range(3):
+        throttle.failed('bob', '1.1.1.1', now=0)
+    assert throttle.retry_after('bob', '1.1.1.1', now=0) == 1
+    throttle.failed('bob', '1.1.1.1', now=1)
+    assert throttle.retry_after('bob', '1.1.1.1', now=1) == 2
+    for t in range(2, 8):
+        throttle.failed('bob', '1.1.1.1', now=t)
+    assert throttle.retry_after('bob', '1.1.1.1', now=8) == 7
+    # The address is past its free attempts too, for everyone
+    assert throttle.retry_after('alice', '1.1.1.1', now=8) == 7
+
+
+def test_failures_slide_out_of_window():
+    throttle = make_throttle()
+    for t in range(3):
+        throttle.failed('bob', '1.1.1.1', now=t)
+    assert throttle.retry_after('bob', '1.1.1.1', now=2.5) == 0.5
+    assert throttle.retry_after('bob', '1.1.1.1', now=61) == 0
+    assert throttle.retry_after('bob', '1.1.1.1', now=63) == 0
+    assert throttle.snapshot()['keys'] == 0
+
+
+def test_memory_is_bounded():
+    throttle = make_throttle(max_keys=10)
+    for i in range(20):
+        for _ in range(10):
+            throttle.failed('user%d' % i, '1.1.1.1', now=0)
+    assert len(throttle.failures) == 10
+    assert (ADDRESS, '1.1.1.1') in throttle.failures
+    assert max(len(f) for f in throttle.failures.values()) <= throttle.keep[ADDRESS]
+
+
+def test_success_clears_identifier_only():
+    throttle = make_throttle()
+    for t in range(5):
+        throttle.failed('bob', '1.1.1.1', now=t)
+    throttle.succeeded('bob')
+    assert throttle.retry_after('bob', '2.2.2.2', now=4) == 0
+    assert throttle.retry_after('carol', '1.1.1.1', now=4) == 1
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    calls = []
+    check = security.check_password_hash
+
+    def counted(*args):
+        calls.append(args)
+        return check(*args)
+
+    monkeypatch.setattr(security, 'check_password_hash', counted)
+    return calls
+
+
+def test_login_is_throttled_before_hashing(client, auth, hashes):
+    for _ in range(5):
+        assert auth.login(password='wrong').status_code == 200
+    assert len(hashes) == 5
+
+    response = auth.login(username='Test ')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    assert b'Too many failed attempts' in response.data
+    assert len(hashes) == 5
+
+    assert auth.login(username='other', password='other').status_code == 302
+
+    status = client.get('/api/status/logins').json
+    assert status['failed'] == 5
+    assert status['throttled_by_identifier'] == 1
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from master_of_jokes.db import get_db
+from master_of_jokes.querystats import Budget
+
+
+@pytest.fixture
+def no_time(app, monkeypatch):
+    """Give the joke lists no time for their queries."""
+    for endpoint in ('jokes.list_jokes', 'jokes.view'):
+        view = app.view_functions[endpoint]
+        monkeypatch.setattr(view, 'query_budget', Budget(None, None, 0))
+    app.config['QUERY_PROGRESS_STEPS'] = 1
+
+
+def test_overrun_is_cancelled_and_cools_down(client, auth, no_time):
+    auth.login()
+
+    response = client.get('/2/view')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+    assert client.get('/2/view').status_code == 503
+
+    assert client.get('/api/status/timeouts').json == {
+        'cancelled': {'jokes.view': 1},
+        'rejected': {'jokes.view': 1},
+    }
+
+
+def test_streamed_list_is_cut_short(app, client, auth, no_time):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO joke (author_id, title, body) VALUES (2, ?, ?)',
+            ((f'joke {i}', 'body') for i in range(500)),
+        )
+        db.commit()
+    # loading the user takes fewer steps than this, the list far more
+    app.config['QUERY_PROGRESS_STEPS'] = 500
+    auth.login()
+
+    response = client.get('/list')
+    assert response.status_code == 200
+    assert b'timeout-notice' in response.data
+    assert b'other title' not in response.data
+
+    # Only this response ran long; the page isn't cooled down
+    assert not app.extensions['query_timeouts'].cooling
+    assert client.get('/list').status_code == 200
+
+
+def test_cooldown_is_per_query_string(client, auth, no_time):
+    auth.login()
+    client.get('/2/view')
+
+    assert client.get('/2/view').status_code == 503
+    # Not turned away, cancelled on its own account
+    assert client.get('/2/view?again=1').status_code == 503
+    assert client.get('/api/status/timeouts').json['cancelled'] == {'jokes.view': 2}
+
+
+def test_slow_reader_keeps_its_budget(app, client, auth, monkeypatch):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO joke (author_id, title, body) VALUES (2, ?, ?)',
+            ((f'joke {i}', 'body') for i in range(20)),
+        )
+        db.commit()
+    view = app.view_functions['jokes.list_jokes']
+    monkeypatch.setattr(view, 'query_budget', Budget(None, None, 0.1))
+    app.config['QUERY_PROGRESS_STEPS'] = 1
+    auth.login()
+
+    body = b''
+    for chunk in client.get('/list', buffered=False).iter_encoded():
+        body += chunk
+        time.sleep(0.005)
+
+    assert b'timeout-notice' not in body
+    assert b'other title' in body
+    assert not app.extensions['query_timeouts'].cancelled
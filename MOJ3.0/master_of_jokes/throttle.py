@@ -0,0 +1,127 @@
+import math
+import threading
+import time
+from collections import Counter
+from collections import OrderedDict
+from collections import deque
+
+from flask import current_app, request
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Failures are tracked per login identifier and per client address
+IDENTIFIER, ADDRESS = 'identifier', 'address'
+
+
+class LoginThrottle:
+    """Failed logins per identifier and per address over a sliding window.
+    Past free[kind] failures an attempt waits base seconds after the last
+    one, doubling per further failure up to cap. At most max_keys keys,
+    least recently failed evicted first."""
+
+    def __init__(self, window, free, base, cap, max_keys):
+        self.window = window
+        self.free = free
+        self.base = base
+        self.cap = cap
+        self.max_keys = max_keys
+        # Past this many failures over the free ones the wait is capped
+        self.keep = {
+            kind: allowed + max(1, math.ceil(math.log2(cap / base)) + 1)
+            for kind, allowed in free.items()
+        }
+        self.lock = threading.Lock()
+        self.failures = OrderedDict()
+        self.counts = Counter()
+
+    def _recent(self, key, now):
+        failures = self.failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self.failures[key]
+            return None
+        return failures
+
+    def retry_after(self, identifier, address, now=None):
+        """Seconds a login as identifier from address has to wait, 0 if
+        it may go on."""
+        now = time.monotonic() if now is None else now
+        wait, reason = 0, None
+        with self.lock:
+            self.counts['checked'] += 1
+            for kind, key in ((IDENTIFIER, identifier), (ADDRESS, address)):
+                failures = self._recent((kind, key), now)
+                if failures is None:
+                    continue
+                over = len(failures) - self.free[kind]
+                if over < 0:
+                    continue
+                until = failures[-1] + min(self.cap, self.base * 2 ** over)
+                if until - now > wait:
+                    wait, reason = until - now, kind
+            if reason is not None:
+                self.counts['throttled_by_%s' % reason] += 1
+        return wait
+
+    def failed(self, identifier, address, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.counts['failed'] += 1
+            for kind, key in ((IDENTIFIER, identifier), (ADDRESS, address)):
+                failures = self.failures.get((kind, key))
+                if failures is None:
+                    failures = self.failures[(kind, key)] = deque(maxlen=self.keep[kind])
+                else:
+                    self.failures.move_to_end((kind, key))
+                failures.append(now)
+            while len(self.failures) > self.max_keys:
+                self.failures.popitem(last=False)
+                self.counts['evicted'] += 1
+
+    def succeeded(self, identifier):
+        """Forget the identifier's failures; the address keeps its own so
+        logging into one account doesn't reset guessing at others."""
+        with self.lock:
+            self.failures.pop((IDENTIFIER, identifier), None)
+
+    def snapshot(self):
+        with self.lock:
+            return {'keys': len(self.failures), **self.counts}
+
+
+def get_throttle():
+    return current_app.extensions['login_throttle']
+
+
+def client_address():
+    return request.remote_addr or ''
+
+
+def normalize(identifier):
+    """So 'Bob' and 'bob ' count together."""
+    return identifier.strip().lower()
+
+
+def init_app(app):
+    """Throttle logins past LOGIN_FREE_ATTEMPTS failures per identifier or
+    LOGIN_FREE_ATTEMPTS_PER_ADDRESS per address in LOGIN_WINDOW seconds."""
+    app.config.setdefault('LOGIN_WINDOW', 900.0)
+    app.config.setdefault('LOGIN_FREE_ATTEMPTS', 5)
+    app.config.setdefault('LOGIN_FREE_ATTEMPTS_PER_ADDRESS', 20)
+    app.config.setdefault('LOGIN_BACKOFF_BASE', 1.0)
+    app.config.setdefault('LOGIN_BACKOFF_MAX', 900.0)
+    app.config.setdefault('LOGIN_THROTTLE_KEYS', 10_000)
+    app.extensions['login_throttle'] = LoginThrottle(
+        app.config['LOGIN_WINDOW'],
+        {
+            IDENTIFIER: app.config['LOGIN_FREE_ATTEMPTS'],
+            ADDRESS: app.config['LOGIN_FREE_ATTEMPTS_PER_ADDRESS'],
+        },
+        app.config['LOGIN_BACKOFF_BASE'],
+        app.config['LOGIN_BACKOFF_MAX'],
+        app.config['LOGIN_THROTTLE_KEYS'],
+    )
@@ -0,0 +1,178 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import Response, current_app, has_request_context, request
+
+import logging
+logger = logging.getLogger(__name__)
+
+_CLOCK_KEY = 'master_of_jokes.query_clock'
+
+MESSAGE = 'This page is taking too long to load. Please try again in a moment.'
+
+
+def is_interrupt(e):
+    """SQLite's error for a statement the progress handler cancelled."""
+    return 'interrupted' in str(e)
+
+
+class Clock:
+    """Time a request spent against its query time budget. Stopped while
+    a streamed page waits for the client to take a chunk, so a slow
+    reader's socket doesn't count against its queries."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.spent = 0.0
+        self.since = time.monotonic()
+        # Set once the response started streaming
+        self.streaming = False
+
+    def stop(self):
+        if self.since is not None:
+            self.spent += time.monotonic() - self.since
+            self.since = None
+
+    def start(self):
+        if self.since is None:
+            self.since = time.monotonic()
+
+    def expired(self):
+        spent = self.spent
+        if self.since is not None:
+            spent += time.monotonic() - self.since
+        return spent >= self.seconds
+
+
+class QueryTimeouts:
+    """Cancelled statements and turned away requests per endpoint.
+
+    A page (path and query string) whose query was cancelled before its
+    response started gets a 503 for `cooldown` seconds without touching
+    the database, so retries can't pile up on it.
+    """
+
+    def __init__(self, cooldown, max_paths=1024):
+        self.cooldown = cooldown
+        self.max_paths = max_paths
+        self.lock = threading.Lock()
+        self.cancelled = Counter()
+        self.rejected = Counter()
+        self.cooling = {}
+
+    def cancel(self, endpoint, path=None):
+        """Count a cancellation; cool path down unless it's None."""
+        now = time.monotonic()
+        with self.lock:
+            self.cancelled[endpoint] += 1
+            if path is None:
+                return
+            if len(self.cooling) >= self.max_paths:
+                self.cooling = {p: t for p, t in self.cooling.items() if t > now}
+            if len(self.cooling) < self.max_paths:
+                self.cooling[path] = now + self.cooldown
+
+    def reject(self, endpoint, path):
+        until = self.cooling.get(path)
+        if until is None or until <= time.monotonic():
+            return False
+        with self.lock:
+            self.rejected[endpoint] += 1
+        return True
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'cancelled': dict(self.cancelled),
+                'rejected': dict(self.rejected),
+            }
+
+
+def timeout_response():
+    timeouts = current_app.extensions['query_timeouts']
+    return Response(
+        MESSAGE,
+        status=503,
+        headers={'Retry-After': str(max(1, math.ceil(timeouts.cooldown)))},
+        mimetype='text/plain',
+    )
+
+
+def start_clock():
+    timeouts = current_app.extensions['query_timeouts']
+    if timeouts.reject(request.endpoint, request.full_path):
+        logger.warning("Query cooldown: rejected %s", request.full_path)
+        return timeout_response()
+
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    seconds = budget.seconds if budget is not None else None
+    if seconds is None:
+        seconds = current_app.config['QUERY_TIME_BUDGET']
+    request.environ[_CLOCK_KEY] = Clock(seconds)
+
+
+def watch(db):
+    """Cancel the connection's statements once the request spent its
+    query time budget."""
+    if not has_request_context():
+        return
+    clock = request.environ.get(_CLOCK_KEY)
+    if clock is None:
+        return
+
+    timeouts = current_app.extensions['query_timeouts']
+    endpoint = request.endpoint
+    path = request.full_path
+
+    def check():
+        if not clock.expired():
+            return False
+        # A page cut short while streaming may have run long only for
+        # this client, so it isn't cooled down for everyone
+        timeouts.cancel(endpoint, None if clock.streaming else path)
+        logger.warning("Query time budget exceeded: cancelled a query on %s", path)
+        return True
+
+    db.set_progress_handler(check, current_app.config['QUERY_PROGRESS_STEPS'])
+
+
+def handle_interrupt(e):
+    if not is_interrupt(e):
+        raise e
+    return timeout_response()
+
+
+def cut_short(chunks):
+    """End a streamed page with a notice if a query is cancelled after
+    the response started. The query clock stops while each chunk is
+    with the client."""
+    clock = request.environ.get(_CLOCK_KEY) if has_request_context() else None
+    if clock is None:
+        clock = Clock(math.inf)
+    clock.streaming = True
+    return _cut_short(chunks, clock)
+
+
+def _cut_short(chunks, clock):
+    try:
+        for chunk in chunks:
+            clock.stop()
+            yield chunk
+            clock.start()
+    except sqlite3.OperationalError as e:
+        if not is_interrupt(e):
+            raise
+        yield f'<p class="flash timeout-notice">{MESSAGE}</p>'
+
+
+def init_app(app):
+    app.config.setdefault('QUERY_TIME_BUDGET', 1.0)
+    app.config.setdefault('QUERY_PROGRESS_STEPS', 1000)
+    app.config.setdefault('QUERY_TIMEOUT_COOLDOWN', 5.0)
+    app.extensions['query_timeouts'] = QueryTimeouts(app.config['QUERY_TIMEOUT_COOLDOWN'])
+    app.before_request(start_clock)
+    app.register_error_handler(sqlite3.OperationalError, handle_interrupt)
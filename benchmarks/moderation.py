@@ -0,0 +1,104 @@
+"""
+Throughput benchmark for the comment content filter: the Aho–Corasick
+automaton in flaskr.moderation against one regex alternation of every
+term and against testing each term in turn.
+Run this script from the project root directory:
+
+    python benchmarks/moderation.py [--terms N] [--comments N]
+"""
+
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr.moderation import ContentFilter  # noqa: E402
+from flaskr.moderation import fold  # noqa: E402
+
+WORDS = (
+    "why did the chicken cross road to get other side knock who is there "
+    "a an pun fun joke laugh because they make up everything atoms noodle"
+).split()
+
+
+def make_terms(rng, count):
+    return [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+        for _ in range(count)
+    ]
+
+
+def make_comments(rng, count, terms):
+    comments = []
+    for i in range(count):
+        words = rng.choices(WORDS, k=rng.randint(5, 60))
+        # one comment in fifty uses a banned term
+        if i % 50 == 0:
+            words.insert(rng.randrange(len(words)), rng.choice(terms))
+        comments.append(" ".join(words))
+    return comments
+
+
+def measure(fn, repeat=5):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--terms", type=int, default=5000)
+    parser.add_argument("--comments", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    terms = make_terms(rng, args.terms)
+    comments = make_comments(rng, args.comments, terms)
+    chars = sum(map(len, comments))
+
+    start = time.perf_counter()
+    content_filter = ContentFilter(terms, 2, 10)
+    built = time.perf_counter() - start
+
+    start = time.perf_counter()
+    alternation = re.compile(r"\b(?:%s)\b" % "|".join(map(re.escape, terms)))
+    compiled = time.perf_counter() - start
+
+    def automaton():
+        return sum(content_filter.check(c) is not None for c in comments)
+
+    def regex():
+        return sum(alternation.search(fold(c)) is not None for c in comments)
+
+    def each_term():
+        return sum(
+            any(re.search(r"\b%s\b" % t, fold(c)) for t in terms) for c in comments[:50]
+        )
+
+    assert automaton() == regex()
+    print(
+        f"{args.terms} terms, {args.comments} comments of {chars // args.comments}"
+        f" characters on average, best of 5"
+    )
+    print(
+        f"   built: automaton {built * 1000:.1f} ms ({len(content_filter.automaton)} states)"
+        f" | regex {compiled * 1000:.1f} ms"
+    )
+    for label, fn, count in (
+        ("automaton", automaton, args.comments),
+        ("regex", regex, args.comments),
+        ("each term", each_term, 50),
+    ):
+        best = measure(fn, repeat=1 if fn is each_term else 5)
+        print(
+            f"{label:>9}: {best / count * 1e6:9.1f} us/comment"
+            f" {count / best:10.0f} comments/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Compares the on-disk size and b-tree depth of the schema before and
+after migration 5 (epoch timestamps, rating WITHOUT ROWID).
+Run this script from the project root directory:
+
+    python benchmarks/storage.py [--posts N] [--users N]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr.migrations import upgrade  # noqa: E402
+
+# the tables and indexes at schema version 4
+VERSION_4 = """
+CREATE TABLE user (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  username TEXT UNIQUE NOT NULL,
+  nickname TEXT UNIQUE NOT NULL,
+  password TEXT NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE post (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  author_id INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  title TEXT NOT NULL,
+  body TEXT NOT NULL
+);
+CREATE TABLE rating (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  post_id INTEGER NOT NULL,
+  user_id INTEGER NOT NULL,
+  rating INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE (post_id, user_id)
+);
+CREATE TABLE comment (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  post_id INTEGER NOT NULL,
+  user_id INTEGER NOT NULL,
+  body TEXT NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX post_author_created ON post (author_id, created);
+CREATE INDEX rating_post ON rating (post_id, rating);
+CREATE INDEX rating_user ON rating (user_id, post_id, rating);
+CREATE INDEX comment_post_created ON comment (post_id, created);
+PRAGMA user_version = 4;
+"""
+
+
+def populate(db, posts, users):
+    rng = random.Random(0)
+    db.execute("BEGIN")
+    db.executemany(
+        "INSERT INTO user (username, nickname, password) VALUES (?, ?, '')",
+        ((f"user{i}@example.com", f"user{i}") for i in range(users)),
+    )
+    db.executemany(
+        "INSERT INTO post (author_id, created, title, body)"
+        " VALUES (?, datetime(1514764800 + ?, 'unixepoch'), ?, ?)",
+        (
+            (rng.randrange(users) + 1, i * 60, f"Joke {i}", "Knock knock. " * 5)
+            for i in range(posts)
+        ),
+    )
+    db.executemany(
+        "INSERT OR IGNORE INTO rating (post_id, user_id, rating, created)"
+        " VALUES (?, ?, ?, datetime(1514764800 + ?, 'unixepoch'))",
+        (
+            (rng.randrange(posts) + 1, rng.randrange(users) + 1, rng.randint(1, 5), i)
+            for i in range(posts * 10)
+        ),
+    )
+    db.executemany(
+        "INSERT INTO comment (post_id, user_id, body, created)"
+        " VALUES (?, ?, 'lol', datetime(1514764800 + ?, 'unixepoch'))",
+        ((rng.randrange(posts) + 1, rng.randrange(users) + 1, i) for i in range(posts)),
+    )
+    db.execute("COMMIT")
+
+
+def stats(db):
+    """Return the file size and ``{btree: (pages, depth)}``."""
+    size = db.execute("PRAGMA page_count").fetchone()[0] * db.execute(
+        "PRAGMA page_size"
+    ).fetchone()[0]
+    trees = {
+        name: (pages, depth)
+        for name, pages, depth in db.execute(
+            "SELECT name, COUNT(*), MAX(length(path) - length(replace(path, '/', '')))"
+            " FROM dbstat GROUP BY name"
+        )
+        if name not in ("sqlite_schema", "sqlite_master", "sqlite_sequence")
+    }
+    return size, trees
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=2000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp()
+    db = sqlite3.connect(path, isolation_level=None)
+    db.executescript(VERSION_4)
+    populate(db, args.posts, args.users)
+    db.execute("VACUUM")
+    before_size, before = stats(db)
+
+    upgrade(db)
+    db.execute("VACUUM")
+    after_size, after = stats(db)
+
+    print(f"{args.posts} posts, {args.users} users")
+    print(f"{'b-tree':<34}{'pages':>14}{'depth':>10}")
+    for name in sorted(before.keys() | after.keys()):
+        old_pages, old_depth = before.get(name, (0, 0))
+        new_pages, new_depth = after.get(name, (0, 0))
+        print(
+            f"{name:<34}{old_pages:>6} -> {new_pages:<6}{old_depth:>3} -> {new_depth:<3}"
+        )
+    print(
+        f"file size: {before_size // 1024} KiB -> {after_size // 1024} KiB"
+        f" ({1 - after_size / before_size:.0%} smaller)"
+    )
+
+    db.close()
+    os.close(fd)
+    os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
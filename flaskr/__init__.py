@@ -26,21 +26,77 @@ def create_app(test_config=None):
     except OSError:
         pass
 
+    from .querystats import query_budget
+
     @app.route("/hello")
+    @query_budget(queries=1, rows=1)
     def hello():
         return "Hello, World!"
 
+    @app.route("/metrics")
+    @query_budget(queries=1, rows=1)
+    def metrics():
+        """Admission control, query time budget, availability check and
+        login throttling counters.
+        """
+        taken = app.extensions.get("taken_filter")
+        return {
+            "admission": app.extensions["admission"].snapshot(),
+            "availability": taken.snapshot() if taken is not None else None,
+            "login_throttle": app.extensions["login_throttle"].snapshot(),
+            "query_timeouts": app.extensions["query_timeouts"].snapshot(),
+        }
+
     # register the database commands
+    from . import admission
+    from . import assets
+    from . import availability
+    from . import compress
     from . import db
+    from . import duplicates
+    from . import events
+    from . import fragments
+    from . import maintenance
+    from . import migrations
+    from . import moderation
+    from . import querystats
+    from . import rating_buffer
+    from . import recommend
+    from . import suggest
+    from . import tags
+    from . import throttle
+    from . import timeouts
 
+    assets.init_app(app)
+    availability.init_app(app)
+    compress.init_app(app)
     db.init_app(app)
+    duplicates.init_app(app)
+    events.init_app(app)
+    fragments.init_app(app)
+    maintenance.init_app(app)
+    migrations.init_app(app)
+    moderation.init_app(app)
+    querystats.init_app(app)
+    rating_buffer.init_app(app)
+    recommend.init_app(app)
+    suggest.init_app(app)
+    tags.init_app(app)
+    throttle.init_app(app)
+    timeouts.init_app(app)
+    # last, so it wraps the finished WSGI app
+    admission.init_app(app)
 
     # apply the blueprints to the app
+    from . import api
     from . import auth
     from . import jokes
 
     app.register_blueprint(auth.bp)
     app.register_blueprint(jokes.bp)
+    app.register_blueprint(api.bp)
+    app.register_blueprint(events.bp)
+    app.register_blueprint(assets.bp)
 
     # make url_for('index') == url_for('blog.index')
     # in another app, you might define a separate main index here with
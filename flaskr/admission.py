@@ -0,0 +1,184 @@
+import threading
+import time
+
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import ClosingIterator
+
+#: Request priorities, most important first.
+CRITICAL = 0
+NORMAL = 1
+LOW = 2
+
+PRIORITY_NAMES = ("critical", "normal", "low")
+
+
+class Admission:
+    """WSGI middleware that bounds how many requests the app works on
+    at once and decides, by priority, which of the rest wait and which
+    are turned away with a ``503``.
+
+    ``classify(environ)`` returns the request's priority, or ``None``
+    for requests that bypass admission, like static files. Low priority
+    requests may use half of the ``limit`` slots and don't wait; normal
+    ones may use all but ``reserved`` of them; critical ones, logins
+    and writes, may use every slot. A request that can't get a slot
+    waits up to ``waits[priority]`` seconds in a queue of at most
+    ``queue_size``, behind every waiting request of higher priority.
+
+    Run the server with more threads than ``limit`` so that excess
+    requests queue here, where they are prioritized, instead of in the
+    server's own unbounded queue.
+    """
+
+    def __init__(
+        self, app, classify, limit, reserved, queue_size, waits, retry_after
+    ):
+        self.app = app
+        self.classify = classify
+        self.limit = limit
+        self.caps = (limit, max(1, limit - reserved), max(1, limit // 2))
+        self.queue_size = queue_size
+        self.waits = waits
+        self.retry_after = retry_after
+        self.condition = threading.Condition()
+        self.inflight = 0
+        self.max_inflight = 0
+        self.waiting = [0, 0, 0]
+        self.admitted = [0, 0, 0]
+        self.shed = [0, 0, 0]
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _can_enter(self, priority):
+        return self.inflight < self.caps[priority] and not any(
+            self.waiting[:priority]
+        )
+
+    def acquire(self, priority):
+        """Take a slot for a request, waiting if its priority allows.
+        Return ``False`` if the request should be shed.
+        """
+        start = time.monotonic()
+        with self.condition:
+            if not self._can_enter(priority):
+                wait = self.waits[priority]
+                if wait <= 0 or sum(self.waiting) >= self.queue_size:
+                    self.shed[priority] += 1
+                    return False
+
+                deadline = start + wait
+                self.waiting[priority] += 1
+                try:
+                    while not self._can_enter(priority):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.shed[priority] += 1
+                            return False
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting[priority] -= 1
+
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            self.admitted[priority] += 1
+            waited = time.monotonic() - start
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return True
+
+    def release(self):
+        with self.condition:
+            self.inflight -= 1
+            self.condition.notify_all()
+
+    def snapshot(self):
+        """Return the limits and counters as a JSON-friendly dict."""
+        with self.condition:
+            admitted = sum(self.admitted)
+            return {
+                "limit": self.limit,
+                "slots": dict(zip(PRIORITY_NAMES, self.caps)),
+                "queue_size": self.queue_size,
+                "inflight": self.inflight,
+                "max_inflight": self.max_inflight,
+                "waiting": dict(zip(PRIORITY_NAMES, self.waiting)),
+                "admitted": dict(zip(PRIORITY_NAMES, self.admitted)),
+                "shed": dict(zip(PRIORITY_NAMES, self.shed)),
+                "wait_avg_ms": round(self.wait_total / admitted * 1000, 1)
+                if admitted
+                else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 1),
+            }
+
+    def __call__(self, environ, start_response):
+        priority = self.classify(environ)
+        if priority is None or self.limit <= 0:
+            return self.app(environ, start_response)
+
+        if not self.acquire(priority):
+            response = Response(
+                "The server is busy. Please try again in a moment.",
+                status=503,
+                headers={"Retry-After": str(self.retry_after)},
+                mimetype="text/plain",
+            )
+            return response(environ, start_response)
+
+        try:
+            app_iter = self.app(environ, start_response)
+        except BaseException:
+            self.release()
+            raise
+        # a streamed body still holds the slot until it's finished
+        return ClosingIterator(app_iter, self.release)
+
+
+def classifier(session_cookie):
+    """Return the ``classify`` function for this app's routes."""
+
+    def classify(environ):
+        path = environ.get("PATH_INFO", "")
+        if path.startswith(("/static/", "/assets/")) or path in ("/events", "/metrics"):
+            # cheap, or long-lived and limited by the event hub
+            return None
+        if environ["REQUEST_METHOD"] not in ("GET", "HEAD") or path.startswith(
+            ("/auth/login", "/auth/register")
+        ):
+            return CRITICAL
+        if path == "/" and f"{session_cookie}=" not in environ.get("HTTP_COOKIE", ""):
+            # anonymous feed reloads
+            return LOW
+        return NORMAL
+
+    return classify
+
+
+def init_app(app):
+    """Put admission control in front of the app. ``ADMISSION_LIMIT``
+    requests are worked on at once; it's off when testing, since the
+    test client doesn't close streamed responses.
+    """
+    app.config.setdefault("ADMISSION_LIMIT", 0 if app.testing else 4)
+    app.config.setdefault("ADMISSION_RESERVED", 1)
+    app.config.setdefault("ADMISSION_QUEUE_SIZE", 32)
+    app.config.setdefault("ADMISSION_CRITICAL_WAIT", 5.0)
+    app.config.setdefault("ADMISSION_NORMAL_WAIT", 1.0)
+    app.config.setdefault("ADMISSION_LOW_WAIT", 0.0)
+    app.config.setdefault("ADMISSION_RETRY_AFTER", 2)
+
+    config = app.config
+    admission = Admission(
+        app.wsgi_app,
+        classifier(config["SESSION_COOKIE_NAME"]),
+        config["ADMISSION_LIMIT"],
+        config["ADMISSION_RESERVED"],
+        config["ADMISSION_QUEUE_SIZE"],
+        (
+            config["ADMISSION_CRITICAL_WAIT"],
+            config["ADMISSION_NORMAL_WAIT"],
+            config["ADMISSION_LOW_WAIT"],
+        ),
+        config["ADMISSION_RETRY_AFTER"],
+    )
+    app.extensions["admission"] = admission
+    app.wsgi_app = admission
@@ -0,0 +1,392 @@
+import functools
+import json
+
+from flask import Blueprint
+from flask import current_app
+from flask import g
+from flask import request
+from werkzeug.exceptions import HTTPException
+from werkzeug.exceptions import abort
+
+from . import events
+from . import ranking
+from . import rating_buffer
+from .db import get_db
+from .jokes import SORTS
+from .jokes import comment_cursor
+from .jokes import parse_comment_cursor
+from .querystats import query_budget
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the json module is used without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, only JSON is offered without it
+    msgpack = None
+
+bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+#: Most jokes, ids or ratings in one request or response.
+MAX_BATCH = 100
+DEFAULT_LIMIT = 20
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+#: What each resource's ``?fields=`` can pick, as the SQL that reads it.
+#: Only the picked ones are selected. Values of the fields in
+#: ``JSON_FIELDS`` come back from SQLite as JSON text.
+JOKE_FIELDS = {
+    "id": "p.id",
+    "title": "p.title",
+    "body": "p.body",
+    "created": "p.created",
+    "author": "u.nickname",
+    "avg_rating": "COALESCE(p.rating_sum * 1.0 / NULLIF(p.rating_count, 0), 0.0)",
+    "rating_count": "p.rating_count",
+    "score": "p.score",
+    "comment_count": "(SELECT COUNT(*) FROM comment WHERE post_id = p.id)",
+    "tags": """(SELECT json_group_array(t.name) FROM post_tag pt
+                JOIN tag t ON t.id = pt.tag_id WHERE pt.post_id = p.id)""",
+}
+COMMENT_FIELDS = {
+    "id": "c.id",
+    "body": "c.body",
+    "created": "c.created",
+    "author": "u.nickname",
+}
+USER_FIELDS = {
+    "id": "u.id",
+    "nickname": "u.nickname",
+    # stored as text by CURRENT_TIMESTAMP
+    "created": "CAST(strftime('%s', u.created) AS INTEGER)",
+    "joke_count": "(SELECT COUNT(*) FROM post WHERE author_id = u.id)",
+    "comment_count": "(SELECT COUNT(*) FROM comment WHERE user_id = u.id)",
+    "ratings_received": """(SELECT COALESCE(SUM(rating_count), 0) FROM post
+                            WHERE author_id = u.id)""",
+}
+JSON_FIELDS = frozenset({"tags"})
+
+#: Jokes by a JSON array of ids, and a page of a joke's comments after a
+#: ``(created, id)`` cursor; formatted with the picked fields' SQL as
+#: ``columns``.
+JOKES_BY_ID = """
+    SELECT {columns} FROM post p JOIN user u ON u.id = p.author_id
+    WHERE p.id IN (SELECT value FROM json_each(?))
+"""
+COMMENTS_PAGE = """
+    SELECT c.created, c.id, {columns}
+    FROM comment c JOIN user u ON u.id = c.user_id
+    WHERE c.post_id = ? AND (c.created, c.id) > (?, ?)
+    ORDER BY c.created, c.id
+    LIMIT ?
+"""
+
+
+def _mimetype():
+    """The response type the client asked for, ``None`` if it accepts
+    nothing offered. JSON unless msgpack is preferred.
+    """
+    if not request.accept_mimetypes:
+        return JSON
+    offered = [JSON, MSGPACK] if msgpack is not None else [JSON]
+    return request.accept_mimetypes.best_match(offered)
+
+
+def dumps(data, mimetype):
+    if mimetype == MSGPACK:
+        return msgpack.packb(data, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def respond(data, status=200):
+    """Serialize ``data`` as the client negotiated, or answer 406."""
+    mimetype = _mimetype()
+    if mimetype is None:
+        status, data, mimetype = 406, {"error": "Accepts application/json"}, JSON
+        if msgpack is not None:
+            data["error"] += " or application/msgpack"
+    response = current_app.response_class(dumps(data, mimetype), status, mimetype=mimetype)
+    response.vary.add("Accept")
+    return response
+
+
+def payload():
+    """The request body, an object, as msgpack if it says so,
+    otherwise JSON whatever the content type.
+    """
+    if request.mimetype == MSGPACK and msgpack is not None:
+        try:
+            return _object(msgpack.unpackb(request.get_data()))
+        except ValueError:
+            abort(400, "The body isn't valid msgpack.")
+    data = request.get_json(force=True, silent=True)
+    if data is None:
+        abort(400, "Send a JSON or msgpack body.")
+    return _object(data)
+
+
+def _object(data):
+    if not isinstance(data, dict):
+        abort(400, "The body must be an object.")
+    return data
+
+
+def fields(available):
+    """Return the ``?fields=`` picked from ``available``, all by default."""
+    picked = request.args.get("fields")
+    if not picked:
+        return list(available)
+    picked = list(dict.fromkeys(name.strip() for name in picked.split(",")))
+    unknown = [name for name in picked if name not in available]
+    if unknown:
+        abort(400, f"Unknown fields {', '.join(unknown)}; choose from {', '.join(available)}.")
+    return picked
+
+
+def select(available, names):
+    """The SELECT list reading ``names`` of ``available``."""
+    return ", ".join(f"{available[name]} AS {name}" for name in names)
+
+
+def objects(rows, names):
+    """The rows as dicts of ``names``, JSON fields decoded."""
+    decode = [name for name in names if name in JSON_FIELDS]
+    result = []
+    for row in rows:
+        item = dict(zip(names, row))
+        for name in decode:
+            item[name] = json.loads(item[name])
+        result.append(item)
+    return result
+
+
+def int_arg(name, default, low, high):
+    value = request.args.get(name, default, type=int)
+    if value is None or not low <= value <= high:
+        abort(400, f"{name} must be a whole number from {low} to {high}.")
+    return value
+
+
+def api_login_required(view):
+    """Answer 401 instead of redirecting to the login page."""
+
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        if g.user is None:
+            abort(401, "Log in first.")
+        return view(**kwargs)
+
+    return wrapped_view
+
+
+@bp.errorhandler(HTTPException)
+def error(e):
+    return respond({"error": e.description}, e.code)
+
+
+@bp.route("/jokes")
+@query_budget(queries=2, rows=1 + MAX_BATCH)
+def jokes():
+    """List jokes in a feed order, ``?limit=`` at a time from
+    ``?offset=``, or with ``?ids=1,2,3`` fetch those jokes in one query,
+    in the order asked for; ids not found are listed under ``missing``.
+    """
+    names = fields(JOKE_FIELDS)
+    # the id is read anyway to put the batch in order
+    columns = select(JOKE_FIELDS, ["id"] + names)
+    db = get_db()
+
+    if "ids" in request.args:
+        try:
+            ids = list(dict.fromkeys(int(id) for id in request.args["ids"].split(",")))
+        except ValueError:
+            abort(400, "ids must be comma separated joke ids.")
+        if len(ids) > MAX_BATCH:
+            abort(400, f"Ask for at most {MAX_BATCH} jokes at a time.")
+        rows = db.execute(
+            JOKES_BY_ID.format(columns=columns), (json.dumps(ids),)
+        ).fetchall()
+        found = {row[0]: row[1:] for row in rows}
+        return respond(
+            {
+                "jokes": objects([found[id] for id in ids if id in found], names),
+                "missing": [id for id in ids if id not in found],
+            }
+        )
+
+    sort = request.args.get("sort", "top")
+    if sort not in SORTS:
+        abort(400, f"sort must be one of {', '.join(SORTS)}.")
+    limit = int_arg("limit", DEFAULT_LIMIT, 1, MAX_BATCH)
+    offset = int_arg("offset", 0, 0, 2**31)
+    rows = db.execute(
+        f"""SELECT {columns} FROM post p JOIN user u ON u.id = p.author_id
+            ORDER BY {SORTS[sort]} LIMIT ? OFFSET ?""",
+        (limit, offset),
+    ).fetchall()
+    return respond({"jokes": objects([row[1:] for row in rows], names)})
+
+
+@bp.route("/jokes/<int:id>")
+@query_budget(queries=2, rows=2)
+def joke(id):
+    names = fields(JOKE_FIELDS)
+    row = get_db().execute(
+        f"""SELECT {select(JOKE_FIELDS, names)}
+            FROM post p JOIN user u ON u.id = p.author_id WHERE p.id = ?""",
+        (id,),
+    ).fetchone()
+    if row is None:
+        abort(404, f"Joke id {id} doesn't exist.")
+    return respond(objects([row], names)[0])
+
+
+@bp.route("/jokes/<int:id>/comments")
+@query_budget(queries=3, rows=2 + MAX_BATCH)
+def comments(id):
+    """A joke's comments, oldest first, ``?limit=`` at a time. Pass the
+    response's ``next`` as ``?after=`` for the following page; pages
+    are read off ``comment_post_created`` from where the last ended.
+    """
+    names = fields(COMMENT_FIELDS)
+    limit = int_arg("limit", DEFAULT_LIMIT, 1, MAX_BATCH)
+    after = request.args.get("after", "")
+    try:
+        created, last_id = parse_comment_cursor(after)
+    except ValueError:
+        abort(400, "after must be the next value of a previous page.")
+
+    db = get_db()
+    # one extra row tells whether there's a next page
+    rows = db.execute(
+        COMMENTS_PAGE.format(columns=select(COMMENT_FIELDS, names)),
+        (id, created, last_id, limit + 1),
+    ).fetchall()
+    if not rows and not after:
+        # only an empty first page pays for telling "none" from "no joke"
+        if db.execute("SELECT 1 FROM post WHERE id = ?", (id,)).fetchone() is None:
+            abort(404, f"Joke id {id} doesn't exist.")
+
+    page = rows[:limit]
+    more = len(rows) > limit
+    return respond(
+        {
+            "comments": objects([row[2:] for row in page], names),
+            "next": comment_cursor(page[-1][0], page[-1][1]) if more else None,
+        }
+    )
+
+
+@bp.route("/users/<nickname>")
+@query_budget(queries=2, rows=2)
+def user(nickname):
+    names = fields(USER_FIELDS)
+    row = get_db().execute(
+        f"SELECT {select(USER_FIELDS, names)} FROM user u WHERE u.nickname = ?",
+        (nickname,),
+    ).fetchone()
+    if row is None:
+        abort(404, f"User {nickname} doesn't exist.")
+    return respond(objects([row], names)[0])
+
+
+def _rate(ratings):
+    """Store the current user's ``{joke_id: rating}`` and return the
+    rated jokes' ``{joke_id: (average, count)}``, leaving out jokes that
+    don't exist.
+
+    All of them are upserted by one statement and rescored by another,
+    or go through the rating buffer if ratings are written behind.
+    """
+    db = get_db()
+    user_id = g.user["id"]
+    buffer = rating_buffer.get_buffer(current_app)
+
+    if buffer is not None:
+        existing = db.execute(
+            "SELECT id FROM post WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(ratings)),),
+        ).fetchall()
+        return {
+            row[0]: buffer.rate(db, row[0], user_id, ratings[row[0]]) for row in existing
+        }
+
+    db.execute(
+        """INSERT INTO rating (post_id, user_id, rating)
+           SELECT p.id, ?, json_extract(r.value, '$[1]')
+           FROM json_each(?) AS r
+           JOIN post p ON p.id = json_extract(r.value, '$[0]')
+           WHERE true
+           ON CONFLICT(post_id, user_id)
+           DO UPDATE SET rating = excluded.rating, created = excluded.created""",
+        (user_id, json.dumps(list(ratings.items()))),
+    )
+    scores = ranking.rescore_many(db, ratings)
+    db.commit()
+    return scores
+
+
+def _check_rating(joke_id, rating):
+    if type(joke_id) is not int or type(rating) is not int or not 1 <= rating <= 5:
+        abort(400, "Each rating needs an integer joke_id and a rating from 1 to 5.")
+
+
+def _publish(scores):
+    for joke_id, (avg_rating, rating_count) in scores.items():
+        events.publish(
+            "rating", joke_id, avg_rating=round(avg_rating, 1), rating_count=rating_count
+        )
+
+
+@bp.route("/jokes/<int:id>/rating", methods=("PUT",))
+@api_login_required
+@query_budget(queries=4, rows=4)
+def rate(id):
+    """Rate a joke with ``{"rating": 1-5}``."""
+    rating = payload().get("rating")
+    _check_rating(id, rating)
+    scores = _rate({id: rating})
+    if id not in scores:
+        abort(404, f"Joke id {id} doesn't exist.")
+    _publish(scores)
+    avg_rating, rating_count = scores[id]
+    return respond({"joke_id": id, "avg_rating": avg_rating, "rating_count": rating_count})
+
+
+@bp.route("/ratings", methods=("POST",))
+@api_login_required
+@query_budget(queries=3 + 2 * MAX_BATCH, rows=1 + 3 * MAX_BATCH)
+def rate_many():
+    """Rate up to ``MAX_BATCH`` jokes at once with ``{"ratings":
+    [{"joke_id": 1, "rating": 4}, ...]}``; a joke rated twice keeps the
+    last. Jokes that don't exist are listed under ``missing``.
+    """
+    items = payload().get("ratings")
+    if not isinstance(items, list) or not items:
+        abort(400, "Send a list of ratings.")
+    if len(items) > MAX_BATCH:
+        abort(400, f"Send at most {MAX_BATCH} ratings at a time.")
+    ratings = {}
+    for item in items:
+        if not isinstance(item, dict):
+            abort(400, "Each rating needs an integer joke_id and a rating from 1 to 5.")
+        _check_rating(item.get("joke_id"), item.get("rating"))
+        ratings[item["joke_id"]] = item["rating"]
+
+    scores = _rate(ratings)
+    _publish(scores)
+    return respond(
+        {
+            "ratings": [
+                {"joke_id": id, "avg_rating": avg, "rating_count": count}
+                for id, (avg, count) in scores.items()
+            ],
+            "missing": [id for id in ratings if id not in scores],
+        }
+    )
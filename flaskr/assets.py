@@ -0,0 +1,157 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import Blueprint
+from flask import abort
+from flask import current_app
+from flask import request
+from flask import send_from_directory
+from flask import url_for
+from flask.cli import with_appcontext
+
+from .querystats import query_budget
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, only .gz variants are written
+    brotli = None
+
+bp = Blueprint("assets", __name__, url_prefix="/assets")
+
+#: Files under static/ that go through the build.
+SOURCES = ["style.css", "jokes.js", "joke-form.js", "register.js", "user-search.js"]
+
+#: Served from a fingerprinted name, so the content never changes.
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+#: Precompressed variants by content coding, in order of preference.
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def minify_css(text):
+    """Drop comments and the whitespace around CSS punctuation."""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify_js(text):
+    """Conservatively minify JavaScript: strip indentation, blank lines
+    and whole-line ``//`` comments. Anything that would need a parser to
+    do safely is left alone.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+
+MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+def build_assets(static_folder, output, sources=SOURCES):
+    """Minify and fingerprint ``sources``, write them with ``.gz`` (and
+    ``.br`` if brotli is installed) variants to ``output`` and return
+    the manifest mapping each source name to its fingerprinted name.
+    """
+    os.makedirs(output, exist_ok=True)
+    manifest = {}
+
+    for name in sources:
+        root, ext = os.path.splitext(name)
+        with open(os.path.join(static_folder, name), encoding="utf8") as f:
+            data = MINIFIERS[ext](f.read()).encode("utf8")
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        built = f"{root}.{digest}{ext}"
+        path = os.path.join(output, built)
+
+        with open(path, "wb") as f:
+            f.write(data)
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            with open(path + ".br", "wb") as f:
+                f.write(brotli.compress(data))
+
+        manifest[name] = built
+
+    with open(os.path.join(output, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def load_manifest(output):
+    try:
+        with open(os.path.join(output, "manifest.json")) as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+
+def asset_url(filename):
+    """Like ``url_for('static', filename=...)``, but resolves to the
+    fingerprinted build of the file when there is one.
+    """
+    built = current_app.extensions["assets"].get(filename)
+    if built is None:
+        return url_for("static", filename=filename)
+    return url_for("assets.asset", filename=built)
+
+
+@bp.route("/<path:filename>")
+@query_budget(queries=1, rows=1)
+def asset(filename):
+    """Serve a built asset, preferring a precompressed variant the
+    client accepts, with a far-future immutable cache policy.
+    """
+    if filename not in current_app.extensions["assets"].values():
+        abort(404)
+
+    output = current_app.config["ASSET_OUTPUT"]
+    mimetype = mimetypes.guess_type(filename)[0]
+    # the variants there are, brotli first on a tie; q=0 refuses one
+    offered = [
+        candidate
+        for candidate, suffix in SUFFIXES.items()
+        if os.path.exists(os.path.join(output, filename + suffix))
+    ]
+    encoding = request.accept_encodings.best_match(offered)
+    if encoding is not None:
+        filename += SUFFIXES[encoding]
+
+    response = send_from_directory(output, filename, mimetype=mimetype)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@click.command("assets-build")
+@with_appcontext
+def assets_build_command():
+    """Minify, fingerprint and precompress the static assets."""
+    output = current_app.config["ASSET_OUTPUT"]
+    manifest = build_assets(current_app.static_folder, output)
+    current_app.extensions["assets"] = manifest
+    for name, built in manifest.items():
+        click.echo(f"{name} -> {built}")
+    if brotli is None:
+        click.echo("brotli is not installed, only gzip variants were written.")
+
+
+def init_app(app):
+    """Load the asset manifest and register the ``asset_url`` template
+    helper and the ``assets-build`` command.
+    """
+    app.config.setdefault("ASSET_OUTPUT", os.path.join(app.static_folder, "dist"))
+    app.extensions["assets"] = load_manifest(app.config["ASSET_OUTPUT"])
+    app.add_template_global(asset_url)
+    app.cli.add_command(assets_build_command)
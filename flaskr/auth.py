@@ -1,9 +1,12 @@
 import functools
+import math
 import re
 
 from flask import Blueprint
+from flask import current_app
 from flask import flash
 from flask import g
+from flask import jsonify
 from flask import redirect
 from flask import render_template
 from flask import request
@@ -12,10 +15,48 @@ from flask import url_for
 from werkzeug.security import check_password_hash
 from werkzeug.security import generate_password_hash
 
+from . import availability
+from . import suggest
+from . import throttle
 from .db import get_db
+from .db import records
+from .fragments import render_page
+from .querystats import query_budget
 
 bp = Blueprint("auth", __name__, url_prefix="/auth")
 
+#: A user by email or nickname, off the unique index on each.
+USER_BY_NAME = "SELECT * FROM user WHERE username = ? OR nickname = ?"
+
+#: A user's jokes with their stored ratings, newest first, for the
+#: profile, read off ``post_author_created``.
+PROFILE_JOKES = """
+    SELECT p.id, p.title, p.body, p.created, p.rating_count,
+           COALESCE(p.rating_sum * 1.0 / NULLIF(p.rating_count, 0), 0) as avg_rating
+    FROM post p
+    WHERE p.author_id = ?
+    ORDER BY p.created DESC
+"""
+
+#: The profile's totals over a user's jokes.
+PROFILE_JOKE_COUNT = "SELECT COUNT(*) as count FROM post WHERE author_id = ?"
+PROFILE_RATINGS = """
+    SELECT COUNT(*) as count FROM rating r
+    JOIN post p ON r.post_id = p.id
+    WHERE p.author_id = ?
+"""
+PROFILE_COMMENTS = """
+    SELECT COUNT(*) as count FROM comment c
+    JOIN post p ON c.post_id = p.id
+    WHERE p.author_id = ?
+"""
+PROFILE_AVG_RATING = """
+    SELECT COALESCE(AVG(r.rating), 0) as avg_rating
+    FROM rating r
+    JOIN post p ON r.post_id = p.id
+    WHERE p.author_id = ?
+"""
+
 
 def is_valid_email(email):
     """Validate email format using regex."""
@@ -59,6 +100,7 @@ def load_logged_in_user():
 
 
 @bp.route("/register", methods=("GET", "POST"))
+@query_budget(queries=4, rows=3)
 def register():
     """Register a new user.
 
@@ -105,6 +147,8 @@ def register():
             except db.IntegrityError:
                 error = "An error occurred during registration. Please try again."
             else:
+                availability.add(username, nickname)
+                suggest.add(nickname)
                 # Success, go to the login page.
                 flash("Account created successfully! Please log in.")
                 return redirect(url_for("auth.login"))
@@ -115,6 +159,7 @@ def register():
 
 
 @bp.route("/login", methods=("GET", "POST"))
+@query_budget(queries=2, rows=2)
 def login():
     """Log in a registered user by adding the user id to the session."""
     if request.method == "POST":
@@ -128,15 +173,31 @@ def login():
         elif not password:
             error = "Password is required."
         else:
-            user = db.execute(
-                "SELECT * FROM user WHERE username = ? OR nickname = ?", (identifier, identifier)
-            ).fetchone()
+            # turned away before the lookup and the password hash
+            login_throttle = throttle.get_throttle()
+            key = throttle.normalize(identifier)
+            address = throttle.client_address()
+            wait = math.ceil(login_throttle.retry_after(key, address))
+            if wait:
+                flash(f"Too many failed attempts. Please try again in {wait} seconds.")
+                return (
+                    render_template("auth/login.html"),
+                    429,
+                    {"Retry-After": str(wait)},
+                )
+
+            user = db.execute(USER_BY_NAME, (identifier, identifier)).fetchone()
 
             if user is None:
                 error = "Invalid email/nickname or password."
             elif not check_password_hash(user["password"], password):
                 error = "Invalid email/nickname or password."
 
+            if error is None:
+                login_throttle.succeeded(key)
+            else:
+                login_throttle.failed(key, address)
+
         if error is None:
             # store the user id in a new session and return to the index
             session.clear()
@@ -148,7 +209,42 @@ def login():
     return render_template("auth/login.html")
 
 
+@bp.route("/users/suggest")
+@query_budget(queries=2)
+def suggest_users():
+    """Return the first ``SUGGEST_COUNT`` nicknames starting with
+    ``?q=``, for autocompleting as the user types. Rows are unbounded
+    since the first call fills the in-memory index.
+    """
+    prefix = request.args.get("q", "").strip()
+    if not prefix:
+        return jsonify({"q": prefix, "nicknames": []})
+    nicknames = suggest.suggest(get_db(), prefix, current_app.config["SUGGEST_COUNT"])
+    return jsonify({"q": prefix, "nicknames": nicknames})
+
+
+@bp.route("/available")
+@query_budget(queries=3)
+def available():
+    """Tell the register form whether ``?email=`` or ``?nickname=`` is
+    still free, as the user types. Most answers come from the Bloom
+    filter without a query.
+    """
+    for field in availability.FIELDS:
+        value = request.args.get(field, "").strip()
+        if value:
+            return jsonify(
+                {
+                    "field": field,
+                    "value": value,
+                    "available": availability.is_available(get_db(), field, value),
+                }
+            )
+    return jsonify({"message": "Pass an email or a nickname."}), 400
+
+
 @bp.route("/logout")
+@query_budget(queries=1, rows=1)
 def logout():
     """Clear the current session, including the stored user id."""
     session.clear()
@@ -156,68 +252,41 @@ def logout():
 
 
 
+def _profile_jokes(user_id):
+    """Yield the user's jokes with their ratings as they are read."""
+    yield from records(PROFILE_JOKES, (user_id,))
+
+
 @bp.route("/profile/<username>")
+@query_budget(queries=7, seconds=2.0)
 def profile(username):
     """Display user profile with stats and jokes."""
     db = get_db()
     
     # Fetch user by username (email) or nickname
-    user = db.execute(
-        "SELECT * FROM user WHERE username = ? OR nickname = ?", 
-        (username, username)
-    ).fetchone()
+    user = next(records(USER_BY_NAME, (username, username)), None)
     
     if user is None:
         flash(f"User '{username}' not found.")
         return redirect(url_for("index"))
     
-    # Get user's jokes with ratings
-    user_jokes = db.execute(
-        """SELECT p.*, u.nickname as username, 
-           COUNT(DISTINCT r.id) as rating_count,
-           COALESCE(AVG(r.rating), 0) as avg_rating
-           FROM post p
-           JOIN user u ON p.author_id = u.id
-           LEFT JOIN rating r ON p.id = r.post_id
-           WHERE p.author_id = ?
-           GROUP BY p.id
-           ORDER BY p.created DESC""",
-        (user["id"],)
-    ).fetchall()
-    
     # Calculate engagement metrics
-    total_jokes = len(user_jokes)
-    total_ratings = db.execute(
-        """SELECT COUNT(*) as count FROM rating r
-           JOIN post p ON r.post_id = p.id
-           WHERE p.author_id = ?""",
-        (user["id"],)
-    ).fetchone()["count"]
+    total_jokes = db.execute(PROFILE_JOKE_COUNT, (user.id,)).fetchone()["count"]
+    total_ratings = db.execute(PROFILE_RATINGS, (user.id,)).fetchone()["count"]
     
-    total_comments = db.execute(
-        """SELECT COUNT(*) as count FROM comment c
-           JOIN post p ON c.post_id = p.id
-           WHERE p.author_id = ?""",
-        (user["id"],)
-    ).fetchone()["count"]
+    total_comments = db.execute(PROFILE_COMMENTS, (user.id,)).fetchone()["count"]
     
     # Calculate average rating across all jokes
-    avg_rating_result = db.execute(
-        """SELECT COALESCE(AVG(r.rating), 0) as avg_rating
-           FROM rating r
-           JOIN post p ON r.post_id = p.id
-           WHERE p.author_id = ?""",
-        (user["id"],)
-    ).fetchone()
+    avg_rating_result = db.execute(PROFILE_AVG_RATING, (user.id,)).fetchone()
     overall_avg_rating = round(avg_rating_result["avg_rating"], 2)
     
     # Engagement score: weighted combination of jokes, ratings, comments
     engagement_score = (total_jokes * 10) + (total_ratings * 2) + (total_comments * 3)
     
-    return render_template(
+    return render_page(
         "auth/profile.html",
         profile_user=user,
-        user_jokes=user_jokes,
+        user_jokes=_profile_jokes(user.id),
         total_jokes=total_jokes,
         total_ratings=total_ratings,
         total_comments=total_comments,
@@ -0,0 +1,152 @@
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+
+from flask import current_app
+
+#: The user column each registration field is checked against.
+FIELDS = {"email": "username", "nickname": "nickname"}
+
+
+class BloomFilter:
+    """A set that can answer "definitely not in it" from ``capacity``
+    items in about ``1.44 * log2(1 / error_rate)`` bits each, wrong in
+    the other direction at most ``error_rate`` of the time.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # k positions from two 64-bit hashes, h1 + i * h2
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+
+class TakenFilter:
+    """A :class:`BloomFilter` of every email and nickname in use.
+
+    Filled on first use, then kept up by :meth:`add` on register and by
+    reading the users registered since, by id, every ``refresh``
+    seconds. Once it holds more than its capacity, it is rebuilt twice
+    as large so the error rate holds.
+    """
+
+    def __init__(self, capacity, error_rate, refresh):
+        self.error_rate = error_rate
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.last_id = 0
+        self.checked = None
+        self.counts_lock = threading.Lock()
+        self.answers = Counter()
+
+    def add(self, field, value):
+        with self.lock:
+            self.bloom.add(f"{field}:{value}")
+
+    def catch_up(self, db):
+        """Add the users registered since the last look, if it's been
+        ``refresh`` seconds. Returns ``False`` without waiting when the
+        first fill is under way in another request.
+        """
+        now = time.monotonic()
+        if self.checked is not None and now - self.checked < self.refresh:
+            return True
+        if not self.lock.acquire(blocking=False):
+            return self.checked is not None
+        try:
+            if self.bloom.count > self.bloom.capacity:
+                self.bloom = BloomFilter(self.bloom.capacity * 2, self.error_rate)
+                self.last_id = 0
+            rows = db.execute(
+                "SELECT id, username, nickname FROM user WHERE id > ? ORDER BY id",
+                (self.last_id,),
+            ).fetchall()
+            for id, email, nickname in rows:
+                self.bloom.add(f"email:{email}")
+                self.bloom.add(f"nickname:{nickname}")
+            if rows:
+                self.last_id = rows[-1][0]
+            self.checked = now
+        finally:
+            self.lock.release()
+        return True
+
+    def may_be_taken(self, field, value):
+        return f"{field}:{value}" in self.bloom
+
+    def count(self, answer):
+        with self.counts_lock:
+            self.answers[answer] += 1
+
+    def snapshot(self):
+        with self.counts_lock:
+            answers = dict(self.answers)
+        return {"items": self.bloom.count, "bits": self.bloom.size, "answers": answers}
+
+
+def is_available(db, field, value):
+    """Return whether no user has ``value`` as their ``field``, asking
+    the database only if the Bloom filter says it may be taken or isn't
+    filled yet.
+    """
+    taken = current_app.extensions.get("taken_filter")
+    filtered = taken is not None and taken.catch_up(db)
+    if filtered:
+        if not taken.may_be_taken(field, value):
+            taken.count("free")
+            return True
+        taken.count("lookup")
+
+    column = FIELDS[field]
+    found = db.execute(
+        f"SELECT 1 FROM user WHERE {column} = ?", (value,)
+    ).fetchone()
+    if filtered and found is None:
+        taken.count("false_positive")
+    return found is None
+
+
+def add(email, nickname):
+    """Add a newly registered user to the Bloom filter."""
+    taken = current_app.extensions.get("taken_filter")
+    if taken is not None:
+        taken.add("email", email)
+        taken.add("nickname", nickname)
+
+
+def init_app(app):
+    """Keep a Bloom filter of taken emails and nicknames for
+    ``/auth/available`` unless ``AVAILABILITY_BLOOM`` is off. It starts
+    sized for ``AVAILABILITY_CAPACITY`` users.
+    """
+    app.config.setdefault("AVAILABILITY_BLOOM", True)
+    app.config.setdefault("AVAILABILITY_CAPACITY", 100_000)
+    app.config.setdefault("AVAILABILITY_ERROR_RATE", 0.01)
+    app.config.setdefault("AVAILABILITY_REFRESH", 5.0)
+    if app.config["AVAILABILITY_BLOOM"]:
+        # two keys per user
+        app.extensions["taken_filter"] = TakenFilter(
+            2 * app.config["AVAILABILITY_CAPACITY"],
+            app.config["AVAILABILITY_ERROR_RATE"],
+            app.config["AVAILABILITY_REFRESH"],
+        )
@@ -0,0 +1,138 @@
+import gzip
+import zlib
+
+from flask import current_app
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is used without it
+    brotli = None
+
+
+class _GzipStream:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        # a sync flush ends a block, so what was sent so far can be decoded
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+def _negotiate():
+    """Pick the best encoding the client accepts, preferring brotli."""
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offered)
+
+
+def _stream(chunks, iterable, stream, flush_size):
+    """Compress the chunks, flushing the first at once so the page starts
+    rendering, then only once ``flush_size`` bytes are waiting. Each
+    flush ends a block, so flushing every small chunk costs more bytes
+    than it saves.
+    """
+    flushed = False
+    pending = 0
+    try:
+        for data in chunks:
+            if not data:
+                continue
+            output = stream.compress(data)
+            pending += len(data)
+            if not flushed or pending >= flush_size:
+                output += stream.flush()
+                flushed = True
+                pending = 0
+            if output:
+                yield output
+        yield stream.finish()
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+
+
+def compress_response(response):
+    """Compress HTML and JSON responses with gzip or brotli.
+
+    Responses that are already encoded, like the precompressed assets,
+    and files sent with ``send_file`` are left alone. Buffered responses
+    smaller than ``COMPRESS_MIN_SIZE`` are sent as is; streamed
+    responses are compressed as they are produced and sent every
+    ``COMPRESS_FLUSH_SIZE`` bytes.
+    """
+    config = current_app.config
+
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in config["COMPRESS_MIMETYPES"]
+        or "no-transform" in response.headers.get("Cache-Control", "")
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = _negotiate()
+    if encoding is None:
+        return response
+
+    if encoding == "br":
+        stream = _BrotliStream(config["COMPRESS_BR_QUALITY"])
+    else:
+        stream = _GzipStream(config["COMPRESS_LEVEL"])
+
+    if response.is_streamed:
+        response.response = _stream(
+            response.iter_encoded(), response.response, stream,
+            config["COMPRESS_FLUSH_SIZE"],
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config["COMPRESS_MIN_SIZE"]:
+            return response
+        if encoding == "br":
+            data = brotli.compress(data, quality=config["COMPRESS_BR_QUALITY"])
+        else:
+            data = gzip.compress(data, config["COMPRESS_LEVEL"], mtime=0)
+        response.set_data(data)
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app):
+    """Compress the app's responses according to its ``COMPRESS_*``
+    config.
+    """
+    app.config.setdefault("COMPRESS_MIMETYPES", {"text/html", "application/json"})
+    app.config.setdefault("COMPRESS_LEVEL", 6)
+    app.config.setdefault("COMPRESS_BR_QUALITY", 4)
+    app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+    app.config.setdefault("COMPRESS_FLUSH_SIZE", 16 * 1024)
+    app.after_request(compress_response)
@@ -1,10 +1,16 @@
+import functools
 import sqlite3
+from collections import namedtuple
 from datetime import datetime
+from datetime import timedelta
 
 import click
 from flask import current_app
 from flask import g
 
+from . import querystats
+from . import timeouts
+
 
 def get_db():
     """Connect to the application's configured database. The connection
@@ -12,14 +18,67 @@ def get_db():
     again.
     """
     if "db" not in g:
-        g.db = sqlite3.connect(
-            current_app.config["DATABASE"], detect_types=sqlite3.PARSE_DECLTYPES
-        )
+        g.db = querystats.connect(current_app.config["DATABASE"])
+        timeouts.watch(g.db)
         g.db.row_factory = sqlite3.Row
 
     return g.db
 
 
+#: Columns holding timestamps, decoded to ``datetime`` when first read.
+TIMESTAMP_COLUMNS = frozenset({"created"})
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def parse_timestamp(value):
+    """Decode a stored timestamp to a naive UTC ``datetime``. Accepts
+    epoch seconds and, for rows written before migration 5, the text
+    ``CURRENT_TIMESTAMP`` produces.
+    """
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return _EPOCH + timedelta(seconds=value)
+
+
+def _timestamp_field(index):
+    def get(record):
+        value = record[index]
+        # epoch seconds, the common case, without a call per read
+        if type(value) is int:
+            return _EPOCH + timedelta(seconds=value)
+        return None if value is None else parse_timestamp(value)
+
+    return property(get)
+
+
+@functools.lru_cache(maxsize=256)
+def record_type(names):
+    """Return the row type for a result with the given column names: a
+    named tuple whose timestamp columns are decoded on access.
+    """
+    base = namedtuple("Record", names, rename=True)
+    namespace = {"__slots__": ()}
+    for index, name in enumerate(base._fields):
+        if name in TIMESTAMP_COLUMNS:
+            namespace[name] = _timestamp_field(index)
+    return type("Record", (base,), namespace)
+
+
+def records(sql, params=()):
+    """Run a query on the request's connection and iterate over its rows
+    as compact records, read with attribute access (``row.title``).
+
+    Rows are plain tuples built in C; nothing is decoded until it's read,
+    so unused timestamps cost nothing.
+    """
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    names = tuple(column[0] for column in cursor.description)
+    return map(functools.partial(tuple.__new__, record_type(names)), cursor)
+
+
 def close_db(e=None):
     """If this request connected to the database, close the
     connection.
@@ -45,9 +104,6 @@ def init_db_command():
     click.echo("Initialized the database.")
 
 
-sqlite3.register_converter("timestamp", lambda v: datetime.fromisoformat(v.decode()))
-
-
 def init_app(app):
     """Register database functions with the Flask app. This is called by
     the application factory.
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import random
+import re
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .db import get_db
+
+#: MinHash permutations, cut into ``BANDS`` bands of ``ROWS`` for LSH.
+#: Two jokes become candidates when every value of one band matches,
+#: which gets likely from a Jaccard similarity of about
+#: ``(1 / BANDS) ** (1 / ROWS)``, 0.5, up.
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+
+#: Most jokes read back as candidates for one new joke. Only a bucket
+#: shared by many near-identical jokes gets near it.
+MAX_CANDIDATES = 50
+
+#: Jokes are compared as sets of character 4-grams of their normalized
+#: text, which tolerates small rewordings and typos.
+SHINGLE = 4
+
+_PRIME = (1 << 61) - 1
+_random = random.Random(42)
+#: ``(a, b)`` of each permutation ``(a * x + b) % _PRIME``. Fixed, since
+#: the stored buckets are only comparable under the same permutations.
+_PERMUTATIONS = [
+    (_random.randrange(1, _PRIME), _random.randrange(_PRIME))
+    for _ in range(PERMUTATIONS)
+]
+
+
+#: The jokes sharing a bucket with the JSON array of buckets ``?``, the
+#: one of each band, found by primary key lookups on ``post_lsh``.
+CANDIDATES = """
+    SELECT id, title, body FROM post
+    WHERE id IN (SELECT l.post_id FROM json_each(?) AS b
+                 JOIN post_lsh l ON l.band = b.key AND l.bucket = b.value)
+    LIMIT ?
+"""
+
+
+def shingles(text):
+    """Return the set of 4-grams of ``text``, lowercased, with runs of
+    anything but letters and digits read as one space.
+    """
+    text = " " + re.sub(r"[\W_]+", " ", text.lower()).strip() + " "
+    return {text[i : i + SHINGLE] for i in range(max(1, len(text) - SHINGLE + 1))}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _hash(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def signature(shingle_set):
+    """Return the MinHash signature of a shingle set: the smallest value
+    of each permutation over the shingles' hashes.
+    """
+    values = [_hash(shingle.encode()) for shingle in shingle_set]
+    return [min((a * x + b) % _PRIME for x in values) for a, b in _PERMUTATIONS]
+
+
+def buckets(signature):
+    """Return the LSH bucket of each band of a signature, as signed
+    64-bit ints that SQLite can store.
+    """
+    return [
+        _hash(repr(signature[band * ROWS : (band + 1) * ROWS]).encode())
+        - (1 << 63)
+        for band in range(BANDS)
+    ]
+
+
+def buckets_of(text):
+    return buckets(signature(shingles(text)))
+
+
+def find(db, text, threshold, exclude=None):
+    """Return the jokes whose body is at least ``threshold`` alike
+    ``text`` as ``(similarity, id, title)``, most alike first, and the
+    text's LSH buckets for :func:`index`.
+
+    Only the jokes sharing a bucket are read, and their similarity is
+    checked on their current body.
+    """
+    shingle_set = shingles(text)
+    text_buckets = buckets(signature(shingle_set))
+    candidates = db.execute(
+        CANDIDATES, (json.dumps(text_buckets), MAX_CANDIDATES)
+    ).fetchall()
+
+    found = []
+    for id, title, body in candidates:
+        similarity = jaccard(shingle_set, shingles(body))
+        if id != exclude and similarity >= threshold:
+            found.append((similarity, id, title))
+    found.sort(reverse=True)
+    return found, text_buckets
+
+
+def index(db, post_id, post_buckets):
+    """Add a joke to the LSH index under the buckets of its body, in
+    one statement.
+
+    The buckets of an earlier body stay until ``flask find-duplicates``
+    rebuilds the index; they only cost a wasted candidate, since
+    candidates are checked against their current body.
+    """
+    db.execute(
+        "INSERT OR IGNORE INTO post_lsh (band, bucket, post_id)"
+        " SELECT key, value, ? FROM json_each(?)",
+        (post_id, json.dumps(post_buckets)),
+    )
+
+
+def rebuild(db, batch_size, report):
+    """Rebuild the LSH index from every joke's body, committing each
+    batch of ``batch_size`` jokes. Calls ``report(done, total)`` after
+    each.
+    """
+    total = db.execute("SELECT COUNT(*) FROM post").fetchone()[0]
+    with db:
+        db.execute("DELETE FROM post_lsh")
+
+    done = last = 0
+    while True:
+        rows = db.execute(
+            "SELECT id, body FROM post WHERE id > ? ORDER BY id LIMIT ?",
+            (last, batch_size),
+        ).fetchall()
+        if not rows:
+            return
+        with db:
+            for post_id, body in rows:
+                index(db, post_id, buckets_of(body))
+        last = rows[-1][0]
+        done += len(rows)
+        report(done, total)
+
+
+def clusters(db, threshold, batch_size):
+    """Yield the groups of near-duplicate jokes as sorted lists of ids.
+
+    Buckets holding more than one joke are read in batches of
+    ``batch_size``; each pair sharing one is checked on their bodies
+    and the alike pairs are joined into clusters.
+    """
+    parent = {}
+
+    def root(id):
+        while parent.setdefault(id, id) != id:
+            parent[id] = parent[parent[id]]
+            id = parent[id]
+        return id
+
+    position = (-1, 0)
+    checked = set()
+    while True:
+        groups = db.execute(
+            """SELECT band, bucket, group_concat(post_id) FROM post_lsh
+               WHERE (band, bucket) > (?, ?)
+               GROUP BY band, bucket
+               HAVING COUNT(*) > 1
+               ORDER BY band, bucket
+               LIMIT ?""",
+            (*position, batch_size),
+        ).fetchall()
+        if not groups:
+            break
+        position = groups[-1][:2]
+
+        pairs = set()
+        for _, _, ids in groups:
+            ids = sorted(int(id) for id in ids.split(","))
+            pairs.update(
+                (a, b) for i, a in enumerate(ids) for b in ids[i + 1 :]
+            )
+        pairs -= checked
+        checked |= pairs
+
+        wanted = sorted({id for pair in pairs for id in pair})
+        bodies = dict(
+            db.execute(
+                "SELECT id, body FROM post WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(wanted),),
+            ).fetchall()
+        )
+        shingled = {id: shingles(body) for id, body in bodies.items()}
+        for a, b in pairs:
+            if a in shingled and b in shingled:
+                if jaccard(shingled[a], shingled[b]) >= threshold:
+                    parent[root(a)] = root(b)
+
+    found = {}
+    for id in parent:
+        found.setdefault(root(id), []).append(id)
+    for ids in found.values():
+        if len(ids) > 1:
+            yield sorted(ids)
+
+
+@click.command("find-duplicates")
+@click.option(
+    "--batch-size", default=1000, show_default=True, help="Jokes or buckets per batch."
+)
+@click.option("--no-rebuild", is_flag=True, help="Use the index as it is.")
+@with_appcontext
+def find_duplicates_command(batch_size, no_rebuild):
+    """Index every joke for duplicate detection and list near-duplicates."""
+    db = get_db()
+    start = time.monotonic()
+    if not no_rebuild:
+
+        def report(done, total):
+            click.echo(f"  indexed {done}/{total} jokes")
+
+        rebuild(db, batch_size, report)
+
+    titles = {}
+    count = 0
+    for ids in clusters(db, current_app.config["DUPLICATE_THRESHOLD"], batch_size):
+        count += 1
+        missing = [id for id in ids if id not in titles]
+        titles.update(
+            db.execute(
+                "SELECT id, title FROM post WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(missing),),
+            ).fetchall()
+        )
+        click.echo(f"{len(ids)} alike:")
+        for id in ids:
+            click.echo(f"  #{id} {titles[id]}")
+
+    click.echo(f"Found {count} clusters in {time.monotonic() - start:.2f}s.")
+
+
+def init_app(app):
+    """Register the find-duplicates command. ``DUPLICATE_THRESHOLD`` is
+    the Jaccard similarity from which jokes count as the same.
+    """
+    app.config.setdefault("DUPLICATE_THRESHOLD", 0.6)
+    app.cli.add_command(find_duplicates_command)
@@ -0,0 +1,190 @@
+import threading
+from collections import deque
+
+from flask import Blueprint
+from flask import Response
+from flask import current_app
+from flask import request
+
+from .querystats import query_budget
+
+bp = Blueprint("events", __name__)
+
+
+class HubFull(Exception):
+    """Raised when the hub already has its maximum number of streams."""
+
+
+class Subscription:
+    """One client's view of the hub: the jokes it watches and the events
+    waiting to be sent to it.
+
+    Rating events are coalesced per joke since only the latest aggregate
+    matters. Comment events are queued up to ``maxsize``; a client that
+    falls further behind is told to resync instead of buffering more.
+    """
+
+    def __init__(self, post_ids, maxsize):
+        self.post_ids = frozenset(post_ids)
+        self.maxsize = maxsize
+        self.condition = threading.Condition()
+        self.ratings = {}
+        self.events = deque()
+        self.overflowed = False
+
+    def put(self, event, post_id, data):
+        with self.condition:
+            if event == "rating":
+                self.ratings[post_id] = data
+            elif len(self.events) >= self.maxsize:
+                self.overflowed = True
+            else:
+                self.events.append((event, data))
+            self.condition.notify()
+
+    def get(self, timeout):
+        """Wait up to ``timeout`` seconds and return the waiting
+        ``(event, data)`` pairs, which may be none.
+        """
+        with self.condition:
+            if not (self.events or self.ratings or self.overflowed):
+                self.condition.wait(timeout)
+
+            if self.overflowed:
+                return [("resync", {})]
+
+            events = list(self.events)
+            events.extend(("rating", data) for data in self.ratings.values())
+            self.events.clear()
+            self.ratings.clear()
+            return events
+
+
+class EventHub:
+    """In-process publish/subscribe hub for joke updates, keyed by joke
+    id so publishing only touches the streams watching that joke.
+    """
+
+    def __init__(self, max_connections=50, queue_size=100):
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.watchers = {}
+
+    def subscribe(self, post_ids):
+        with self.lock:
+            if len(self.subscriptions) >= self.max_connections:
+                raise HubFull()
+
+            subscription = Subscription(post_ids, self.queue_size)
+            self.subscriptions.add(subscription)
+            for post_id in subscription.post_ids:
+                self.watchers.setdefault(post_id, set()).add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription not in self.subscriptions:
+                return
+
+            self.subscriptions.discard(subscription)
+            for post_id in subscription.post_ids:
+                watchers = self.watchers[post_id]
+                watchers.discard(subscription)
+                if not watchers:
+                    del self.watchers[post_id]
+
+    def publish(self, event, post_id, data):
+        with self.lock:
+            watchers = list(self.watchers.get(post_id, ()))
+
+        for subscription in watchers:
+            subscription.put(event, post_id, data)
+
+
+def publish(event, post_id, **data):
+    """Send an event about a joke to every stream watching it."""
+    hub = current_app.extensions["event_hub"]
+    hub.publish(event, post_id, {"id": post_id, **data})
+
+
+@bp.route("/events")
+@query_budget(queries=1, rows=1)
+def stream():
+    """Stream rating and comment updates for the jokes listed in the
+    ``jokes`` query argument as Server-Sent Events.
+
+    Each open stream holds a server thread, so the number of streams is
+    capped by ``SSE_MAX_CONNECTIONS``, well below ``SERVER_THREADS``. A
+    browser doesn't reconnect after the ``503`` past the cap; its page
+    just goes without live updates.
+    """
+    config = current_app.config
+    hub = current_app.extensions["event_hub"]
+    post_ids = {
+        int(post_id)
+        for post_id in request.args.get("jokes", "").split(",")
+        if post_id.isdigit()
+    }
+
+    if not post_ids:
+        return Response("No jokes to watch.", status=400)
+
+    if len(post_ids) > config["SSE_MAX_JOKES"]:
+        return Response("Too many jokes to watch.", status=400)
+
+    try:
+        subscription = hub.subscribe(post_ids)
+    except HubFull:
+        return Response(
+            "Too many open streams.",
+            status=503,
+            headers={"Retry-After": str(config["SSE_RETRY"])},
+        )
+
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield f"retry: {config['SSE_RETRY'] * 1000}\n\n"
+        while True:
+            events = subscription.get(config["SSE_HEARTBEAT"])
+            if not events:
+                # comment line, keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+            for event, data in events:
+                yield f"event: {event}\ndata: {dumps(data)}\n\n"
+                if event == "resync":
+                    return
+
+    response = Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(lambda: hub.unsubscribe(subscription))
+    return response
+
+
+def init_app(app):
+    """Create the app's event hub.
+
+    Every open stream pins one of the server's ``SERVER_THREADS`` worker
+    threads (``waitress-serve --threads``), so by default a quarter of
+    them may stream and the rest are left for pages.
+    """
+    app.config.setdefault("SERVER_THREADS", 16)
+    app.config.setdefault("SSE_MAX_CONNECTIONS", max(1, app.config["SERVER_THREADS"] // 4))
+    if app.config["SSE_MAX_CONNECTIONS"] >= app.config["SERVER_THREADS"]:
+        raise ValueError(
+            "SSE_MAX_CONNECTIONS must be below SERVER_THREADS, or open streams"
+            " leave no thread to serve pages."
+        )
+    app.config.setdefault("SSE_QUEUE_SIZE", 100)
+    app.config.setdefault("SSE_MAX_JOKES", 200)
+    app.config.setdefault("SSE_HEARTBEAT", 15)
+    app.config.setdefault("SSE_RETRY", 5)
+    app.extensions["event_hub"] = EventHub(
+        app.config["SSE_MAX_CONNECTIONS"], app.config["SSE_QUEUE_SIZE"]
+    )
@@ -0,0 +1,128 @@
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from flask import g
+from flask import get_flashed_messages
+from flask import render_template
+from flask import stream_template
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+from . import timeouts
+
+
+class FragmentCache:
+    """Thread-safe LRU cache of rendered template fragments."""
+
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.fragments = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        """Return the fragment stored under ``key``, calling ``render()``
+        to produce and store it if there isn't one.
+        """
+        with self.lock:
+            fragment = self.fragments.get(key)
+            if fragment is not None:
+                self.fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+
+        fragment = Markup(render())
+
+        with self.lock:
+            self.misses += 1
+            self.fragments[key] = fragment
+            if len(self.fragments) > self.maxsize:
+                self.fragments.popitem(last=False)
+
+        return fragment
+
+    def clear(self):
+        with self.lock:
+            self.fragments.clear()
+
+
+def render_joke_card(joke, comments, tags, user_rating, more=None):
+    """Render a joke card from ``jokes/card.html``, reusing the cached
+    HTML when nothing it shows has changed. ``comments`` are the first
+    few; ``more`` is the cursor the rest load from, if there are more.
+
+    The key covers the joke's content, its tags, its rating aggregate,
+    its comment count and shown comment ids, plus the few things that
+    differ between viewers: being logged in, being the author, the
+    viewer's own rating and, only if they commented, which comments they
+    may delete. Anonymous visitors and most logged-in users therefore
+    share one entry per card.
+    """
+    user = g.user
+    user_id = user["id"] if user else None
+    version = (
+        joke.title,
+        joke.body,
+        tuple(tags),
+        joke.avg_rating,
+        joke.rating_count,
+        joke.comment_count,
+        tuple(comment.id for comment in comments),
+    )
+    viewer = (
+        user is not None,
+        user_id == joke.author_id,
+        user_rating,
+        user_id if any(c.user_id == user_id for c in comments) else None,
+    )
+    template = current_app.jinja_env.get_template("jokes/card.html")
+
+    return current_app.extensions["fragment_cache"].get_or_render(
+        (joke.id, version, viewer),
+        lambda: template.render(
+            joke=joke, comments=comments, tags=tags, user_rating=user_rating, more=more
+        ),
+    )
+
+
+def render_page(template_name, **context):
+    """Render a page whose context holds lazy row iterators.
+
+    With ``STREAM_PAGES`` set the page is streamed: everything before the
+    first row goes out right away and rows are rendered as the cursor
+    yields them, so memory doesn't grow with the result set. Otherwise
+    this is ``render_template``.
+    """
+    if not current_app.config["STREAM_PAGES"]:
+        return render_template(template_name, **context)
+
+    # The session cookie is sent before the body is rendered, so pop the
+    # flashed messages now for the template to read them from the request.
+    get_flashed_messages()
+    return current_app.response_class(
+        timeouts.cut_short(stream_template(template_name, **context))
+    )
+
+
+def init_app(app):
+    """Set up the fragment cache and, outside of testing, a bytecode
+    cache in the instance folder so workers don't recompile templates
+    on start.
+    """
+    app.config.setdefault("FRAGMENT_CACHE_SIZE", 2048)
+    app.config.setdefault("STREAM_PAGES", True)
+    app.config.setdefault(
+        "TEMPLATE_BYTECODE_CACHE",
+        None if app.testing else os.path.join(app.instance_path, "jinja-cache"),
+    )
+    app.extensions["fragment_cache"] = FragmentCache(app.config["FRAGMENT_CACHE_SIZE"])
+
+    directory = app.config["TEMPLATE_BYTECODE_CACHE"]
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        # set on the environment itself: extensions set up earlier may
+        # have created it already, and jinja_options is only read then
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
@@ -1,4 +1,7 @@
+import json
+
 from flask import Blueprint
+from flask import current_app
 from flask import flash
 from flask import g
 from flask import jsonify
@@ -8,50 +11,198 @@ from flask import request
 from flask import url_for
 from werkzeug.exceptions import abort
 
+from . import duplicates
+from . import events
+from . import moderation
+from . import ranking
+from . import rating_buffer
+from . import tags
 from .auth import login_required
 from .db import get_db
+from .db import record_type
+from .db import records
+from .fragments import render_joke_card
+from .fragments import render_page
+from .querystats import query_budget
 
 bp = Blueprint("jokes", __name__)
 
 
+#: Row type of the comments embedded in the feed.
+Comment = record_type(("id", "body", "created", "user_id", "username", "nickname"))
+
+#: Comments shown on each card in the feed, and loaded per click on
+#: "Show more comments" after them.
+COMMENT_PREVIEW = 3
+COMMENT_PAGE = 20
+
+#: A joke's comments after a ``(created, id)`` cursor, oldest first,
+#: read off ``comment_post_created`` from where the last page ended.
+COMMENTS_AFTER = """
+    SELECT c.id, c.body, c.created, c.user_id, u.username, u.nickname
+    FROM comment c
+    JOIN user u ON c.user_id = u.id
+    WHERE c.post_id = ? AND (c.created, c.id) > (?, ?)
+    ORDER BY c.created, c.id
+    LIMIT ?
+"""
+
+
+#: The feed's ``?sort=`` orders, each read straight off an index on post.
+SORTS = {
+    "top": "p.score DESC, p.created DESC",
+    "hot": "p.hot DESC, p.created DESC",
+    "new": "p.created DESC",
+}
+
+#: The feed, one row per joke, see ``_joke_cards``. Formatted with a
+#: ``where`` clause, empty or ``FEED_IDS``, and an ``order`` from
+#: ``SORTS``.
+FEED = f"""
+    SELECT p.id, p.title, p.body, p.created, p.author_id, u.nickname as username,
+           COALESCE(p.rating_sum * 1.0 / NULLIF(p.rating_count, 0), 0) as avg_rating,
+           p.rating_count,
+           (SELECT rating FROM rating
+            WHERE post_id = p.id AND user_id = ?) as user_rating,
+           (SELECT COUNT(*) FROM comment
+            WHERE post_id = p.id) as comment_count,
+           (SELECT json_group_array(json_array(
+                     id, body, created, user_id, username, nickname))
+            FROM (SELECT c.id, c.body, c.created, c.user_id,
+                         cu.username, cu.nickname
+                  FROM comment c
+                  JOIN user cu ON c.user_id = cu.id
+                  WHERE c.post_id = p.id
+                  ORDER BY c.created, c.id
+                  LIMIT {COMMENT_PREVIEW})) as comments,
+           (SELECT json_group_array(t.name)
+            FROM post_tag pt
+            JOIN tag t ON t.id = pt.tag_id
+            WHERE pt.post_id = p.id) as tags
+    FROM post p
+    JOIN user u ON p.author_id = u.id
+    {{where}}
+    ORDER BY {{order}}
+"""
+
+#: Narrows the feed to the jokes in a JSON array of ids.
+FEED_IDS = "WHERE p.id IN (SELECT value FROM json_each(?))"
+
+#: The user's recommendations, see ``_recommended``.
+RECOMMENDED = """
+    SELECT p.id, p.title
+    FROM recommendation r
+    JOIN post p ON p.id = r.post_id
+    WHERE r.user_id = ?
+      AND NOT EXISTS (SELECT 1 FROM rating
+                      WHERE post_id = r.post_id AND user_id = r.user_id)
+    ORDER BY r.rank
+"""
+
+
+def comment_cursor(created, id):
+    """Return the ``?after=`` that continues past the comment created at
+    ``created`` (epoch seconds) with ``id``.
+    """
+    return f"{created}.{id}"
+
+
+def parse_comment_cursor(after):
+    """Return the ``(created, id)`` a page of comments starts after, from
+    before the first comment if ``after`` is empty. Raises ``ValueError``
+    if it isn't a cursor.
+    """
+    if not after:
+        return -1, 0
+    created, id = (int(part) for part in after.split("."))
+    return created, id
+
+
+def _joke_cards(user_id, sort, ids=None):
+    """Yield the rendered joke cards, reading one joke at a time, only
+    those in ``ids`` unless it's ``None``.
+
+    Each joke's tags and first ``COMMENT_PREVIEW`` comments come with it
+    as JSON arrays, along with its comment count, so the page is one
+    query however many jokes there are and however long their threads.
+    The query runs on the first iteration, so a streamed page gets its
+    connection from the context the stream runs in.
+    """
+    where, params = "", (user_id,)
+    if ids is not None:
+        where = FEED_IDS
+        params = (user_id, json.dumps(ids))
+    posts = records(FEED.format(where=where, order=SORTS[sort]), params)
+
+    for post in posts:
+        rows = json.loads(post.comments)
+        comments = [Comment._make(comment) for comment in rows]
+        more = None
+        if post.comment_count > len(rows):
+            more = comment_cursor(rows[-1][2], rows[-1][0])
+        # a handful at most, so sorted here rather than in each subquery
+        names = sorted(json.loads(post.tags))
+        yield render_joke_card(post, comments, names, post.user_rating, more)
+
+
+def _recommended(user_id):
+    """Yield the user's "jokes you might like" that they haven't rated
+    since ``flask recommend`` picked them, read off the table's primary
+    key. Like the cards, the query runs on the first iteration.
+    """
+    if user_id is None:
+        return
+    yield from records(RECOMMENDED, (user_id,))
+
+
+def _sort():
+    sort = request.args.get("sort")
+    return sort if sort in SORTS else "top"
+
+
 @bp.route("/")
+@query_budget(queries=4, seconds=2.0)
 def index():
-    """Show all the jokes, sorted by average rating (highest first)."""
-    db = get_db()
-    posts = db.execute(
-        """SELECT p.id, p.title, p.body, p.created, p.author_id, u.nickname as username,
-                  COALESCE(AVG(r.rating), 0) as avg_rating,
-                  COUNT(DISTINCT r.id) as rating_count
-           FROM post p 
-           JOIN user u ON p.author_id = u.id
-           LEFT JOIN rating r ON p.id = r.post_id
-           GROUP BY p.id
-           ORDER BY avg_rating DESC, p.created DESC"""
-    ).fetchall()
-    
-    # Get user's ratings if logged in
-    user_ratings = {}
-    if g.user:
-        ratings = db.execute(
-            "SELECT post_id, rating FROM rating WHERE user_id = ?",
-            (g.user['id'],)
-        ).fetchall()
-        user_ratings = {r['post_id']: r['rating'] for r in ratings}
-    
-    # Get comments for all jokes
-    comments_dict = {}
-    for post in posts:
-        comments = db.execute(
-            """SELECT c.id, c.body, c.created, c.user_id, u.username, u.nickname
-               FROM comment c
-               JOIN user u ON c.user_id = u.id
-               WHERE c.post_id = ?
-               ORDER BY c.created ASC""",
-            (post['id'],)
-        ).fetchall()
-        comments_dict[post['id']] = comments
-    
-    return render_template("jokes/index.html", jokes=posts, user_ratings=user_ratings, comments=comments_dict)
+    """Show all the jokes, best first by default. ``?sort=hot`` favors
+    recently well rated jokes and ``?sort=new`` the newest.
+    """
+    sort = _sort()
+    user_id = g.user["id"] if g.user else None
+    return render_page(
+        "jokes/index.html",
+        facets=tags.top(current_app.config["TAG_FACETS"]),
+        recommended=_recommended(user_id),
+        cards=_joke_cards(user_id, sort),
+        sort=sort,
+    )
+
+
+@bp.route("/tag/<name>")
+@query_budget(queries=4 + tags.MAX_FILTER, seconds=2.0)
+def tag(name):
+    """Show the jokes with every one of the tags in ``name``, like
+    ``/tag/programming+dad``, and the other tags found among them.
+
+    The matching ids come from intersecting the tags' posting lists;
+    the cards and the facets are then read for those ids only.
+    """
+    names = list(dict.fromkeys(name.lower().split("+")))
+    if len(names) > tags.MAX_FILTER:
+        abort(404, f"Filter by at most {tags.MAX_FILTER} tags.")
+    ids = tags.matching(get_db(), names)
+    if ids is None:
+        abort(404, f"Tag {name} doesn't exist.")
+
+    sort = _sort()
+    user_id = g.user["id"] if g.user else None
+    return render_page(
+        "jokes/index.html",
+        tag_names=names,
+        facets=tags.facets(ids, current_app.config["TAG_FACETS"], exclude=names),
+        recommended=(),
+        cards=_joke_cards(user_id, sort, ids),
+        sort=sort,
+    )
 
 
 def get_joke(id, check_author=True):
@@ -69,7 +220,9 @@ def get_joke(id, check_author=True):
     joke = (
         get_db()
         .execute(
-            "SELECT p.id, title, body, created, author_id, username"
+            "SELECT p.id, p.title, p.body, p.created, p.author_id, u.username,"
+            " (SELECT group_concat(t.name, ' ') FROM post_tag pt"
+            "  JOIN tag t ON t.id = pt.tag_id WHERE pt.post_id = p.id) AS tags"
             " FROM post p JOIN user u ON p.author_id = u.id"
             " WHERE p.id = ?",
             (id,),
@@ -88,59 +241,87 @@ def get_joke(id, check_author=True):
 
 @bp.route("/leave", methods=("GET", "POST"))
 @login_required
+@query_budget(queries=6, rows=1 + duplicates.MAX_CANDIDATES)
 def leave():
-    """Leave a new joke as the current user."""
+    """Leave a new joke as the current user.
+
+    A joke whose body is nearly the same as an existing one is sent
+    back with the jokes it resembles, and posted only once the user
+    checks "post it anyway".
+    """
+    alike = []
     if request.method == "POST":
         title = request.form["title"]
         body = request.form["body"]
+        names = tags.parse(request.form.get("tags", ""))
         error = None
 
         if len(title.split()) > 10 :
             error = 'Title can only be 10 words'
+        else:
+            error = tags.check(names) or moderation.check(title, body)
 
         if error is not None:
             flash(error)
         else:
             db = get_db()
-            db.execute(
-                "INSERT INTO post (title, body, author_id) VALUES (?, ?, ?)",
-                (title, body, g.user["id"]),
+            alike, body_buckets = duplicates.find(
+                db, body, current_app.config["DUPLICATE_THRESHOLD"]
             )
-            db.commit()
-            return redirect(url_for("jokes.index"))
+            if alike and not request.form.get("post_anyway"):
+                flash("This joke looks a lot like one that's already here.")
+            else:
+                id = db.execute(
+                    "INSERT INTO post (title, body, author_id) VALUES (?, ?, ?)",
+                    (title, body, g.user["id"]),
+                ).lastrowid
+                duplicates.index(db, id, body_buckets)
+                tags.add(db, id, names)
+                db.commit()
+                return redirect(url_for("jokes.index"))
 
-    return render_template("jokes/leave.html")
+    return render_template("jokes/leave.html", alike=alike)
 
 
 @bp.route("/<int:id>/update", methods=("GET", "POST"))
 @login_required
+@query_budget(queries=7, rows=2)
 def update(id):
-    """Update a joke if the current user is the author."""
-    joke = get_joke(id)
-
+    """Update a joke and its tags if the current user is the author."""
     if request.method == "POST":
         title = request.form["title"]
         body = request.form["body"]
+        names = tags.parse(request.form.get("tags", ""))
         error = None
 
         if not title:
             error = "Title is required."
+        else:
+            error = tags.check(names) or moderation.check(title, body)
 
         if error is not None:
             flash(error)
         else:
             db = get_db()
-            db.execute(
-                "UPDATE post SET title = ?, body = ? WHERE id = ?", (title, body, id)
-            )
+            updated = db.execute(
+                "UPDATE post SET title = ?, body = ? WHERE id = ? AND author_id = ?",
+                (title, body, id, g.user["id"]),
+            ).rowcount
+            if updated:
+                duplicates.index(db, id, duplicates.buckets_of(body))
+                tags.replace(db, id, names)
             db.commit()
-            return redirect(url_for("jokes.index"))
+            if updated:
+                return redirect(url_for("jokes.index"))
 
+    # also raises the 404 or 403 for an update that matched nothing
+    joke = get_joke(id)
     return render_template("jokes/update.html", joke=joke)
 
 
 @bp.route("/<int:id>/rate", methods=("POST",))
 @login_required
+@query_budget(queries=4, rows=4)
 def rate(id):
     """Rate a joke with 1-5 stars."""
     rating_value = request.form.get("rating", type=int)
@@ -150,34 +331,48 @@ def rate(id):
     
     db = get_db()
     
-    # Check if joke exists
-    joke = db.execute("SELECT id FROM post WHERE id = ?", (id,)).fetchone()
-    if joke is None:
-        return jsonify({"error": "Joke not found"}), 404
-    
-    try:
-        # Insert or update rating
-        db.execute(
-            """INSERT INTO rating (post_id, user_id, rating) 
-               VALUES (?, ?, ?)
-               ON CONFLICT(post_id, user_id) 
-               DO UPDATE SET rating = ?, created = CURRENT_TIMESTAMP""",
-            (id, g.user['id'], rating_value, rating_value)
+    buffer = rating_buffer.get_buffer(current_app)
+    if buffer is not None:
+        joke = db.execute("SELECT id FROM post WHERE id = ?", (id,)).fetchone()
+        if joke is None:
+            return jsonify({"error": "Joke not found"}), 404
+
+        # Written to the table in the next batch; the aggregate already
+        # includes this rating.
+        avg_rating, rating_count = buffer.rate(db, id, g.user["id"], rating_value)
+        events.publish(
+            "rating", id, avg_rating=round(avg_rating, 1), rating_count=rating_count
         )
+        return jsonify({
+            "success": True,
+            "avg_rating": round(avg_rating, 1),
+            "rating_count": rating_count
+        })
+
+    try:
+        # Insert or update the rating, only if the joke exists, and store
+        # the new totals and scores in the same transaction
+        rated = db.execute(
+            """INSERT INTO rating (post_id, user_id, rating)
+               SELECT id, ?, ? FROM post WHERE id = ?
+               ON CONFLICT(post_id, user_id)
+               DO UPDATE SET rating = excluded.rating, created = excluded.created""",
+            (g.user['id'], rating_value, id)
+        ).rowcount
+        if not rated:
+            db.rollback()
+            return jsonify({"error": "Joke not found"}), 404
+
+        avg_rating, rating_count = ranking.rescore(db, id)
         db.commit()
-        
-        # Get updated average rating
-        result = db.execute(
-            """SELECT COALESCE(AVG(rating), 0) as avg_rating,
-                      COUNT(*) as rating_count
-               FROM rating WHERE post_id = ?""",
-            (id,)
-        ).fetchone()
+        events.publish(
+            "rating", id, avg_rating=round(avg_rating, 1), rating_count=rating_count
+        )
         
         return jsonify({
             "success": True,
-            "avg_rating": round(result['avg_rating'], 1),
-            "rating_count": result['rating_count']
+            "avg_rating": round(avg_rating, 1),
+            "rating_count": rating_count
         })
         
     except Exception as e:
@@ -187,6 +382,7 @@ def rate(id):
 
 @bp.route("/<int:id>/comment", methods=("POST",))
 @login_required
+@query_budget(queries=2, rows=2)
 def add_comment(id):
     """Add a comment to a joke."""
     body = request.form.get("body", "").strip()
@@ -196,42 +392,47 @@ def add_comment(id):
     
     if len(body) > 500:
         return jsonify({"success": False, "message": "Comment too long (max 500 characters)"}), 400
+
+    error = moderation.check(body)
+    if error is not None:
+        return jsonify({"success": False, "message": error}), 400
     
     db = get_db()
     
-    # Check if joke exists
-    joke = db.execute("SELECT id FROM post WHERE id = ?", (id,)).fetchone()
-    if joke is None:
-        return jsonify({"success": False, "message": "Joke not found"}), 404
-    
     try:
-        # Insert comment
-        db.execute(
-            "INSERT INTO comment (post_id, user_id, body) VALUES (?, ?, ?)",
-            (id, g.user['id'], body)
-        )
+        # Insert the comment if the joke exists and get it back
+        comment = next(records(
+            """INSERT INTO comment (post_id, user_id, body)
+               SELECT id, ?, ? FROM post WHERE id = ?
+               RETURNING id, body, created""",
+            (g.user['id'], body, id)
+        ), None)
+        if comment is None:
+            db.rollback()
+            return jsonify({"success": False, "message": "Joke not found"}), 404
         db.commit()
         
-        # Get the newly created comment with user info
-        comment = db.execute(
-            """SELECT c.id, c.body, c.created, u.username, u.nickname
-               FROM comment c
-               JOIN user u ON c.user_id = u.id
-               WHERE c.post_id = ? AND c.user_id = ?
-               ORDER BY c.created DESC
-               LIMIT 1""",
-            (id, g.user['id'])
-        ).fetchone()
+        events.publish(
+            "comment",
+            id,
+            comment={
+                "id": comment.id,
+                "body": comment.body,
+                "nickname": g.user["nickname"],
+                "user_id": g.user["id"],
+                "created": comment.created,
+            },
+        )
         
         return jsonify({
             "success": True,
             "message": "Comment added!",
             "comment": {
-                "id": comment['id'],
-                "body": comment['body'],
-                "username": comment['username'],
-                "nickname": comment['nickname'],
-                "created": comment['created'],
+                "id": comment.id,
+                "body": comment.body,
+                "username": g.user["username"],
+                "nickname": g.user["nickname"],
+                "created": comment.created,
                 "is_owner": True
             }
         })
@@ -241,43 +442,90 @@ def add_comment(id):
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@bp.route("/<int:id>/comments")
+@query_budget(queries=3, rows=2 + COMMENT_PAGE)
+def comments(id):
+    """Render the next ``COMMENT_PAGE`` of a joke's comments for its
+    card, after the ``?after=`` cursor a card or the last page gave.
+    ``next`` continues from this page, or is ``None`` at the end.
+    """
+    after = request.args.get("after", "")
+    try:
+        created, last_id = parse_comment_cursor(after)
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid cursor"}), 400
+
+    db = get_db()
+    # one extra row tells whether there's a next page
+    rows = db.execute(COMMENTS_AFTER, (id, created, last_id, COMMENT_PAGE + 1)).fetchall()
+    if not rows and not after:
+        # only an empty first page pays for telling "none" from "no joke"
+        if db.execute("SELECT 1 FROM post WHERE id = ?", (id,)).fetchone() is None:
+            return jsonify({"success": False, "message": "Joke not found"}), 404
+
+    page = rows[:COMMENT_PAGE]
+    template = current_app.jinja_env.get_template("jokes/comment.html")
+    html = "".join(
+        template.render(comment=Comment._make(row), joke_id=id) for row in page
+    )
+    more = len(rows) > COMMENT_PAGE
+    return jsonify(
+        {
+            "success": True,
+            "html": html,
+            "next": comment_cursor(page[-1]["created"], page[-1]["id"]) if more else None,
+        }
+    )
+
+
 @bp.route("/comment/<int:id>/delete", methods=("POST",))
 @login_required
+@query_budget(queries=3, rows=2)
 def delete_comment(id):
     """Delete a comment."""
     db = get_db()
     
-    # Get comment and check ownership
-    comment = db.execute(
-        "SELECT post_id, user_id FROM comment WHERE id = ?",
-        (id,)
-    ).fetchone()
-    
-    if comment is None:
-        return jsonify({"success": False, "message": "Comment not found"}), 404
-    
-    if comment['user_id'] != g.user['id']:
-        return jsonify({"success": False, "message": "Unauthorized"}), 403
-    
     try:
-        db.execute("DELETE FROM comment WHERE id = ?", (id,))
+        # Ownership is part of the WHERE clause
+        comment = db.execute(
+            "DELETE FROM comment WHERE id = ? AND user_id = ? RETURNING post_id",
+            (id, g.user['id'])
+        ).fetchone()
         db.commit()
-        return jsonify({"success": True, "message": "Comment deleted"})
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
 
+    if comment is None:
+        # Only a failed delete pays for telling the two cases apart
+        exists = db.execute("SELECT 1 FROM comment WHERE id = ?", (id,)).fetchone()
+        if exists is None:
+            return jsonify({"success": False, "message": "Comment not found"}), 404
+        return jsonify({"success": False, "message": "Unauthorized"}), 403
+
+    events.publish("comment-deleted", comment["post_id"], comment_id=id)
+    return jsonify({"success": True, "message": "Comment deleted"})
+
 
 @bp.route("/<int:id>/delete", methods=("POST",))
 @login_required
+@query_budget(queries=3, rows=2)
 def delete(id):
     """Delete a post.
 
     Ensures that the post exists and that the logged in user is the
     author of the post.
     """
-    get_joke(id)
     db = get_db()
-    db.execute("DELETE FROM post WHERE id = ?", (id,))
+    deleted = db.execute(
+        "DELETE FROM post WHERE id = ? AND author_id = ?", (id, g.user["id"])
+    ).rowcount
     db.commit()
+    if not deleted:
+        # raises the 404 or 403
+        get_joke(id)
+
+    buffer = rating_buffer.get_buffer(current_app)
+    if buffer is not None:
+        buffer.discard(id)
     return redirect(url_for("jokes.index"))
@@ -0,0 +1,204 @@
+import os
+import sqlite3
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import ranking
+from .db import get_db
+
+
+class BudgetExceeded(Exception):
+    """Raised when a maintenance task runs past its time budget."""
+
+
+def _run_with_budget(db, budget, fn):
+    """Call ``fn(deadline)`` with a progress handler that interrupts any SQLite
+    statement still running once ``budget`` seconds have passed.
+    """
+    deadline = time.monotonic() + budget
+    db.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    try:
+        return fn(deadline)
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e):
+            raise BudgetExceeded() from e
+        raise
+    finally:
+        db.set_progress_handler(None, 0)
+
+
+def refresh_statistics(db, budget, config):
+    """Rebuild the planner statistics in ``sqlite_stat1``.
+
+    ``analysis_limit`` keeps ``ANALYZE`` to a sample of each index so the
+    task stays cheap on large tables. ``PRAGMA optimize`` isn't enough:
+    before SQLite 3.46 it only looks at tables the connection has queried,
+    and the task runs on a fresh one.
+    """
+
+    def run(deadline):
+        db.execute(f"PRAGMA analysis_limit = {int(config['DB_ANALYSIS_LIMIT'])}")
+        db.execute("ANALYZE")
+        db.commit()
+        return "statistics refreshed"
+
+    return _run_with_budget(db, budget, run)
+
+
+def incremental_vacuum(db, budget, config):
+    """Return free pages to the file system in small steps.
+
+    Only works when the database was created with
+    ``auto_vacuum = INCREMENTAL``; each step is its own short write so
+    request traffic can interleave with it.
+    """
+    if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return "skipped, auto_vacuum is not INCREMENTAL"
+
+    step = int(config["DB_VACUUM_PAGES"])
+
+    def run(deadline):
+        freed = 0
+        while time.monotonic() < deadline:
+            free = db.execute("PRAGMA freelist_count").fetchone()[0]
+            if free == 0:
+                break
+            db.execute(f"PRAGMA incremental_vacuum({min(step, free)})").fetchall()
+            freed += min(step, free)
+        return f"{freed} pages freed"
+
+    return _run_with_budget(db, budget, run)
+
+
+def checkpoint_wal(db, budget, config):
+    """Checkpoint the write-ahead log once it grows past
+    ``DB_WAL_CHECKPOINT_BYTES``, truncating it back to zero length.
+    """
+    if db.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        return "skipped, journal_mode is not WAL"
+
+    path = db.execute("PRAGMA database_list").fetchone()[2]
+    try:
+        size = os.path.getsize(path + "-wal")
+    except OSError:
+        size = 0
+
+    if size <= config["DB_WAL_CHECKPOINT_BYTES"]:
+        return f"skipped, WAL is {size} bytes"
+
+    def run(deadline):
+        # wait on readers for at most the remaining budget
+        db.execute(f"PRAGMA busy_timeout = {int(budget * 1000)}")
+        busy, log, done = db.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        if busy:
+            return f"partial, {done} of {log} frames checkpointed"
+        return f"checkpointed {size} bytes"
+
+    return _run_with_budget(db, budget, run)
+
+
+def decay_hot_scores(db, budget, config):
+    """Let recent jokes' "hot" scores sink with age. A rating updates
+    its joke's score right away; this catches up the ones nobody rated.
+    """
+
+    def run(deadline):
+        with db:
+            updated = ranking.decay(db)
+        return f"{updated} hot scores decayed"
+
+    return _run_with_budget(db, budget, run)
+
+
+#: Maintenance tasks in the order they are run.
+TASKS = {
+    "decay": decay_hot_scores,
+    "analyze": refresh_statistics,
+    "vacuum": incremental_vacuum,
+    "checkpoint": checkpoint_wal,
+}
+
+
+def run_maintenance(db, config, tasks=None, budget=None):
+    """Run the named maintenance tasks (all of them by default) on the
+    given connection and return a list of ``(task, outcome)`` pairs.
+
+    Each task gets at most ``budget`` seconds, defaulting to
+    ``DB_MAINTENANCE_BUDGET``.
+    """
+    if budget is None:
+        budget = config["DB_MAINTENANCE_BUDGET"]
+
+    results = []
+    for name, task in TASKS.items():
+        if tasks and name not in tasks:
+            continue
+        try:
+            outcome = task(db, budget, config)
+        except BudgetExceeded:
+            outcome = f"stopped after {budget}s budget"
+        except sqlite3.OperationalError as e:
+            outcome = f"failed, {e}"
+        results.append((name, outcome))
+
+    return results
+
+
+class MaintenanceThread(threading.Thread):
+    """Daemon thread that runs every maintenance task on its own
+    connection each ``DB_MAINTENANCE_INTERVAL`` seconds.
+    """
+
+    def __init__(self, app):
+        super().__init__(name="db-maintenance", daemon=True)
+        self.config = app.config
+        self.logger = app.logger
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.config["DB_MAINTENANCE_INTERVAL"]):
+            db = sqlite3.connect(self.config["DATABASE"])
+            try:
+                for name, outcome in run_maintenance(db, self.config):
+                    self.logger.info("db maintenance %s: %s", name, outcome)
+            finally:
+                db.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+@click.command("db-maintain")
+@click.option(
+    "--task",
+    "tasks",
+    multiple=True,
+    type=click.Choice(list(TASKS)),
+    help="Only run this task. May be given more than once.",
+)
+@click.option("--budget", type=float, help="Seconds each task may run.")
+@with_appcontext
+def db_maintain_command(tasks, budget):
+    """Refresh statistics, vacuum free pages and checkpoint the WAL."""
+    for name, outcome in run_maintenance(get_db(), current_app.config, tasks, budget):
+        click.echo(f"{name}: {outcome}")
+
+
+def init_app(app):
+    """Register the maintenance command and, if an interval is
+    configured, start the background maintenance thread.
+    """
+    app.config.setdefault("DB_MAINTENANCE_INTERVAL", 0)
+    app.config.setdefault("DB_MAINTENANCE_BUDGET", 0.25)
+    app.config.setdefault("DB_ANALYSIS_LIMIT", 400)
+    app.config.setdefault("DB_VACUUM_PAGES", 256)
+    app.config.setdefault("DB_WAL_CHECKPOINT_BYTES", 4 * 1024 * 1024)
+    app.cli.add_command(db_maintain_command)
+
+    if app.config["DB_MAINTENANCE_INTERVAL"] > 0:
+        app.extensions["db_maintenance"] = MaintenanceThread(app)
+        app.extensions["db_maintenance"].start()
@@ -0,0 +1,418 @@
+import sqlite3
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import ranking
+
+
+def table_exists(db, table):
+    """Return whether ``table`` exists in the database."""
+    return (
+        db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        is not None
+    )
+
+
+def column_exists(db, table, column):
+    """Return whether ``table`` has a column named ``column``."""
+    return any(row[1] == column for row in db.execute(f"PRAGMA table_info({table})"))
+
+
+def add_column(table, definition):
+    """Step that adds a column unless an earlier run already added it."""
+
+    def step(db):
+        if not column_exists(db, table, definition.split()[0]):
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {definition}")
+
+    return step
+
+
+def rebuild(table, definition, select):
+    """Step that recreates ``table`` as ``CREATE TABLE table definition``
+    and copies the old rows into it with ``SELECT select FROM table``.
+
+    This is SQLite's recipe for changes ``ALTER TABLE`` can't make. The
+    copy runs inside the migration's transaction, so writers wait for
+    it. The ``AUTOINCREMENT`` counter is carried over; indexes go with
+    the old table and have to be created again by a later step.
+    """
+
+    def step(db):
+        sequence = None
+        if table_exists(db, "sqlite_sequence"):
+            sequence = db.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)
+            ).fetchone()
+
+        db.execute(f"CREATE TABLE {table}_rebuild {definition}")
+        db.execute(f"INSERT INTO {table}_rebuild SELECT {select} FROM {table}")
+        db.execute(f"DROP TABLE {table}")
+        db.execute(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+        if sequence is not None:
+            db.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?",
+                (sequence[0], table),
+            )
+
+    return step
+
+
+#: Converts a ``CURRENT_TIMESTAMP`` text column to epoch seconds, leaving
+#: values that already are numbers alone.
+EPOCH = (
+    "CASE WHEN typeof({0}) = 'text'"
+    " THEN CAST(strftime('%s', {0}) AS INTEGER) ELSE {0} END"
+)
+
+
+#: A post's rating total and count, for backfilling the stored copies.
+TOTAL = "(SELECT COALESCE(SUM(rating), 0) FROM rating WHERE post_id = post.id)"
+COUNT = "(SELECT COUNT(*) FROM rating WHERE post_id = post.id)"
+
+NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+class Backfill:
+    """Step that runs ``UPDATE table SET assignment WHERE condition`` in
+    rowid chunks, each committed on its own so the app can keep writing
+    in between.
+
+    The last finished rowid is stored in ``migration_progress`` inside
+    the same transaction as the chunk, so an interrupted backfill picks
+    up where it stopped.
+    """
+
+    def __init__(self, table, assignment, condition="1"):
+        self.table = table
+        self.assignment = assignment
+        self.condition = condition
+
+    def __call__(self, db, version, chunk_size, report):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS migration_progress ("
+            " version INTEGER PRIMARY KEY, position INTEGER NOT NULL)"
+        )
+        row = db.execute(
+            "SELECT position FROM migration_progress WHERE version = ?", (version,)
+        ).fetchone()
+        position = row[0] if row else 0
+        last = db.execute(f"SELECT MAX(rowid) FROM {self.table}").fetchone()[0] or 0
+        start = time.monotonic()
+        rows = 0
+
+        while position < last:
+            end = position + chunk_size
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows += db.execute(
+                    f"UPDATE {self.table} SET {self.assignment}"
+                    f" WHERE rowid > ? AND rowid <= ? AND ({self.condition})",
+                    (position, end),
+                ).rowcount
+                db.execute(
+                    "INSERT OR REPLACE INTO migration_progress VALUES (?, ?)",
+                    (version, end),
+                )
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            position = end
+            elapsed = time.monotonic() - start
+            report(self.table, min(position, last), last, rows / elapsed if elapsed else 0)
+
+
+#: Ordered ``(version, description, steps)``. A step is either SQL, a
+#: callable taking the connection, or a :class:`Backfill`. Steps may be
+#: re-run after an interruption, so they must be idempotent.
+MIGRATIONS = [
+    (
+        1,
+        "add rating table",
+        [
+            """CREATE TABLE IF NOT EXISTS rating (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 post_id INTEGER NOT NULL,
+                 user_id INTEGER NOT NULL,
+                 rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
+                 created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                 FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
+                 FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE,
+                 UNIQUE (post_id, user_id)
+               )"""
+        ],
+    ),
+    (
+        2,
+        "add comment table",
+        [
+            """CREATE TABLE IF NOT EXISTS comment (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 post_id INTEGER NOT NULL,
+                 user_id INTEGER NOT NULL,
+                 body TEXT NOT NULL,
+                 created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                 FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
+                 FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
+               )"""
+        ],
+    ),
+    (
+        3,
+        "add user.created",
+        [
+            # ALTER TABLE can't add a CURRENT_TIMESTAMP default
+            add_column("user", "created TIMESTAMP"),
+            Backfill("user", "created = CURRENT_TIMESTAMP", "created IS NULL"),
+        ],
+    ),
+    (
+        4,
+        "add secondary indexes",
+        [
+            "CREATE INDEX IF NOT EXISTS post_author_created ON post (author_id, created)",
+            "CREATE INDEX IF NOT EXISTS rating_post ON rating (post_id, rating)",
+            "CREATE INDEX IF NOT EXISTS rating_user ON rating (user_id, post_id, rating)",
+            "CREATE INDEX IF NOT EXISTS comment_post_created ON comment (post_id, created)",
+        ],
+    ),
+    (
+        5,
+        "store timestamps as epoch seconds, cluster rating on its key",
+        [
+            rebuild(
+                "post",
+                """(
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     author_id INTEGER NOT NULL,
+                     created INTEGER NOT NULL
+                       DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                     title TEXT NOT NULL,
+                     body TEXT NOT NULL,
+                     FOREIGN KEY (author_id) REFERENCES user (id)
+                   )""",
+                f"id, author_id, {EPOCH.format('created')}, title, body",
+            ),
+            rebuild(
+                "rating",
+                """(
+                     post_id INTEGER NOT NULL,
+                     user_id INTEGER NOT NULL,
+                     rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
+                     created INTEGER NOT NULL
+                       DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                     PRIMARY KEY (post_id, user_id),
+                     FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
+                     FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
+                   ) WITHOUT ROWID""",
+                f"post_id, user_id, rating, {EPOCH.format('created')}",
+            ),
+            rebuild(
+                "comment",
+                """(
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     post_id INTEGER NOT NULL,
+                     user_id INTEGER NOT NULL,
+                     body TEXT NOT NULL,
+                     created INTEGER NOT NULL
+                       DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                     FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
+                     FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
+                   )""",
+                f"id, post_id, user_id, body, {EPOCH.format('created')}",
+            ),
+            "CREATE INDEX IF NOT EXISTS post_author_created ON post (author_id, created)",
+            "CREATE INDEX IF NOT EXISTS rating_user ON rating (user_id)",
+            "CREATE INDEX IF NOT EXISTS comment_post_created ON comment (post_id, created)",
+        ],
+    ),
+    (
+        6,
+        "store rating totals and ranking scores on post",
+        [
+            add_column("post", "rating_sum INTEGER NOT NULL DEFAULT 0"),
+            add_column("post", "rating_count INTEGER NOT NULL DEFAULT 0"),
+            add_column("post", "score REAL NOT NULL DEFAULT 3.0"),
+            add_column("post", "hot REAL NOT NULL DEFAULT 0"),
+            # the new values aren't visible within the UPDATE, so the
+            # scores repeat the totals' subqueries
+            Backfill(
+                "post",
+                "rating_sum = {0}, rating_count = {1}, score = {2}, hot = {3}".format(
+                    TOTAL,
+                    COUNT,
+                    ranking.SCORE.format(TOTAL, COUNT),
+                    ranking.HOT.format(TOTAL, COUNT, "created", NOW),
+                ),
+            ),
+            "CREATE INDEX IF NOT EXISTS post_score ON post (score, created)",
+            "CREATE INDEX IF NOT EXISTS post_hot ON post (hot, created)",
+            "CREATE INDEX IF NOT EXISTS post_created ON post (created)",
+        ],
+    ),
+    (
+        7,
+        "add recommendation tables",
+        [
+            """CREATE TABLE IF NOT EXISTS post_neighbor (
+                 post_id INTEGER NOT NULL,
+                 rank INTEGER NOT NULL,
+                 neighbor_id INTEGER NOT NULL,
+                 similarity REAL NOT NULL,
+                 PRIMARY KEY (post_id, rank),
+                 FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
+                 FOREIGN KEY (neighbor_id) REFERENCES post (id) ON DELETE CASCADE
+               ) WITHOUT ROWID""",
+            """CREATE TABLE IF NOT EXISTS recommendation (
+                 user_id INTEGER NOT NULL,
+                 rank INTEGER NOT NULL,
+                 post_id INTEGER NOT NULL,
+                 score REAL NOT NULL,
+                 PRIMARY KEY (user_id, rank),
+                 FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE,
+                 FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE
+               ) WITHOUT ROWID""",
+        ],
+    ),
+    (
+        8,
+        "add near-duplicate index (fill it with `flask find-duplicates`)",
+        [
+            """CREATE TABLE IF NOT EXISTS post_lsh (
+                 band INTEGER NOT NULL,
+                 bucket INTEGER NOT NULL,
+                 post_id INTEGER NOT NULL,
+                 PRIMARY KEY (band, bucket, post_id)
+               ) WITHOUT ROWID""",
+        ],
+    ),
+    (
+        9,
+        "add case-insensitive nickname index",
+        [
+            "CREATE INDEX IF NOT EXISTS user_nickname_nocase"
+            " ON user (nickname COLLATE NOCASE)",
+        ],
+    ),
+    (
+        10,
+        "add tags",
+        [
+            """CREATE TABLE IF NOT EXISTS tag (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 name TEXT UNIQUE NOT NULL,
+                 post_count INTEGER NOT NULL DEFAULT 0
+               )""",
+            """CREATE TABLE IF NOT EXISTS post_tag (
+                 tag_id INTEGER NOT NULL,
+                 post_id INTEGER NOT NULL,
+                 PRIMARY KEY (tag_id, post_id),
+                 FOREIGN KEY (tag_id) REFERENCES tag (id) ON DELETE CASCADE,
+                 FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE
+               ) WITHOUT ROWID""",
+            """CREATE TRIGGER IF NOT EXISTS post_tag_added AFTER INSERT ON post_tag
+               BEGIN
+                 UPDATE tag SET post_count = post_count + 1 WHERE id = new.tag_id;
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS post_tag_removed AFTER DELETE ON post_tag
+               BEGIN
+                 UPDATE tag SET post_count = post_count - 1 WHERE id = old.tag_id;
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS post_untagged AFTER DELETE ON post
+               BEGIN
+                 DELETE FROM post_tag WHERE post_id = old.id;
+               END""",
+            "CREATE INDEX IF NOT EXISTS post_tag_post ON post_tag (post_id)",
+            "CREATE INDEX IF NOT EXISTS tag_post_count ON tag (post_count DESC, name)",
+        ],
+    ),
+]
+
+#: The version a freshly initialized schema.sql is at.
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(db):
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(db, chunk_size=1000, report=None, announce=None):
+    """Apply every migration newer than the database's ``user_version``
+    and return the versions applied.
+
+    ``db`` must be in autocommit mode (``isolation_level=None``) since
+    transactions are managed here. Consecutive schema steps share one
+    transaction together with the version bump; backfills commit per
+    chunk and call ``report(table, done, total, rows_per_second)``.
+    ``announce(version, description)`` is called as each migration
+    starts.
+    """
+    report = report or (lambda *args: None)
+    announce = announce or (lambda *args: None)
+    applied = []
+
+    for version, description, steps in MIGRATIONS:
+        if version <= get_version(db):
+            continue
+
+        announce(version, description)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for step in steps:
+                if isinstance(step, Backfill):
+                    db.execute("COMMIT")
+                    step(db, version, chunk_size, report)
+                    db.execute("BEGIN IMMEDIATE")
+                elif callable(step):
+                    step(db)
+                else:
+                    db.execute(step)
+
+            if table_exists(db, "migration_progress"):
+                db.execute("DELETE FROM migration_progress WHERE version = ?", (version,))
+            db.execute(f"PRAGMA user_version = {version}")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        applied.append(version)
+
+    return applied
+
+
+@click.command("db-upgrade")
+@click.option(
+    "--chunk-size", default=1000, show_default=True, help="Rows per backfill commit."
+)
+@with_appcontext
+def db_upgrade_command(chunk_size):
+    """Apply pending schema migrations without taking the app offline."""
+    db = sqlite3.connect(current_app.config["DATABASE"], isolation_level=None)
+    try:
+        version = get_version(db)
+        if version >= SCHEMA_VERSION:
+            click.echo(f"Database is up to date at version {version}.")
+            return
+
+        def announce(number, description):
+            click.echo(f"Applying {number}: {description}")
+
+        def report(table, done, total, rate):
+            click.echo(f"  {table}: {done}/{total} rows ({rate:.0f} rows/s)")
+
+        upgrade(db, chunk_size, report, announce)
+        click.echo(f"Upgraded from version {version} to {get_version(db)}.")
+    finally:
+        db.close()
+
+
+def init_app(app):
+    """Register the migration command with the Flask app."""
+    app.cli.add_command(db_upgrade_command)
@@ -0,0 +1,226 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+
+#: Read alike: "H3LL0" is checked as "hello". Keeps lengths, so matches
+#: line up with the folded text.
+_FOLD = str.maketrans("013457@$", "oieastas")
+
+#: What a pattern is: a banned word or phrase, a banned word prefix
+#: (``term*`` in the list) or the start of a link.
+TERM, PREFIX, LINK = range(3)
+
+#: Link starts. ``www.`` right after ``//`` is the same link.
+LINKS = ("://", "www.")
+
+BANNED = "Please keep it friendly, that language isn't allowed here."
+
+
+def fold(text):
+    """Normalize ``text`` for matching: casefolded, look-alike digits and
+    symbols read as letters, and whitespace runs as one space.
+    """
+    return " ".join(text.casefold().translate(_FOLD).split())
+
+
+class Automaton:
+    """Aho–Corasick automaton over a fixed list of patterns, finding
+    every occurrence of every pattern in one pass over the text,
+    however many patterns there are.
+    """
+
+    def __init__(self, patterns):
+        goto = [{}]
+        outputs = [()]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append(())
+                state = next_state
+            outputs[state] += (index,)
+
+        # breadth first, so a state's failure link is done before its
+        # children need it
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                fail[next_state] = goto[link].get(char, 0)
+                outputs[next_state] += outputs[fail[next_state]]
+
+        self.goto = goto
+        self.fail = fail
+        self.outputs = outputs
+
+    def __len__(self):
+        return len(self.goto)
+
+    def scan(self, text):
+        """Yield ``(end, index)`` for every occurrence of the pattern at
+        ``index``, ``end`` being the position of its last character.
+        """
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in outputs[state]:
+                yield end, index
+
+
+class ContentFilter:
+    """Checks text for banned terms, link spam and long runs of one
+    character, the first two in a single automaton pass.
+
+    Terms match whole words only, so "ass" doesn't flag "class"; a term
+    ending in ``*`` matches any word starting with it.
+    """
+
+    def __init__(self, terms, max_links, max_repeat):
+        patterns = []
+        for term in terms:
+            kind = TERM
+            if term.endswith("*"):
+                term, kind = term[:-1], PREFIX
+            term = fold(term)
+            if term:
+                patterns.append((term, kind))
+        self.terms = len(patterns)
+        patterns.extend((link, LINK) for link in LINKS)
+
+        self.automaton = Automaton([pattern for pattern, _ in patterns])
+        self.patterns = [(len(pattern), kind) for pattern, kind in patterns]
+        self.max_links = max_links
+        self.repeated = re.compile(r"(\S)\1{%d,}" % max_repeat)
+
+    def check(self, text):
+        """Return why ``text`` can't be posted, or ``None`` if it can."""
+        folded = fold(text)
+        links = 0
+        for end, index in self.automaton.scan(folded):
+            length, kind = self.patterns[index]
+            start = end - length + 1
+            if kind == LINK:
+                if folded[start - 2 : start] != "//":
+                    links += 1
+                continue
+            if start > 0 and folded[start - 1].isalnum():
+                continue
+            if kind == TERM and end + 1 < len(folded) and folded[end + 1].isalnum():
+                continue
+            return BANNED
+
+        if links > self.max_links:
+            return f"Too many links, at most {self.max_links} please."
+        if self.repeated.search(text):
+            return "Please don't repeat the same character over and over."
+        return None
+
+
+def read_terms(path):
+    """Return the terms of a banned terms file, one per line, skipping
+    blank lines and ``#`` comments. A missing file has none.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    except FileNotFoundError:
+        return []
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+class FilterLoader:
+    """Holds the :class:`ContentFilter` built from the banned terms file
+    and rebuilds it when the file changes, looking at most every
+    ``interval`` seconds.
+
+    The new filter is built aside and swapped in, so requests keep using
+    the old one meanwhile, and only one request does the rebuilding.
+    """
+
+    def __init__(self, path, max_links, max_repeat, interval, logger):
+        self.path = path
+        self.max_links = max_links
+        self.max_repeat = max_repeat
+        self.interval = interval
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.checked = None
+        self.version = None
+        self.filter = ContentFilter((), max_links, max_repeat)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self):
+        now = time.monotonic()
+        if self.checked is not None and now - self.checked < self.interval:
+            return self.filter
+        if not self.lock.acquire(blocking=False):
+            return self.filter
+        try:
+            self.checked = now
+            version = self._stat()
+            if version != self.version:
+                self.version = version
+                self.filter = ContentFilter(
+                    read_terms(self.path), self.max_links, self.max_repeat
+                )
+                self.logger.info(
+                    "moderation: loaded %d banned terms from %s",
+                    self.filter.terms,
+                    self.path,
+                )
+        finally:
+            self.lock.release()
+        return self.filter
+
+
+def check(*texts):
+    """Return why the first of ``texts`` that breaks the rules can't be
+    posted, or ``None`` if all of them can.
+    """
+    content_filter = current_app.extensions["moderation"].get()
+    for text in texts:
+        error = content_filter.check(text)
+        if error is not None:
+            return error
+    return None
+
+
+def init_app(app):
+    """Filter comments and jokes against ``MODERATION_TERMS``, a banned
+    terms file moderators edit in place, by default ``banned_terms.txt``
+    in the instance folder.
+    """
+    app.config.setdefault(
+        "MODERATION_TERMS", os.path.join(app.instance_path, "banned_terms.txt")
+    )
+    app.config.setdefault("MODERATION_MAX_LINKS", 2)
+    app.config.setdefault("MODERATION_MAX_REPEAT", 10)
+    app.config.setdefault("MODERATION_RELOAD_INTERVAL", 2.0)
+    app.extensions["moderation"] = FilterLoader(
+        app.config["MODERATION_TERMS"],
+        app.config["MODERATION_MAX_LINKS"],
+        app.config["MODERATION_MAX_REPEAT"],
+        app.config["MODERATION_RELOAD_INTERVAL"],
+        app.logger,
+    )
@@ -0,0 +1,219 @@
+import sqlite3
+from collections import namedtuple
+from contextlib import contextmanager
+
+from flask import current_app
+from flask import has_request_context
+from flask import request
+
+#: Most statements, rows and seconds of SQL a view may use; ``None`` is
+#: unlimited, or for ``seconds`` the ``QUERY_TIME_BUDGET`` default.
+Budget = namedtuple("Budget", ("queries", "rows", "seconds"), defaults=(None,))
+
+_ENVIRON_KEY = "flaskr.query_stats"
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more statements or read more rows than its
+    endpoint's budget allows.
+    """
+
+
+def query_budget(queries=None, rows=None, seconds=None):
+    """View decorator declaring how many SQL statements the view may run
+    and how many rows it may read per request, counting the statements
+    run before it, like loading the logged in user.
+
+    ``seconds`` is enforced whether or not queries are counted, see
+    :mod:`flaskr.timeouts`.
+    """
+
+    def decorator(view):
+        view.query_budget = Budget(queries, rows, seconds)
+        return view
+
+    return decorator
+
+
+class QueryStats:
+    """The statements run and rows read while handling one request,
+    including the part of a streamed response produced after the view
+    returned.
+    """
+
+    def __init__(self, endpoint, budget, strict, logger):
+        self.endpoint = endpoint
+        self.budget = budget
+        self.strict = strict
+        self.logger = logger
+        self.queries = 0
+        self.rows = 0
+        self.violation = None
+
+    def query(self):
+        self.queries += 1
+        limit = self.budget and self.budget.queries
+        if limit is not None and self.queries > limit:
+            self._exceeded(f"ran {self.queries} queries, budget is {limit}")
+
+    def read(self, rows):
+        self.rows += rows
+        limit = self.budget and self.budget.rows
+        if limit is not None and self.rows > limit:
+            self._exceeded(f"read {self.rows} rows, budget is {limit}")
+
+    def _exceeded(self, what):
+        first = self.violation is None
+        self.violation = f"{self.endpoint} {what}"
+        if self.strict:
+            raise QueryBudgetExceeded(self.violation)
+        if first:
+            self.logger.warning("query budget exceeded: %s", self.violation)
+
+
+class CountingCursor(sqlite3.Cursor):
+    """Cursor that counts its statements, and the rows read from them,
+    toward the :class:`QueryStats` of the request current when the
+    statement ran, whichever request opened the connection.
+    """
+
+    stats = None
+
+    def _count(self):
+        self.stats = current_stats()
+        if self.stats is not None:
+            self.stats.query()
+
+    def _read(self, rows):
+        if self.stats is not None:
+            self.stats.read(rows)
+
+    def execute(self, sql, parameters=()):
+        self._count()
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._count()
+        return super().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._count()
+        return super().executescript(sql_script)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._read(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._read(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._read(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self._read(1)
+        return row
+
+
+class CountingConnection(sqlite3.Connection):
+    """Connection whose cursors are :class:`CountingCursor`, including
+    the ones the ``execute`` shortcuts create.
+    """
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def current_stats():
+    """Return the current request's :class:`QueryStats`, or ``None``
+    outside of a request or when ``QUERY_STATS`` is off.
+
+    The stats live in the WSGI environ rather than ``g`` so that a
+    streamed response, which runs in a new app context, adds to them.
+    """
+    if not has_request_context() or not current_app.config["QUERY_STATS"]:
+        return None
+
+    stats = request.environ.get(_ENVIRON_KEY)
+    if stats is None:
+        view = current_app.view_functions.get(request.endpoint)
+        stats = QueryStats(
+            request.endpoint,
+            getattr(view, "query_budget", None),
+            current_app.config["QUERY_BUDGET_STRICT"],
+            current_app.logger,
+        )
+        request.environ[_ENVIRON_KEY] = stats
+        for captured in current_app.extensions["query_stats"]:
+            captured.append(stats)
+
+    return stats
+
+
+def connect(database):
+    """Open a connection to ``database`` that counts toward the current
+    request's stats, or a plain one when there are none to keep.
+    """
+    if current_stats() is None:
+        return sqlite3.connect(database)
+    return sqlite3.connect(database, factory=CountingConnection)
+
+
+@contextmanager
+def capture(app):
+    """Collect the :class:`QueryStats` of every request ``app`` handles
+    inside the block. Read them once the response has been consumed.
+    """
+    captured = []
+    app.extensions["query_stats"].append(captured)
+    try:
+        yield captured
+    finally:
+        app.extensions["query_stats"].remove(captured)
+
+
+def check_stats(response):
+    """Fail a request that exceeded its budget even if the view caught
+    the error, and add the counts as headers if configured.
+    """
+    stats = current_stats()
+    if stats is None:
+        return response
+
+    if stats.violation is not None and stats.strict:
+        raise QueryBudgetExceeded(stats.violation)
+
+    if current_app.config["QUERY_STATS_HEADER"]:
+        # a streamed body's queries run later and aren't included
+        response.headers["X-Query-Count"] = str(stats.queries)
+        response.headers["X-Query-Rows"] = str(stats.rows)
+    return response
+
+
+def init_app(app):
+    """Count each request's queries when ``QUERY_STATS`` is set, by
+    default in debug and testing. Exceeded budgets are logged, or raise
+    :class:`QueryBudgetExceeded` with ``QUERY_BUDGET_STRICT``, the
+    default when testing.
+    """
+    app.config.setdefault("QUERY_STATS", app.debug or app.testing)
+    app.config.setdefault("QUERY_STATS_HEADER", app.debug)
+    app.config.setdefault("QUERY_BUDGET_STRICT", app.testing)
+    app.extensions["query_stats"] = []
+    app.after_request(check_stats)
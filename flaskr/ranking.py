@@ -0,0 +1,100 @@
+import json
+import time
+
+#: An unrated joke scores ``PRIOR_MEAN`` stars, and its ratings are
+#: averaged together with ``PRIOR_WEIGHT`` imaginary ratings of that
+#: many stars, so a single 5 doesn't outrank hundreds of 4.8s.
+PRIOR_MEAN = 3.0
+PRIOR_WEIGHT = 5
+
+#: How fast the "hot" score sinks with age, as in
+#: ``stars / (hours + 2) ** GRAVITY``.
+GRAVITY = 1.8
+
+#: Jokes older than this are left out of the periodic decay; their hot
+#: scores are close enough to zero that the order no longer changes.
+HOT_WINDOW = 7 * 24 * 3600
+
+#: Bayesian average of ``{0}`` stars over ``{1}`` ratings.
+SCORE = f"({PRIOR_MEAN * PRIOR_WEIGHT} + {{0}}) / ({PRIOR_WEIGHT} + {{1}})"
+
+#: Hot score of ``{0}`` stars over ``{1}`` ratings for a joke posted at
+#: ``{2}``, as of ``{3}``, all epoch seconds. Stars above the prior
+#: count for a joke and stars below it against.
+HOT = (
+    f"({{0}} - {PRIOR_MEAN} * {{1}})"
+    f" / pow(MAX({{3}} - {{2}}, 0) / 3600.0 + 2, {GRAVITY})"
+)
+
+#: Recomputes one post's rating totals and scores from the rating table.
+RESCORE = f"""
+    UPDATE post
+    SET rating_sum = t.total,
+        rating_count = t.count,
+        score = {SCORE.format("t.total", "t.count")},
+        hot = {HOT.format("t.total", "t.count", "post.created", ":now")}
+    FROM (SELECT COALESCE(SUM(rating), 0) AS total, COUNT(*) AS count
+          FROM rating WHERE post_id = :id) AS t
+    WHERE post.id = :id
+    RETURNING rating_sum, rating_count
+"""
+
+#: :data:`RESCORE` for every post in the JSON array ``:ids`` at once.
+#: Rated posts only, since a post without ratings has no group.
+RESCORE_MANY = f"""
+    UPDATE post
+    SET rating_sum = t.total,
+        rating_count = t.count,
+        score = {SCORE.format("t.total", "t.count")},
+        hot = {HOT.format("t.total", "t.count", "post.created", ":now")}
+    FROM (SELECT post_id, SUM(rating) AS total, COUNT(*) AS count
+          FROM rating
+          WHERE post_id IN (SELECT value FROM json_each(:ids))
+          GROUP BY post_id) AS t
+    WHERE post.id = t.post_id
+    RETURNING id, rating_sum, rating_count
+"""
+
+#: Recomputes the hot scores of the rated posts created after ``:cutoff``.
+DECAY = f"""
+    UPDATE post
+    SET hot = {HOT.format("rating_sum", "rating_count", "created", ":now")}
+    WHERE created > :cutoff AND rating_count > 0
+"""
+
+
+def rescore(db, post_id, now=None):
+    """Bring a post's stored totals and scores up to date after its
+    ratings changed, and return its ``(average, count)``, or ``None`` if
+    the post doesn't exist.
+
+    Runs in the caller's transaction, so the scores are committed
+    together with the rating.
+    """
+    row = db.execute(
+        RESCORE, {"id": post_id, "now": time.time() if now is None else now}
+    ).fetchone()
+    if row is None:
+        return None
+    total, count = row[0], row[1]
+    return (total / count if count else 0, count)
+
+
+def rescore_many(db, post_ids, now=None):
+    """:func:`rescore` several rated posts in one statement and return
+    ``{post_id: (average, count)}``.
+    """
+    rows = db.execute(
+        RESCORE_MANY,
+        {"ids": json.dumps(list(post_ids)), "now": time.time() if now is None else now},
+    ).fetchall()
+    return {row[0]: (row[1] / row[2], row[2]) for row in rows}
+
+
+def decay(db, now=None):
+    """Recompute the hot score of the rated jokes posted within
+    ``HOT_WINDOW`` and return how many were updated. Read off the
+    ``post_created`` index, so only recent jokes are visited.
+    """
+    now = time.time() if now is None else now
+    return db.execute(DECAY, {"now": now, "cutoff": now - HOT_WINDOW}).rowcount
@@ -0,0 +1,185 @@
+import atexit
+import sqlite3
+import threading
+
+from . import ranking
+
+
+class RatingBuffer:
+    """Write-behind buffer for joke ratings.
+
+    Ratings are collapsed per ``(post_id, user_id)`` and written, with
+    the rated posts' new scores, in a single transaction every
+    ``interval`` seconds, or as soon as ``max_entries`` are waiting.
+    Per-post sums and counts are kept in memory so the rating response
+    reflects the new rating immediately.
+
+    A post's aggregate is loaded from the database the first time it is
+    rated and dropped again once none of its ratings are waiting to be
+    written, so the cache stays small and resyncs with the table.
+    """
+
+    def __init__(self, database, interval=0.2, max_entries=500, logger=None):
+        self.database = database
+        self.interval = interval
+        self.max_entries = max_entries
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = {}
+        self.inflight = {}
+        #: post_id -> [sum, count] including pending ratings
+        self.aggregates = {}
+        #: (post_id, user_id) -> rating, for posts in ``aggregates``
+        self.known = {}
+        self.stopped = threading.Event()
+        self.thread = None
+        self.conn = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self._run, name="rating-flush", daemon=True
+        )
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        """Stop the flush thread and write out whatever is left."""
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.flush()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def rate(self, db, post_id, user_id, rating):
+        """Record a rating and return the post's ``(average, count)``
+        including every rating not yet written.
+
+        ``db`` is the request's connection, used to load the committed
+        aggregate and the user's previous rating when they aren't cached.
+        """
+        key = (post_id, user_id)
+
+        with self.lock:
+            aggregate = self.aggregates.get(post_id)
+            if aggregate is None:
+                row = db.execute(
+                    "SELECT COALESCE(SUM(rating), 0), COUNT(*)"
+                    " FROM rating WHERE post_id = ?",
+                    (post_id,),
+                ).fetchone()
+                aggregate = self.aggregates[post_id] = [row[0], row[1]]
+
+            if key in self.known:
+                previous = self.known[key]
+            else:
+                row = db.execute(
+                    "SELECT rating FROM rating WHERE post_id = ? AND user_id = ?",
+                    key,
+                ).fetchone()
+                previous = row[0] if row else None
+
+            if previous is None:
+                aggregate[1] += 1
+                aggregate[0] += rating
+            else:
+                aggregate[0] += rating - previous
+
+            self.known[key] = rating
+            self.pending[key] = rating
+            full = len(self.pending) >= self.max_entries
+            total, count = aggregate
+
+        if full:
+            self.flush()
+
+        return total / count, count
+
+    def discard(self, post_id):
+        """Forget a deleted post's waiting ratings and cached aggregate."""
+        with self.lock:
+            for key in [k for k in self.pending if k[0] == post_id]:
+                del self.pending[key]
+            for key in [k for k in self.known if k[0] == post_id]:
+                del self.known[key]
+            self.aggregates.pop(post_id, None)
+
+    def flush(self):
+        """Write every waiting rating in one transaction and return how
+        many were written.
+        """
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                self.inflight, self.pending = self.pending, {}
+
+            try:
+                if self.conn is None:
+                    self.conn = sqlite3.connect(
+                        self.database, check_same_thread=False
+                    )
+                with self.conn:
+                    self.conn.executemany(
+                        """INSERT INTO rating (post_id, user_id, rating)
+                           VALUES (?, ?, ?)
+                           ON CONFLICT(post_id, user_id)
+                           DO UPDATE SET rating = excluded.rating,
+                                         created = excluded.created""",
+                        [(p, u, r) for (p, u), r in self.inflight.items()],
+                    )
+                    for post_id in {post_id for post_id, _ in self.inflight}:
+                        ranking.rescore(self.conn, post_id)
+            except sqlite3.Error as e:
+                if self.logger is not None:
+                    self.logger.error("rating flush failed, will retry: %s", e)
+                with self.lock:
+                    # newer ratings for the same key win over the retry
+                    self.pending = {**self.inflight, **self.pending}
+                    self.inflight = {}
+                return 0
+
+            written = len(self.inflight)
+            with self.lock:
+                waiting = {post_id for post_id, _ in self.pending}
+                for post_id, _ in self.inflight:
+                    if post_id not in waiting:
+                        self.aggregates.pop(post_id, None)
+                self.known = {
+                    k: v for k, v in self.known.items() if k[0] in self.aggregates
+                }
+                self.inflight = {}
+
+            return written
+
+
+def get_buffer(app):
+    """Return the app's rating buffer, or ``None`` when ratings are
+    written synchronously.
+    """
+    return app.extensions.get("rating_buffer")
+
+
+def init_app(app):
+    """Start the write-behind rating buffer if ``RATING_WRITE_BEHIND``
+    is enabled.
+    """
+    app.config.setdefault("RATING_WRITE_BEHIND", False)
+    app.config.setdefault("RATING_FLUSH_INTERVAL", 0.2)
+    app.config.setdefault("RATING_FLUSH_MAX", 500)
+
+    if app.config["RATING_WRITE_BEHIND"]:
+        buffer = RatingBuffer(
+            app.config["DATABASE"],
+            interval=app.config["RATING_FLUSH_INTERVAL"],
+            max_entries=app.config["RATING_FLUSH_MAX"],
+            logger=app.logger,
+        )
+        buffer.start()
+        app.extensions["rating_buffer"] = buffer
@@ -0,0 +1,212 @@
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .db import get_db
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only the recommend job needs it
+    np = None
+
+
+def _expand(starts, lengths):
+    """Return ``(owner, position)`` arrays pairing each index of
+    ``starts`` with every position in ``starts[i]:starts[i] + lengths[i]``.
+    """
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(owner.size) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owner, starts[owner] + offsets
+
+
+def _sum_by_key(keys, values):
+    """Return the distinct ``keys`` and the sum of their ``values``."""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=values, minlength=keys.size)
+
+
+def _top(groups, others, scores, count):
+    """Keep the ``count`` best positive scores of each group, returned as
+    ``(group, rank, other, score)`` arrays ordered by group and rank.
+    """
+    keep = scores > 0
+    groups, others, scores = groups[keep], others[keep], scores[keep]
+    order = np.lexsort((others, -scores, groups))
+    groups, others, scores = groups[order], others[order], scores[order]
+    firsts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    lengths = np.diff(np.r_[firsts, groups.size])
+    ranks = np.arange(groups.size) - np.repeat(firsts, lengths)
+    keep = ranks < count
+    return groups[keep], ranks[keep], others[keep], scores[keep]
+
+
+def center(users, ratings):
+    """Subtract each user's mean from their ratings, so what counts is
+    whether they liked a joke more or less than they usually do.
+    """
+    counts = np.bincount(users)
+    means = np.bincount(users, weights=ratings) / np.maximum(counts, 1)
+    return ratings - means[users]
+
+
+def similar_items(users, items, values, n_items, count, max_pairs=4_000_000):
+    """Return the ``count`` most similar items of every item as
+    ``(item, rank, neighbor, similarity)`` arrays.
+
+    ``users``, ``items`` and ``values`` are the sparse rating matrix as
+    triples, numbered from 0, with centered ratings. Similarity is the
+    cosine between two items' rating columns. Only the pairs some user
+    actually rated are generated, per user, never the dense item x item
+    matrix, in batches of about ``max_pairs``.
+    """
+    norms = np.sqrt(np.bincount(items, weights=values**2, minlength=n_items))
+
+    order = np.argsort(users, kind="stable")
+    users, items, values = users[order], items[order], values[order]
+    firsts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    lengths = np.diff(np.r_[firsts, users.size])
+
+    # a user with n ratings makes n * n pairs
+    batch = (np.cumsum(lengths**2) - 1) // max_pairs
+    splits = np.flatnonzero(np.diff(batch)) + 1
+    keys, dots = [], []
+    for batch_firsts, batch_lengths in zip(
+        np.split(firsts, splits), np.split(lengths, splits)
+    ):
+        # each of the batch's ratings with every rating of the same user
+        left = _expand(batch_firsts, batch_lengths)[1]
+        owner, right = _expand(
+            np.repeat(batch_firsts, batch_lengths), np.repeat(batch_lengths, batch_lengths)
+        )
+        left = left[owner]
+        pair = left != right
+        left, right = left[pair], right[pair]
+        batch_keys, batch_dots = _sum_by_key(
+            items[left] * n_items + items[right], values[left] * values[right]
+        )
+        keys.append(batch_keys)
+        dots.append(batch_dots)
+
+    keys, dots = _sum_by_key(
+        np.concatenate(keys or [np.zeros(0, np.int64)]),
+        np.concatenate(dots or [np.zeros(0)]),
+    )
+    item, neighbor = np.divmod(keys, n_items)
+    scale = norms[item] * norms[neighbor]
+    similarity = np.divide(dots, scale, out=np.zeros_like(dots), where=scale > 0)
+    return _top(item, neighbor, similarity, count)
+
+
+def recommend_items(users, items, values, neighbors, n_items, count, exclude=()):
+    """Return the ``count`` best items for every user as ``(user, rank,
+    item, score)`` arrays.
+
+    An item scores the sum, over the user's ratings, of its similarity
+    to the rated item times the centered rating, using only the
+    precomputed ``neighbors`` of each rated item. Items the user rated
+    and the ``user * n_items + item`` keys in ``exclude`` are skipped.
+    """
+    item, _, neighbor, similarity = neighbors
+    starts = np.searchsorted(item, np.arange(n_items))
+    lengths = np.bincount(item, minlength=n_items)
+
+    owner, position = _expand(starts[items], lengths[items])
+    keys, scores = _sum_by_key(
+        users[owner] * n_items + neighbor[position],
+        similarity[position] * values[owner],
+    )
+    seen = np.concatenate([users * n_items + items, np.asarray(exclude, np.int64)])
+    keep = ~np.isin(keys, seen)
+    user, candidate = np.divmod(keys[keep], n_items)
+    return _top(user, candidate, scores[keep], count)
+
+
+def rebuild(db, neighbors, count):
+    """Recompute every joke's similar jokes and every user's
+    recommendations from the rating table, replace the contents of
+    ``post_neighbor`` and ``recommendation`` and return how many jokes
+    and users got rows.
+    """
+    ratings = np.array(
+        db.execute("SELECT user_id, post_id, rating FROM rating").fetchall(),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    user_ids, users = np.unique(ratings[:, 0], return_inverse=True)
+    post_ids, items = np.unique(ratings[:, 1], return_inverse=True)
+    values = center(users, ratings[:, 2].astype(np.float64))
+
+    # don't recommend jokes to their authors
+    authors = np.array(
+        db.execute("SELECT id, author_id FROM post").fetchall(), dtype=np.int64
+    ).reshape(-1, 2)
+    authors = authors[np.isin(authors[:, 0], post_ids) & np.isin(authors[:, 1], user_ids)]
+    exclude = (
+        np.searchsorted(user_ids, authors[:, 1]) * post_ids.size
+        + np.searchsorted(post_ids, authors[:, 0])
+    )
+
+    similar = similar_items(users, items, values, post_ids.size, neighbors)
+    recommended = recommend_items(
+        users, items, values, similar, post_ids.size, count, exclude
+    )
+
+    item, rank, neighbor, similarity = similar
+    user, user_rank, post, score = recommended
+    with db:
+        db.execute("DELETE FROM post_neighbor")
+        db.executemany(
+            "INSERT INTO post_neighbor (post_id, rank, neighbor_id, similarity)"
+            " VALUES (?, ?, ?, ?)",
+            zip(
+                post_ids[item].tolist(),
+                rank.tolist(),
+                post_ids[neighbor].tolist(),
+                similarity.tolist(),
+            ),
+        )
+        db.execute("DELETE FROM recommendation")
+        db.executemany(
+            "INSERT INTO recommendation (user_id, rank, post_id, score)"
+            " VALUES (?, ?, ?, ?)",
+            zip(
+                user_ids[user].tolist(),
+                user_rank.tolist(),
+                post_ids[post].tolist(),
+                score.tolist(),
+            ),
+        )
+
+    return np.unique(item).size, np.unique(user).size
+
+
+@click.command("recommend")
+@click.option("--neighbors", type=int, help="Similar jokes kept per joke.")
+@click.option("--count", type=int, help="Recommendations kept per user.")
+@with_appcontext
+def recommend_command(neighbors, count):
+    """Recompute similar jokes and "jokes you might like"."""
+    if np is None:
+        raise click.ClickException("The recommend job needs numpy: pip install numpy")
+
+    config = current_app.config
+    start = time.monotonic()
+    jokes, users = rebuild(
+        get_db(),
+        neighbors or config["RECOMMEND_NEIGHBORS"],
+        count or config["RECOMMEND_COUNT"],
+    )
+    click.echo(
+        f"Found similar jokes for {jokes} jokes and recommendations for"
+        f" {users} users in {time.monotonic() - start:.2f}s."
+    )
+
+
+def init_app(app):
+    """Register the recommend command. It's meant to run offline, from
+    cron, since the index only reads what it wrote.
+    """
+    app.config.setdefault("RECOMMEND_NEIGHBORS", 20)
+    app.config.setdefault("RECOMMEND_COUNT", 5)
+    app.cli.add_command(recommend_command)
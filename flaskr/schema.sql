@@ -1,10 +1,22 @@
 -- Initialize the database.
 -- Drop any existing data and create empty tables.
 
+-- Free pages are handed back by `flask db-maintain` rather than
+-- lingering in the file; the VACUUM below applies the setting to
+-- databases that were created before it existed.
+PRAGMA auto_vacuum = INCREMENTAL;
+PRAGMA journal_mode = WAL;
+
+DROP TABLE IF EXISTS post_tag;
+DROP TABLE IF EXISTS tag;
+DROP TABLE IF EXISTS post_lsh;
+DROP TABLE IF EXISTS recommendation;
+DROP TABLE IF EXISTS post_neighbor;
 DROP TABLE IF EXISTS comment;
 DROP TABLE IF EXISTS rating;
 DROP TABLE IF EXISTS user;
 DROP TABLE IF EXISTS post;
+VACUUM;
 
 CREATE TABLE user (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -14,32 +26,121 @@ CREATE TABLE user (
   created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Timestamps are seconds since the epoch (UTC). The link table is
+-- clustered on its natural key instead of carrying a rowid and a
+-- separate UNIQUE index.
 CREATE TABLE post (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   author_id INTEGER NOT NULL,
-  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  created INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
   title TEXT NOT NULL,
   body TEXT NOT NULL,
+  -- Kept up to date by ranking.py on every rating, so the feed's sort
+  -- orders are index reads.
+  rating_sum INTEGER NOT NULL DEFAULT 0,
+  rating_count INTEGER NOT NULL DEFAULT 0,
+  score REAL NOT NULL DEFAULT 3.0,
+  hot REAL NOT NULL DEFAULT 0,
   FOREIGN KEY (author_id) REFERENCES user (id)
 );
 
 CREATE TABLE rating (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
   post_id INTEGER NOT NULL,
   user_id INTEGER NOT NULL,
   rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
-  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  created INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+  PRIMARY KEY (post_id, user_id),
   FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
-  FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE,
-  UNIQUE (post_id, user_id)
-);
+  FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
+) WITHOUT ROWID;
 
 CREATE TABLE comment (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   post_id INTEGER NOT NULL,
   user_id INTEGER NOT NULL,
   body TEXT NOT NULL,
-  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  created INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
   FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
   FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE
 );
+
+-- Written by `flask recommend`: each joke's most similar jokes and
+-- each user's "jokes you might like", read back in rank order.
+CREATE TABLE post_neighbor (
+  post_id INTEGER NOT NULL,
+  rank INTEGER NOT NULL,
+  neighbor_id INTEGER NOT NULL,
+  similarity REAL NOT NULL,
+  PRIMARY KEY (post_id, rank),
+  FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE,
+  FOREIGN KEY (neighbor_id) REFERENCES post (id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE recommendation (
+  user_id INTEGER NOT NULL,
+  rank INTEGER NOT NULL,
+  post_id INTEGER NOT NULL,
+  score REAL NOT NULL,
+  PRIMARY KEY (user_id, rank),
+  FOREIGN KEY (user_id) REFERENCES user (id) ON DELETE CASCADE,
+  FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- MinHash LSH buckets of each joke's body, one per band, for finding
+-- near-duplicates (see duplicates.py). Rows of deleted jokes are left
+-- behind and drop out when joined with post.
+CREATE TABLE post_lsh (
+  band INTEGER NOT NULL,
+  bucket INTEGER NOT NULL,
+  post_id INTEGER NOT NULL,
+  PRIMARY KEY (band, bucket, post_id)
+) WITHOUT ROWID;
+
+-- Tags, each with the number of jokes carrying it for the feed's
+-- facets, and their inverted index: a tag's postings are read in
+-- post_id order straight off the primary key. post_count is kept by
+-- the triggers below, including when a joke is deleted.
+CREATE TABLE tag (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  name TEXT UNIQUE NOT NULL,
+  post_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE post_tag (
+  tag_id INTEGER NOT NULL,
+  post_id INTEGER NOT NULL,
+  PRIMARY KEY (tag_id, post_id),
+  FOREIGN KEY (tag_id) REFERENCES tag (id) ON DELETE CASCADE,
+  FOREIGN KEY (post_id) REFERENCES post (id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TRIGGER post_tag_added AFTER INSERT ON post_tag BEGIN
+  UPDATE tag SET post_count = post_count + 1 WHERE id = new.tag_id;
+END;
+
+CREATE TRIGGER post_tag_removed AFTER DELETE ON post_tag BEGIN
+  UPDATE tag SET post_count = post_count - 1 WHERE id = old.tag_id;
+END;
+
+CREATE TRIGGER post_untagged AFTER DELETE ON post BEGIN
+  DELETE FROM post_tag WHERE post_id = old.id;
+END;
+
+-- Secondary indexes, matched to the lookups in jokes.py and auth.py.
+-- rating's primary key serves lookups by post, including the per-post
+-- AVG(rating); rating_user also holds the key's post_id.
+CREATE INDEX post_author_created ON post (author_id, created);
+-- Serves the nickname LIKE 'prefix%' of /auth/users/suggest.
+CREATE INDEX user_nickname_nocase ON user (nickname COLLATE NOCASE);
+CREATE INDEX rating_user ON rating (user_id);
+CREATE INDEX comment_post_created ON comment (post_id, created);
+-- A joke's tags for its card and the facets; the top facets in order.
+CREATE INDEX post_tag_post ON post_tag (post_id);
+CREATE INDEX tag_post_count ON tag (post_count DESC, name);
+-- One per ?sort= order of the feed.
+CREATE INDEX post_score ON post (score, created);
+CREATE INDEX post_hot ON post (hot, created);
+CREATE INDEX post_created ON post (created);
+
+-- Must match the newest version in migrations.py.
+PRAGMA user_version = 10;
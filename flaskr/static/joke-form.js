@@ -0,0 +1,54 @@
+// Title word counter
+const titleInput = document.getElementById('title');
+const titleCounter = document.getElementById('title-counter');
+
+function updateTitleCounter() {
+  const words = titleInput.value.trim().split(/\s+/).filter(word => word.length > 0);
+  const wordCount = titleInput.value.trim() === '' ? 0 : words.length;
+  titleCounter.textContent = `${wordCount} / 10 words`;
+
+  if (wordCount > 10) {
+    titleCounter.classList.add('error');
+    titleCounter.classList.remove('warning');
+  } else if (wordCount > 8) {
+    titleCounter.classList.add('warning');
+    titleCounter.classList.remove('error');
+  } else {
+    titleCounter.classList.remove('warning', 'error');
+  }
+}
+
+titleInput.addEventListener('input', updateTitleCounter);
+updateTitleCounter(); // Initial count
+
+// Body character counter
+const bodyInput = document.getElementById('body');
+const bodyCounter = document.getElementById('body-counter');
+
+function updateBodyCounter() {
+  const charCount = bodyInput.value.length;
+  bodyCounter.textContent = `${charCount} characters`;
+}
+
+bodyInput.addEventListener('input', updateBodyCounter);
+updateBodyCounter(); // Initial count
+
+// Form validation
+document.querySelector('form').addEventListener('submit', function(e) {
+  if (this.id === 'delete-form') return; // Skip validation for delete form
+
+  const words = titleInput.value.trim().split(/\s+/).filter(word => word.length > 0);
+  const wordCount = titleInput.value.trim() === '' ? 0 : words.length;
+
+  if (wordCount > 10) {
+    e.preventDefault();
+    alert('Title must be 10 words or less. Please shorten it!');
+    titleInput.focus();
+  }
+
+  if (bodyInput.value.trim() === '') {
+    e.preventDefault();
+    alert('Please write your joke!');
+    bodyInput.focus();
+  }
+});
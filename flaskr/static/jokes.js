@@ -0,0 +1,421 @@
+function rateJoke(jokeId, rating) {
+  fetch(`/${jokeId}/rate`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/x-www-form-urlencoded',
+    },
+    body: `rating=${rating}`
+  })
+  .then(response => response.json())
+  .then(data => {
+    if (data.success) {
+      // Update the stars
+      const jokeCard = document.querySelector(`.star-rating[data-joke-id="${jokeId}"]`).closest('.joke-card');
+      const starContainer = jokeCard.querySelector(`.star-rating[data-joke-id="${jokeId}"]`);
+      const stars = starContainer.querySelectorAll('.star');
+      stars.forEach((star, index) => {
+        star.classList.remove('filled', 'user-rated');
+        if (index < rating) {
+          star.classList.add('filled', 'user-rated');
+        }
+      });
+      
+      // Update rating info
+      const ratingInfo = starContainer.nextElementSibling;
+      ratingInfo.querySelector('.avg-rating').textContent = data.avg_rating.toFixed(1);
+      ratingInfo.querySelector('.rating-count').textContent = 
+        `(${data.rating_count} rating${data.rating_count !== 1 ? 's' : ''})`;
+      
+      // Store the new average rating in the card for sorting
+      jokeCard.dataset.avgRating = data.avg_rating;
+      
+      // Show success message
+      showMessage('Rating saved! ⭐');
+      
+      // Reorder jokes after a brief delay to show the update
+      setTimeout(() => reorderJokes(), 500);
+    } else {
+      showMessage('Error saving rating', true);
+    }
+  })
+  .catch(error => {
+    console.error('Error:', error);
+    showMessage('Error saving rating', true);
+  });
+}
+
+function reorderJokes() {
+  const jokesContainer = document.querySelector('.jokes-list');
+  if (!jokesContainer) return;
+  
+  const jokeCards = Array.from(jokesContainer.querySelectorAll('.joke-card'));
+  
+  // Sort by average rating (highest first), then by creation date
+  jokeCards.sort((a, b) => {
+    const ratingA = parseFloat(a.dataset.avgRating || 0);
+    const ratingB = parseFloat(b.dataset.avgRating || 0);
+    
+    if (ratingB !== ratingA) {
+      return ratingB - ratingA; // Higher rating first
+    }
+    
+    // If ratings are equal, sort by created date (newer first)
+    const dateA = new Date(a.dataset.created);
+    const dateB = new Date(b.dataset.created);
+    return dateB - dateA;
+  });
+  
+  // Add fade out effect
+  jokeCards.forEach(card => {
+    card.style.opacity = '0.3';
+    card.style.transform = card.style.transform + ' scale(0.95)';
+  });
+  
+  // Re-append in new order after brief delay
+  setTimeout(() => {
+    jokeCards.forEach(card => jokesContainer.appendChild(card));
+    
+    // Fade back in with cascading effect
+    setTimeout(() => {
+      jokeCards.forEach(card => {
+        card.style.opacity = '';
+        card.style.transform = '';
+      });
+    }, 100);
+  }, 300);
+}
+
+// Toggle Comment Form
+function toggleCommentForm(jokeId) {
+  const button = document.querySelector(`.btn-show-comment-form[onclick*="${jokeId}"]`);
+  const form = document.getElementById(`comment-form-${jokeId}`);
+  
+  if (form.style.display === 'none' || !form.style.display) {
+    form.style.display = 'block';
+    button.style.display = 'none';
+    // Focus on the textarea
+    form.querySelector('textarea').focus();
+  } else {
+    form.style.display = 'none';
+    button.style.display = 'block';
+    // Clear the form
+    form.querySelector('textarea').value = '';
+    form.querySelector('.comment-char-count').textContent = '0/500';
+  }
+}
+
+// Comment Functions
+async function addComment(event, jokeId) {
+  event.preventDefault();
+  const form = event.target;
+  const textarea = form.querySelector('textarea[name="body"]');
+  const body = textarea.value.trim();
+  
+  if (!body) {
+    showMessage('Comment cannot be empty', true);
+    return;
+  }
+  
+  try {
+    const response = await fetch(`/${jokeId}/comment`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/x-www-form-urlencoded',
+      },
+      body: `body=${encodeURIComponent(body)}`
+    });
+    
+    const data = await response.json();
+    
+    if (data.success) {
+      // Add comment to the list
+      const commentsList = document.getElementById(`comments-${jokeId}`);
+      const commentHtml = `
+        <div class="comment" data-comment-id="${data.comment.id}" data-live>
+          <div class="comment-header">
+            <span class="comment-author">@${data.comment.nickname}</span>
+            <span class="comment-date">Just now</span>
+            ${data.comment.is_owner ? `<button class="btn-delete-comment" onclick="deleteComment(${data.comment.id}, ${jokeId})">🗑️</button>` : ''}
+          </div>
+          <p class="comment-body">${escapeHtml(data.comment.body)}</p>
+        </div>
+      `;
+      // the live stream may have delivered it already
+      const existing = commentsList.querySelector(`[data-comment-id="${data.comment.id}"]`);
+      if (existing) existing.remove();
+      commentsList.insertAdjacentHTML('beforeend', commentHtml);
+      if (!existing) updateCommentCount(commentsList, 1);
+      
+      // Clear form and hide it
+      textarea.value = '';
+      form.querySelector('.comment-char-count').textContent = '0/500';
+      toggleCommentForm(jokeId);
+      
+      showMessage(data.message);
+    } else {
+      showMessage(data.message || 'Failed to add comment', true);
+    }
+  } catch (error) {
+    console.error('Error adding comment:', error);
+    showMessage('An error occurred while adding comment', true);
+  }
+}
+
+// Comments deleted from this page
+const deletedComments = new Set();
+
+async function deleteComment(commentId, jokeId) {
+  if (!confirm('Are you sure you want to delete this comment?')) {
+    return;
+  }
+  
+  try {
+    const response = await fetch(`/comment/${commentId}/delete`, {
+      method: 'POST'
+    });
+    
+    const data = await response.json();
+    
+    if (data.success) {
+      // Remove comment from DOM
+      const commentEl = document.querySelector(`[data-comment-id="${commentId}"]`);
+      if (commentEl) {
+        commentEl.style.animation = 'slideOut 0.3s ease-out';
+        setTimeout(() => commentEl.remove(), 300);
+      }
+      
+      // Update comment count, here rather than when the live stream
+      // reports the deletion too
+      deletedComments.add(commentId);
+      updateCommentCount(document.getElementById(`comments-${jokeId}`), -1);
+      
+      showMessage(data.message);
+    } else {
+      showMessage(data.message || 'Failed to delete comment', true);
+    }
+  } catch (error) {
+    console.error('Error deleting comment:', error);
+    showMessage('An error occurred while deleting comment', true);
+  }
+}
+
+function escapeHtml(text) {
+  const div = document.createElement('div');
+  div.textContent = text;
+  return div.innerHTML;
+}
+
+function showMessage(text, isError = false) {
+  const message = document.createElement('div');
+  message.className = 'rating-message';
+  message.textContent = text;
+  if (isError) {
+    message.style.background = 'linear-gradient(135deg, #ffeaa7 0%, #fdcb6e 100%)';
+    message.style.color = '#d63031';
+  }
+  document.body.appendChild(message);
+  
+  setTimeout(() => {
+    message.style.animation = 'slideInRight 0.3s ease-out reverse';
+    setTimeout(() => message.remove(), 300);
+  }, 2000);
+}
+
+// Add hover effect and click handlers for stars
+document.addEventListener('DOMContentLoaded', function() {
+  document.querySelectorAll('.star-rating[data-joke-id]').forEach(container => {
+    const jokeId = container.getAttribute('data-joke-id');
+    const stars = container.querySelectorAll('.star');
+    
+    stars.forEach((star, index) => {
+      const rating = parseInt(star.getAttribute('data-rating'));
+      
+      // Add click handler
+      star.addEventListener('click', function() {
+        console.log(`Clicking star ${rating} for joke ${jokeId}`);
+        rateJoke(jokeId, rating);
+      });
+      
+      // Add hover effect
+      star.addEventListener('mouseenter', function() {
+        stars.forEach((s, i) => {
+          if (i <= index) {
+            s.classList.add('hovered');
+          } else {
+            s.classList.remove('hovered');
+          }
+        });
+      });
+    });
+    
+    container.addEventListener('mouseleave', function() {
+      stars.forEach(s => s.classList.remove('hovered'));
+    });
+  });
+  
+  // Update card z-index based on scroll position
+  updateCardStacking();
+  window.addEventListener('scroll', updateCardStacking);
+  
+  // Add character counter for comment textareas
+  document.querySelectorAll('.comment-input').forEach(textarea => {
+    const jokeId = textarea.closest('.comment-form').querySelector('.comment-char-count').dataset.jokeId;
+    const counter = document.querySelector(`.comment-char-count[data-joke-id="${jokeId}"]`);
+    
+    textarea.addEventListener('input', function() {
+      const length = this.value.length;
+      counter.textContent = `${length}/500`;
+      
+      if (length > 450) {
+        counter.style.color = '#ff6b6b';
+      } else if (length > 400) {
+        counter.style.color = '#feca57';
+      } else {
+        counter.style.color = '#999';
+      }
+    });
+  });
+});
+
+// Live rating and comment updates for the jokes on this page
+function watchJokes() {
+  const ids = Array.from(document.querySelectorAll('.joke-card'))
+    .map(card => card.id.replace('joke-', ''));
+  if (!ids.length || !window.EventSource) return;
+
+  const source = new EventSource(`/events?jokes=${ids.join(',')}`);
+
+  source.addEventListener('rating', event => {
+    const data = JSON.parse(event.data);
+    const card = document.getElementById(`joke-${data.id}`);
+    if (!card) return;
+    card.querySelector('.avg-rating').textContent = data.avg_rating.toFixed(1);
+    card.querySelector('.rating-count').textContent =
+      `(${data.rating_count} rating${data.rating_count !== 1 ? 's' : ''})`;
+    card.dataset.avgRating = data.avg_rating;
+  });
+
+  source.addEventListener('comment', event => {
+    const data = JSON.parse(event.data);
+    const commentsList = document.getElementById(`comments-${data.id}`);
+    if (!commentsList || commentsList.querySelector(`[data-comment-id="${data.comment.id}"]`)) return;
+    commentsList.insertAdjacentHTML('beforeend', `
+      <div class="comment" data-comment-id="${data.comment.id}" data-live>
+        <div class="comment-header">
+          <span class="comment-author">@${escapeHtml(data.comment.nickname)}</span>
+          <span class="comment-date">Just now</span>
+        </div>
+        <p class="comment-body">${escapeHtml(data.comment.body)}</p>
+      </div>
+    `);
+    updateCommentCount(commentsList, 1);
+  });
+
+  source.addEventListener('comment-deleted', event => {
+    const data = JSON.parse(event.data);
+    const commentsList = document.getElementById(`comments-${data.id}`);
+    if (!commentsList || deletedComments.has(data.comment_id)) return;
+    // it may be further down the thread than has been loaded
+    const commentEl = document.querySelector(`[data-comment-id="${data.comment_id}"]`);
+    if (commentEl) commentEl.remove();
+    updateCommentCount(commentsList, -1);
+  });
+
+  // the server dropped updates for us; the page is out of date
+  source.addEventListener('resync', () => {
+    source.close();
+    location.reload();
+  });
+}
+
+// Only the first comments come with the page, so the count is kept
+// by adding up changes rather than counting the ones shown
+function updateCommentCount(commentsList, change) {
+  const titleEl = commentsList.previousElementSibling;
+  const countMatch = titleEl.textContent.match(/\((\d+)\)/);
+  const count = Math.max(0, (countMatch ? parseInt(countMatch[1]) : 0) + change);
+  titleEl.textContent = `💬 Comments (${count})`;
+}
+
+// Load the next page of a joke's comments after the ones shown
+async function loadComments(button) {
+  const jokeId = button.dataset.jokeId;
+  button.disabled = true;
+
+  try {
+    const response = await fetch(`/${jokeId}/comments?after=${encodeURIComponent(button.dataset.after)}`);
+    const data = await response.json();
+    if (!data.success) {
+      showMessage(data.message || 'Failed to load comments', true);
+      button.disabled = false;
+      return;
+    }
+
+    const commentsList = document.getElementById(`comments-${jokeId}`);
+    // older than any added live since the page loaded, and some of
+    // those may be on this page already
+    const firstLive = commentsList.querySelector('[data-live]');
+    const page = document.createElement('template');
+    page.innerHTML = data.html;
+    page.content.querySelectorAll('.comment').forEach(comment => {
+      const shown = commentsList.querySelector(`[data-comment-id="${comment.dataset.commentId}"]`);
+      if (shown) shown.remove();
+      commentsList.insertBefore(comment, firstLive);
+    });
+
+    if (data.next) {
+      button.dataset.after = data.next;
+      button.disabled = false;
+    } else {
+      button.remove();
+    }
+  } catch (error) {
+    console.error('Error loading comments:', error);
+    showMessage('An error occurred while loading comments', true);
+    button.disabled = false;
+  }
+}
+
+document.addEventListener('DOMContentLoaded', watchJokes);
+
+function updateCardStacking() {
+  const cards = document.querySelectorAll('.joke-card');
+  const scrollY = window.scrollY;
+  const windowHeight = window.innerHeight;
+  const viewportMiddle = scrollY + windowHeight / 2;
+  
+  cards.forEach((card, index) => {
+    const cardRect = card.getBoundingClientRect();
+    const cardTop = scrollY + cardRect.top;
+    const cardBottom = cardTop + cardRect.height;
+    const cardMiddle = cardTop + cardRect.height / 2;
+    
+    // Calculate distance from viewport middle
+    const distanceFromMiddle = Math.abs(cardMiddle - viewportMiddle);
+    
+    // Calculate z-index based on position
+    // Cards closer to middle get higher z-index
+    const baseZIndex = 100;
+    const zIndex = baseZIndex + cards.length - Math.floor(distanceFromMiddle / 50);
+    card.style.zIndex = zIndex;
+    
+    // Add classes based on position relative to viewport middle
+    card.classList.remove('in-view', 'above-view', 'below-view');
+    
+    if (cardMiddle < viewportMiddle - 100) {
+      card.classList.add('above-view');
+    } else if (cardMiddle > viewportMiddle + 100) {
+      card.classList.add('below-view');
+    } else {
+      card.classList.add('in-view');
+    }
+    
+    // Add slight rotation and translation for depth effect
+    const rotation = (cardMiddle - viewportMiddle) / windowHeight * 3; // Max 3 degrees
+    const translateY = (cardMiddle - viewportMiddle) / windowHeight * 10; // Max 10px
+    
+    if (!card.matches(':hover')) {
+      card.style.transform = `translateY(${translateY}px) rotateX(${-rotation}deg) scale(${card.classList.contains('in-view') ? 1 : 0.97})`;
+    }
+  });
+}
@@ -0,0 +1,39 @@
+// Password confirmation validation
+const passwordInput = document.getElementById('password');
+const confirmPassword = document.getElementById('confirm-password');
+
+document.querySelector('form').addEventListener('submit', function(e) {
+  if (passwordInput.value !== confirmPassword.value) {
+    e.preventDefault();
+    alert('Passwords do not match! Please try again.');
+    confirmPassword.focus();
+  }
+});
+
+// Tell whether the email and nickname are free while they're typed
+function checkAvailability(input, field) {
+  const status = document.createElement('div');
+  status.className = 'availability';
+  input.parentNode.appendChild(status);
+  let timer = null;
+
+  input.addEventListener('input', function() {
+    clearTimeout(timer);
+    status.textContent = '';
+    const value = input.value.trim();
+    if (!value || !input.checkValidity()) return;
+    timer = setTimeout(function() {
+      fetch(`/auth/available?${field}=${encodeURIComponent(value)}`)
+        .then(response => response.json())
+        .then(data => {
+          // skip answers for what's no longer typed
+          if (data.value !== input.value.trim()) return;
+          status.textContent = data.available ? `✓ ${field} is free` : `✗ ${field} is taken`;
+          status.classList.toggle('taken', !data.available);
+        });
+    }, 150);
+  });
+}
+
+checkAvailability(document.getElementById('username'), 'email');
+checkAvailability(document.getElementById('nickname'), 'nickname');
@@ -0,0 +1,32 @@
+// Nickname autocomplete for the user search box in the nav
+const userSearch = document.getElementById('user-search');
+const userSuggestions = document.getElementById('user-suggestions');
+let latestQuery = '';
+
+userSearch.addEventListener('input', function() {
+  const query = userSearch.value.trim();
+  latestQuery = query;
+  if (!query) {
+    userSuggestions.replaceChildren();
+    return;
+  }
+  fetch(`/auth/users/suggest?q=${encodeURIComponent(query)}`)
+    .then(response => response.json())
+    .then(data => {
+      // answers can arrive out of order, keep the latest one only
+      if (data.q !== latestQuery) return;
+      userSuggestions.replaceChildren(...data.nicknames.map(nickname => {
+        const option = document.createElement('option');
+        option.value = nickname;
+        return option;
+      }));
+    });
+});
+
+userSearch.form.addEventListener('submit', function(e) {
+  e.preventDefault();
+  const nickname = userSearch.value.trim();
+  if (nickname) {
+    window.location = `/auth/profile/${encodeURIComponent(nickname)}`;
+  }
+});
@@ -0,0 +1,119 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import current_app
+
+#: Nicknames starting with ``?`` in case-insensitive order, read off the
+#: ``user_nickname_nocase`` index; ``\`` escapes ``%`` and ``_``.
+LIKE = """SELECT nickname FROM user
+          WHERE nickname LIKE ? ESCAPE '\\'
+          ORDER BY nickname COLLATE NOCASE
+          LIMIT ?"""
+
+
+def like_prefix(prefix):
+    """Return the ``LIKE`` pattern matching strings that start with
+    ``prefix``.
+    """
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+class NicknameIndex:
+    """Every nickname in a list sorted case-insensitively, so the ones
+    starting with a prefix are found by bisection in ``O(log n + k)``.
+
+    Filled from the user table on first use, then kept up by
+    :meth:`add` on register and by reading the users registered since,
+    by id, every ``refresh`` seconds, which picks up users registered
+    through other processes.
+    """
+
+    def __init__(self, refresh):
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.entries = []
+        self.last_id = 0
+        self.checked = None
+
+    def _insert(self, nickname):
+        """Insert ``nickname`` unless it's there already, as it is when
+        :meth:`catch_up` reads a user :meth:`add` was given. Call with
+        the lock held.
+        """
+        entry = (nickname.lower(), nickname)
+        i = bisect_left(self.entries, entry)
+        if i == len(self.entries) or self.entries[i] != entry:
+            self.entries.insert(i, entry)
+
+    def add(self, nickname):
+        with self.lock:
+            self._insert(nickname)
+
+    def catch_up(self, db):
+        """Add the users registered since the last look, if it's been
+        ``refresh`` seconds. Returns ``False`` without waiting when
+        another request is already at it.
+        """
+        now = time.monotonic()
+        if self.checked is not None and now - self.checked < self.refresh:
+            return True
+        if not self.lock.acquire(blocking=False):
+            return self.checked is not None
+        try:
+            rows = db.execute(
+                "SELECT id, nickname FROM user WHERE id > ? ORDER BY id",
+                (self.last_id,),
+            ).fetchall()
+            for id, nickname in rows:
+                self._insert(nickname)
+            if rows:
+                self.last_id = rows[-1][0]
+            self.checked = now
+        finally:
+            self.lock.release()
+        return True
+
+    def search(self, prefix, count):
+        key = prefix.lower()
+        entries = self.entries
+        found = []
+        i = bisect_left(entries, (key,))
+        while i < len(entries) and len(found) < count:
+            lowered, nickname = entries[i]
+            if not lowered.startswith(key):
+                break
+            found.append(nickname)
+            i += 1
+        return found
+
+
+def suggest(db, prefix, count):
+    """Return up to ``count`` nicknames starting with ``prefix``, in
+    case-insensitive order, from the in-memory index, or from the
+    database while the index is being filled or if
+    ``SUGGEST_IN_MEMORY`` is off.
+    """
+    index = current_app.extensions.get("nickname_index")
+    if index is not None and index.catch_up(db):
+        return index.search(prefix, count)
+    return [row[0] for row in db.execute(LIKE, (like_prefix(prefix), count))]
+
+
+def add(nickname):
+    """Add a newly registered nickname to the in-memory index."""
+    index = current_app.extensions.get("nickname_index")
+    if index is not None:
+        index.add(nickname)
+
+
+def init_app(app):
+    """Keep an in-memory nickname index for ``/auth/users/suggest`` unless
+    ``SUGGEST_IN_MEMORY`` is off.
+    """
+    app.config.setdefault("SUGGEST_IN_MEMORY", True)
+    app.config.setdefault("SUGGEST_REFRESH", 5.0)
+    app.config.setdefault("SUGGEST_COUNT", 8)
+    if app.config["SUGGEST_IN_MEMORY"]:
+        app.extensions["nickname_index"] = NicknameIndex(app.config["SUGGEST_REFRESH"])
@@ -0,0 +1,168 @@
+import json
+import re
+from bisect import bisect_left
+
+from .db import records
+
+#: Most tags on one joke, and in one ``/tag/a+b`` filter.
+MAX_TAGS = 5
+MAX_FILTER = 3
+
+#: Lowercase words joined by single dashes, like ``knock-knock``.
+NAME = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+MAX_LENGTH = 30
+
+#: The most used tags, off ``tag_post_count``, for the index's facets.
+TOP = """
+    SELECT name, post_count FROM tag
+    WHERE post_count > 0
+    ORDER BY post_count DESC, name
+    LIMIT ?
+"""
+
+#: The tags found among a set of jokes, with how many of them carry
+#: each, read off ``post_tag_post`` one joke at a time.
+FACETS = """
+    SELECT t.name, COUNT(*) AS post_count
+    FROM json_each(?) AS j
+    JOIN post_tag pt ON pt.post_id = j.value
+    JOIN tag t ON t.id = pt.tag_id
+    GROUP BY t.id
+    ORDER BY post_count DESC, t.name
+    LIMIT ?
+"""
+
+#: A tag's posting list, or the part of it between two ids, in id
+#: order straight off post_tag's primary key.
+POSTINGS = """
+    SELECT post_id FROM post_tag
+    WHERE tag_id = ? AND post_id BETWEEN ? AND ?
+    ORDER BY post_id
+"""
+
+
+def parse(text):
+    """Return the tag names in ``text``, separated by commas or spaces,
+    lowercased and without a leading ``#`` or repeats.
+    """
+    names = []
+    for word in re.split(r"[\s,]+", text.lower()):
+        word = word.lstrip("#")
+        if word and word not in names:
+            names.append(word)
+    return names
+
+
+def check(names):
+    """Return why ``names`` can't be a joke's tags, or ``None``."""
+    if len(names) > MAX_TAGS:
+        return f"A joke can have at most {MAX_TAGS} tags."
+    for name in names:
+        if len(name) > MAX_LENGTH or not NAME.fullmatch(name):
+            return (
+                f"Tag '{name}' must be up to {MAX_LENGTH} letters, numbers"
+                " and single dashes."
+            )
+    return None
+
+
+def add(db, post_id, names):
+    """Tag a new joke with ``names``. Triggers on post_tag keep each
+    tag's ``post_count``.
+    """
+    if not names:
+        return
+    names = json.dumps(names)
+    db.execute("INSERT OR IGNORE INTO tag (name) SELECT value FROM json_each(?)", (names,))
+    db.execute(
+        """INSERT OR IGNORE INTO post_tag (tag_id, post_id)
+           SELECT id, ? FROM tag WHERE name IN (SELECT value FROM json_each(?))""",
+        (post_id, names),
+    )
+
+
+def replace(db, post_id, names):
+    """Make ``names`` the tags of an existing joke."""
+    db.execute(
+        """DELETE FROM post_tag
+           WHERE post_id = ?
+             AND tag_id NOT IN (SELECT id FROM tag
+                                WHERE name IN (SELECT value FROM json_each(?)))""",
+        (post_id, json.dumps(names)),
+    )
+    add(db, post_id, names)
+
+
+def intersect(lists):
+    """Return the ids found in every one of the ascending ``lists``.
+
+    Walks the shortest list and looks each of its ids up in the others
+    by bisection, starting from where the last lookup ended, so the
+    work grows with the shortest list rather than the longest.
+    """
+    if not lists:
+        return []
+    lists = sorted(lists, key=len)
+    found = lists[0]
+    for other in lists[1:]:
+        kept = []
+        i = 0
+        for id in found:
+            i = bisect_left(other, id, i)
+            if i == len(other):
+                break
+            if other[i] == id:
+                kept.append(id)
+        found = kept
+        if not found:
+            break
+    return found
+
+
+def matching(db, names):
+    """Return the ascending ids of the jokes tagged with all of
+    ``names``, or ``None`` if one of the tags doesn't exist.
+
+    The rarest tag's postings are read first; every further tag's are
+    read only between the lowest and highest id still in the running,
+    and not at all once nothing is.
+    """
+    tags = db.execute(
+        """SELECT id FROM tag WHERE name IN (SELECT value FROM json_each(?))
+           ORDER BY post_count""",
+        (json.dumps(names),),
+    ).fetchall()
+    if len(tags) < len(names):
+        return None
+
+    found = None
+    for tag in tags:
+        low, high = (found[0], found[-1]) if found else (0, 2**63 - 1)
+        postings = [
+            row[0] for row in db.execute(POSTINGS, (tag["id"], low, high))
+        ]
+        found = postings if found is None else intersect([found, postings])
+        if not found:
+            return []
+    return found
+
+
+def top(count):
+    """Yield the ``count`` most used tags and how many jokes have each.
+    Like the feed's, the query runs on the first iteration.
+    """
+    yield from records(TOP, (count,))
+
+
+def facets(ids, count, exclude=()):
+    """Yield the ``count`` tags most common among the jokes ``ids``,
+    leaving out those in ``exclude``.
+    """
+    for facet in records(FACETS, (json.dumps(ids), count + len(exclude))):
+        if facet.name not in exclude:
+            yield facet
+
+
+def init_app(app):
+    """Show up to ``TAG_FACETS`` tags with their counts on the feed."""
+    app.config.setdefault("TAG_FACETS", 12)
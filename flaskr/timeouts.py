@@ -0,0 +1,205 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import Response
+from flask import current_app
+from flask import has_request_context
+from flask import request
+
+_CLOCK_KEY = "flaskr.query_clock"
+
+MESSAGE = "This page is taking too long to load. Please try again in a moment."
+
+
+def is_interrupt(e):
+    """Whether ``e`` is SQLite reporting a statement cancelled by the
+    progress handler.
+    """
+    return "interrupted" in str(e)
+
+
+class Clock:
+    """The time a request has spent against its query time budget.
+
+    It runs while the request is worked on and stops while a streamed
+    page waits for the client to take a chunk, so the time spent writing
+    to a slow reader's socket isn't counted against its queries.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.spent = 0.0
+        self.since = time.monotonic()
+        #: Set once the response has started streaming.
+        self.streaming = False
+
+    def stop(self):
+        if self.since is not None:
+            self.spent += time.monotonic() - self.since
+            self.since = None
+
+    def start(self):
+        if self.since is None:
+            self.since = time.monotonic()
+
+    def expired(self):
+        spent = self.spent
+        if self.since is not None:
+            spent += time.monotonic() - self.since
+        return spent >= self.seconds
+
+
+class QueryTimeouts:
+    """Counts of cancelled statements and of requests turned away, by
+    endpoint, and the pages cooling down after a cancellation.
+
+    A page, its path and query string, whose query was cancelled before
+    its response started is answered with a 503 for ``cooldown`` seconds
+    without touching the database, so retries of a pathological page
+    can't pile up and hold every worker thread.
+    """
+
+    def __init__(self, cooldown, max_paths=1024):
+        self.cooldown = cooldown
+        self.max_paths = max_paths
+        self.lock = threading.Lock()
+        self.cancelled = Counter()
+        self.rejected = Counter()
+        self.cooling = {}
+
+    def cancel(self, endpoint, path=None):
+        """Count a cancelled statement and cool ``path`` down, unless
+        it's ``None``.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.cancelled[endpoint] += 1
+            if path is None:
+                return
+            if len(self.cooling) >= self.max_paths:
+                self.cooling = {p: t for p, t in self.cooling.items() if t > now}
+            if len(self.cooling) < self.max_paths:
+                self.cooling[path] = now + self.cooldown
+
+    def reject(self, endpoint, path):
+        """Return whether ``path`` is cooling down, counting the request
+        as rejected if it is.
+        """
+        until = self.cooling.get(path)
+        if until is None or until <= time.monotonic():
+            return False
+        with self.lock:
+            self.rejected[endpoint] += 1
+        return True
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "cancelled": dict(self.cancelled),
+                "rejected": dict(self.rejected),
+            }
+
+
+def timeout_response():
+    timeouts = current_app.extensions["query_timeouts"]
+    return Response(
+        MESSAGE,
+        status=503,
+        headers={"Retry-After": str(max(1, math.ceil(timeouts.cooldown)))},
+        mimetype="text/plain",
+    )
+
+
+def start_clock():
+    """Start the request's query clock with its endpoint's budget, or
+    turn it away if its page is cooling down.
+    """
+    timeouts = current_app.extensions["query_timeouts"]
+    if timeouts.reject(request.endpoint, request.full_path):
+        current_app.logger.warning("query cooldown: rejected %s", request.full_path)
+        return timeout_response()
+
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, "query_budget", None)
+    seconds = budget.seconds if budget is not None else None
+    if seconds is None:
+        seconds = current_app.config["QUERY_TIME_BUDGET"]
+    request.environ[_CLOCK_KEY] = Clock(seconds)
+
+
+def watch(db):
+    """Cancel the connection's statements once the current request has
+    spent its query time budget. Does nothing outside of a request.
+    """
+    if not has_request_context():
+        return
+    clock = request.environ.get(_CLOCK_KEY)
+    if clock is None:
+        return
+
+    timeouts = current_app.extensions["query_timeouts"]
+    logger = current_app.logger
+    endpoint = request.endpoint
+    path = request.full_path
+
+    def check():
+        if not clock.expired():
+            return False
+        # once streaming, the page is cut short for this client only;
+        # it may have run long on their account, so it isn't cooled down
+        timeouts.cancel(endpoint, None if clock.streaming else path)
+        logger.warning("query time budget exceeded: cancelled a query on %s", path)
+        return True
+
+    db.set_progress_handler(check, current_app.config["QUERY_PROGRESS_STEPS"])
+
+
+def handle_interrupt(e):
+    """Answer a request whose query was cancelled with a 503."""
+    if not is_interrupt(e):
+        raise e
+    return timeout_response()
+
+
+def cut_short(chunks):
+    """Pass a streamed page through, ending it with a notice rather than
+    a broken connection if one of its queries is cancelled after the
+    response has started. The request's query clock is stopped while
+    each chunk is with the client.
+    """
+    clock = request.environ.get(_CLOCK_KEY) if has_request_context() else None
+    if clock is None:
+        clock = Clock(math.inf)
+    clock.streaming = True
+    return _cut_short(chunks, clock)
+
+
+def _cut_short(chunks, clock):
+    try:
+        for chunk in chunks:
+            clock.stop()
+            yield chunk
+            clock.start()
+    except sqlite3.OperationalError as e:
+        if not is_interrupt(e):
+            raise
+        yield f'<p class="flash timeout-notice">{MESSAGE}</p>'
+
+
+def init_app(app):
+    """Give every request a query time budget, the ``seconds`` its
+    endpoint's ``query_budget`` declares or ``QUERY_TIME_BUDGET``.
+    SQLite checks it every ``QUERY_PROGRESS_STEPS`` virtual machine
+    steps.
+    """
+    app.config.setdefault("QUERY_TIME_BUDGET", 1.0)
+    app.config.setdefault("QUERY_PROGRESS_STEPS", 1000)
+    app.config.setdefault("QUERY_TIMEOUT_COOLDOWN", 5.0)
+    app.extensions["query_timeouts"] = QueryTimeouts(
+        app.config["QUERY_TIMEOUT_COOLDOWN"]
+    )
+    app.before_request(start_clock)
+    app.register_error_handler(sqlite3.OperationalError, handle_interrupt)
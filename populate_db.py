@@ -5,7 +5,7 @@ Run this script from the project root directory.
 
 import sqlite3
 from werkzeug.security import generate_password_hash
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import random
 
 # Sample data
@@ -94,6 +94,12 @@ SAMPLE_JOKES = [
     ("Why don't skeletons fight each other?", "They don't have the guts!"),
 ]
 
+# The tag of each group of five jokes above, in order
+CATEGORIES = [
+    "classic", "programming", "food", "animal", "dad",
+    "science", "tech", "school", "music", "fun",
+]
+
 def populate_database():
     """Populate the database with sample users and jokes."""
     
@@ -128,7 +134,7 @@ def populate_database():
     print(f"\n📝 Creating {len(SAMPLE_JOKES)} jokes...")
     
     jokes_created = 0
-    base_date = datetime.now()
+    base_date = datetime.now(timezone.utc)
     
     for i, (title, body) in enumerate(SAMPLE_JOKES):
         # Randomly assign jokes to users
@@ -140,9 +146,16 @@ def populate_database():
                                             minutes=random.randint(0, 59))
         
         try:
-            db.execute(
+            post_id = db.execute(
                 "INSERT INTO post (title, body, created, author_id) VALUES (?, ?, ?, ?)",
-                (title, body, created_date, author_id)
+                (title, body, int(created_date.timestamp()), author_id)
+            ).lastrowid
+            # Triggers keep the tag's post_count
+            category = CATEGORIES[i // 5]
+            db.execute("INSERT OR IGNORE INTO tag (name) VALUES (?)", (category,))
+            db.execute(
+                "INSERT INTO post_tag (tag_id, post_id) SELECT id, ? FROM tag WHERE name = ?",
+                (post_id, category)
             )
             jokes_created += 1
             print(f"✅ Created joke: '{title[:50]}...'")
@@ -0,0 +1,146 @@
+import threading
+
+import pytest
+from flaskr import create_app
+from flaskr.admission import CRITICAL
+from flaskr.admission import LOW
+from flaskr.admission import NORMAL
+from flaskr.admission import Admission
+from flaskr.admission import classifier
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+
+def make_admission(limit=2, waits=(1.0, 1.0, 0.0), queue_size=8):
+    app = Response("ok")
+    return Admission(app, lambda environ: LOW, limit, 1, queue_size, waits, 3)
+
+
+def test_low_priority_is_shed_first():
+    admission = make_admission(limit=4)
+    assert admission.acquire(LOW)
+    assert admission.acquire(LOW)
+
+    # low requests get half the slots and never wait
+    assert not admission.acquire(LOW)
+    assert admission.acquire(NORMAL)
+    assert admission.acquire(CRITICAL)
+
+    snapshot = admission.snapshot()
+    assert snapshot["inflight"] == 4
+    assert snapshot["shed"] == {"critical": 0, "normal": 0, "low": 1}
+    assert snapshot["slots"] == {"critical": 4, "normal": 3, "low": 2}
+
+
+def test_normal_requests_leave_reserved_slot():
+    admission = make_admission(limit=2, waits=(0, 0, 0))
+    assert admission.acquire(NORMAL)
+    assert not admission.acquire(NORMAL)
+    assert admission.acquire(CRITICAL)
+
+
+def test_critical_waiters_go_first():
+    admission = make_admission(limit=2, waits=(5.0, 5.0, 0))
+    admission.acquire(CRITICAL)
+    admission.acquire(CRITICAL)
+    order = []
+
+    def request(priority):
+        assert admission.acquire(priority)
+        order.append(priority)
+
+    normal = threading.Thread(target=request, args=(NORMAL,))
+    normal.start()
+    while not admission.waiting[NORMAL]:
+        pass
+    critical = threading.Thread(target=request, args=(CRITICAL,))
+    critical.start()
+    while not admission.waiting[CRITICAL]:
+        pass
+
+    # the normal request was first, but the free slot goes to the
+    # critical one
+    admission.release()
+    critical.join()
+    admission.release()
+    admission.release()
+    normal.join()
+    assert order == [CRITICAL, NORMAL]
+    assert admission.snapshot()["wait_max_ms"] > 0
+
+
+def test_wait_times_out():
+    admission = make_admission(limit=1, waits=(0.01, 0.01, 0))
+    admission.acquire(CRITICAL)
+    assert not admission.acquire(CRITICAL)
+    assert admission.snapshot()["shed"]["critical"] == 1
+
+
+def test_full_queue_sheds():
+    admission = make_admission(limit=1, waits=(1.0, 1.0, 0), queue_size=0)
+    admission.acquire(CRITICAL)
+    assert not admission.acquire(CRITICAL)
+
+
+def test_shed_response_and_release():
+    admission = make_admission(limit=2)
+    client = Client(admission)
+
+    response = client.get("/")
+    assert response.status_code == 200
+    # the slot is held until the body is closed
+    assert admission.inflight == 1
+    response.close()
+    assert admission.inflight == 0
+
+    admission.acquire(LOW)
+    response = client.get("/")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+
+@pytest.mark.parametrize(
+    ("method", "path", "cookie", "priority"),
+    (
+        ("GET", "/", "", LOW),
+        ("GET", "/", "session=abc", NORMAL),
+        ("GET", "/auth/profile/test", "", NORMAL),
+        ("GET", "/auth/login", "", CRITICAL),
+        ("POST", "/1/rate", "session=abc", CRITICAL),
+        ("GET", "/events", "", None),
+        ("GET", "/static/style.css", "", None),
+        ("GET", "/metrics", "", None),
+    ),
+)
+def test_classify(method, path, cookie, priority):
+    environ = {"REQUEST_METHOD": method, "PATH_INFO": path, "HTTP_COOKIE": cookie}
+    assert classifier("session")(environ) == priority
+
+
+def test_app_sheds_under_load(app):
+    assert app.config["ADMISSION_LIMIT"] == 0
+
+    app = create_app(
+        {
+            "TESTING": True,
+            "DATABASE": app.config["DATABASE"],
+            "ADMISSION_LIMIT": 3,
+            "ADMISSION_CRITICAL_WAIT": 0.01,
+        }
+    )
+    admission = app.extensions["admission"]
+    client = app.test_client()
+    admission.acquire(CRITICAL)
+
+    assert client.get("/").status_code == 503
+    response = client.get("/hello")
+    assert response.status_code == 200
+    response.close()
+
+    admission.acquire(CRITICAL)
+    admission.acquire(CRITICAL)
+    assert client.post("/auth/login", data={"username": "a"}).status_code == 503
+
+    metrics = client.get("/metrics").json["admission"]
+    assert metrics["shed"] == {"critical": 1, "normal": 0, "low": 1}
+    assert metrics["inflight"] == 3
@@ -0,0 +1,169 @@
+import pytest
+from flaskr import create_app
+from flaskr.db import get_db
+
+
+@pytest.fixture
+def jokes(app):
+    """Jokes 2 and 3 next to test's joke 1, and comments on joke 1."""
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (id, title, body, author_id) VALUES (?, ?, '', 2)",
+            [(2, "second"), (3, "third")],
+        )
+        db.executemany(
+            "INSERT INTO comment (post_id, user_id, body, created) VALUES (1, 2, ?, ?)",
+            [(f"c{i}", 100 + i // 2) for i in range(5)],
+        )
+        db.commit()
+    return app
+
+
+def test_jokes_by_id_in_order(client, jokes):
+    response = client.get("/api/v1/jokes?ids=3,9,1,3&fields=title,tags")
+
+    assert response.mimetype == "application/json"
+    assert response.json == {
+        "jokes": [{"title": "third", "tags": []}, {"title": "test title", "tags": []}],
+        "missing": [9],
+    }
+    assert client.get("/api/v1/jokes?ids=1,x").status_code == 400
+    ids = ",".join(str(i) for i in range(101))
+    assert client.get(f"/api/v1/jokes?ids={ids}").status_code == 400
+
+
+def test_jokes_listed_a_page_at_a_time(client, jokes):
+    titles = [
+        joke["title"]
+        for offset in (0, 2)
+        for joke in client.get(
+            f"/api/v1/jokes?sort=new&limit=2&offset={offset}&fields=title"
+        ).json["jokes"]
+    ]
+    assert sorted(titles) == ["second", "test title", "third"]
+    assert client.get("/api/v1/jokes?limit=0").status_code == 400
+    assert client.get("/api/v1/jokes?sort=worst").status_code == 400
+
+
+def test_fields(client):
+    assert client.get("/api/v1/jokes/1?fields=id, author").json == {"id": 1, "author": "test"}
+    response = client.get("/api/v1/jokes/1?fields=id,password")
+    assert response.status_code == 400
+    assert "password" in response.json["error"]
+
+
+def test_errors_are_serialized(client):
+    response = client.get("/api/v1/jokes/9")
+    assert response.status_code == 404
+    assert response.json == {"error": "Joke id 9 doesn't exist."}
+
+
+def test_comments_keyset_pages(client, jokes):
+    bodies = []
+    after = ""
+    while after is not None:
+        page = client.get(f"/api/v1/jokes/1/comments?limit=2&fields=body&after={after}").json
+        bodies += [comment["body"] for comment in page["comments"]]
+        after = page["next"]
+    assert bodies == ["c0", "c1", "c2", "c3", "c4"]
+
+    assert client.get("/api/v1/jokes/2/comments").json == {"comments": [], "next": None}
+    assert client.get("/api/v1/jokes/9/comments").status_code == 404
+    assert client.get("/api/v1/jokes/1/comments?after=x").status_code == 400
+
+
+def test_user(client):
+    user = client.get("/api/v1/users/test").json
+    assert user["nickname"] == "test"
+    assert user["joke_count"] == 1
+    assert "username" not in user
+    assert client.get("/api/v1/users/nobody").status_code == 404
+
+
+def test_batch_rating(client, auth, jokes):
+    ratings = {"ratings": [
+        {"joke_id": 2, "rating": 5},
+        {"joke_id": 9, "rating": 1},
+        {"joke_id": 2, "rating": 3},
+        {"joke_id": 3, "rating": 4},
+    ]}
+    assert client.post("/api/v1/ratings", json=ratings).status_code == 401
+
+    auth.login()
+    response = client.post("/api/v1/ratings", json=ratings)
+    assert response.json == {
+        "ratings": [
+            {"joke_id": 2, "avg_rating": 3.0, "rating_count": 1},
+            {"joke_id": 3, "avg_rating": 4.0, "rating_count": 1},
+        ],
+        "missing": [9],
+    }
+    assert client.get("/api/v1/jokes?sort=top&limit=1&fields=id").json["jokes"] == [{"id": 3}]
+
+    bad = {"ratings": [{"joke_id": 2, "rating": 6}]}
+    assert client.post("/api/v1/ratings", json=bad).status_code == 400
+    assert client.post("/api/v1/ratings", data="nope").status_code == 400
+
+
+def test_single_rating(client, auth):
+    auth.login()
+    response = client.put("/api/v1/jokes/1/rating", json={"rating": 4})
+    assert response.json == {"joke_id": 1, "avg_rating": 4.0, "rating_count": 1}
+    assert client.put("/api/v1/jokes/9/rating", json={"rating": 4}).status_code == 404
+
+
+@pytest.mark.parametrize("body", ("[4]", "4", '"x"', "null"))
+def test_body_must_be_an_object(client, auth, body):
+    auth.login()
+
+    for method, url in (("put", "/api/v1/jokes/1/rating"), ("post", "/api/v1/ratings")):
+        response = getattr(client, method)(url, data=body, content_type="application/json")
+        assert response.status_code == 400
+        assert "error" in response.json
+
+
+def test_batch_rating_write_behind(app):
+    app = create_app(
+        {"TESTING": True, "DATABASE": app.config["DATABASE"], "RATING_WRITE_BEHIND": True}
+    )
+    client = app.test_client()
+    client.post("/auth/login", data={"username": "test", "password": "test"})
+
+    response = client.post("/api/v1/ratings", json={"ratings": [{"joke_id": 1, "rating": 2}]})
+
+    assert response.json["ratings"] == [{"joke_id": 1, "avg_rating": 2.0, "rating_count": 1}]
+    app.extensions["rating_buffer"].close()
+
+
+def test_content_negotiation(client):
+    msgpack = pytest.importorskip("msgpack")
+
+    response = client.get("/api/v1/jokes/1?fields=id", headers={"Accept": "application/msgpack"})
+    assert response.mimetype == "application/msgpack"
+    assert msgpack.unpackb(response.data) == {"id": 1}
+    assert "Accept" in response.vary
+
+    assert client.get("/api/v1/jokes/1", headers={"Accept": "text/html"}).status_code == 406
+
+
+def test_msgpack_body(client, auth):
+    msgpack = pytest.importorskip("msgpack")
+    auth.login()
+
+    response = client.put(
+        "/api/v1/jokes/1/rating",
+        data=msgpack.packb({"rating": 5}),
+        content_type="application/msgpack",
+    )
+    assert response.json["avg_rating"] == 5.0
+
+
+def test_msgpack_body_must_be_an_object(client, auth):
+    msgpack = pytest.importorskip("msgpack")
+    auth.login()
+
+    response = client.put(
+        "/api/v1/jokes/1/rating", data=msgpack.packb([4]), content_type="application/msgpack"
+    )
+    assert response.status_code == 400
@@ -0,0 +1,62 @@
+import gzip
+
+import pytest
+from flaskr.assets import build_assets
+from flaskr.assets import minify_css
+from flaskr.assets import minify_js
+
+
+@pytest.fixture
+def built(app, tmp_path):
+    app.config["ASSET_OUTPUT"] = str(tmp_path)
+    app.extensions["assets"] = build_assets(app.static_folder, str(tmp_path))
+    return app.extensions["assets"]
+
+
+def test_minify():
+    assert minify_css("/* x */\na > b {\n  color: red;\n}\n") == "a>b{color:red}"
+    assert minify_js("  // note\n  let a = 1;\n\n  f(a);\n") == "let a = 1;\nf(a);"
+
+
+def test_build_is_fingerprinted(app, built, tmp_path):
+    name = built["style.css"]
+    assert name.startswith("style.") and name.endswith(".css")
+
+    data = (tmp_path / name).read_bytes()
+    assert gzip.decompress((tmp_path / (name + ".gz")).read_bytes()) == data
+    # the same input always produces the same name
+    assert build_assets(app.static_folder, str(tmp_path)) == built
+
+
+def test_unbuilt_assets_fall_back_to_static(client):
+    assert b'href="/static/style.css"' in client.get("/auth/login").data
+
+
+def test_templates_use_built_names(client, built):
+    page = client.get("/").data.decode()
+    assert f'href="/assets/{built["style.css"]}"' in page
+    assert f'src="/assets/{built["jokes.js"]}"' in page
+
+
+def test_serve_precompressed(client, built):
+    url = f"/assets/{built['jokes.js']}"
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert response.mimetype == "text/javascript"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert b"rateJoke" in gzip.decompress(response.data)
+
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert b"rateJoke" in response.data
+
+    # q=0 refuses gzip rather than naming it
+    response = client.get(url, headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in response.headers
+    assert b"rateJoke" in response.data
+
+
+def test_unknown_asset(client, built):
+    assert client.get("/assets/style.css").status_code == 404
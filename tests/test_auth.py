@@ -53,3 +53,14 @@ def test_logout(client, auth):
     with client:
         auth.logout()
         assert 'user_id' not in session
+
+
+def test_profile_shows_stored_ratings(client, app):
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE post SET rating_sum = 9, rating_count = 2")
+        db.commit()
+
+    response = client.get('/auth/profile/test')
+    assert b'4.5' in response.data
+    assert b'(2 ratings)' in response.data
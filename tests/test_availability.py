@@ -0,0 +1,87 @@
+import pytest
+from flaskr import create_app
+from flaskr.availability import BloomFilter
+from flaskr.db import get_db
+
+
+def test_bloom_filter_error_rate():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"user{i}")
+
+    assert all(f"user{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other{i}" in bloom for i in range(10000))
+    assert false_positives < 200
+    assert bloom.hashes == 7
+
+
+@pytest.fixture
+def statements(app):
+    """The SQL each request runs."""
+    statements = []
+
+    def trace_request():
+        statements.clear()
+        get_db().set_trace_callback(statements.append)
+
+    app.before_request(trace_request)
+    return statements
+
+
+@pytest.mark.parametrize(
+    ("query", "available"),
+    (
+        ("nickname=test", False),
+        ("nickname=Test", True),
+        ("nickname=%20other%20", False),
+        ("nickname=newbie", True),
+        ("email=test", False),
+        ("email=test%40example.com", True),
+    ),
+)
+def test_available(client, query, available):
+    response = client.get(f"/auth/available?{query}")
+    assert response.json["available"] is available
+
+
+def test_free_answers_skip_database(app, client, statements):
+    # the first call fills the filter
+    client.get("/auth/available?nickname=test")
+
+    assert client.get("/auth/available?nickname=newbie").json["available"]
+    assert statements == []
+    assert not client.get("/auth/available?nickname=test").json["available"]
+    assert statements == ["SELECT 1 FROM user WHERE nickname = 'test'"]
+
+    answers = client.get("/metrics").json["availability"]["answers"]
+    assert answers["free"] == 1
+    assert answers["lookup"] == 2
+
+
+def test_registered_user_is_taken(client):
+    assert client.get("/auth/available?email=new@example.com").json["available"]
+    client.post(
+        "/auth/register",
+        data={
+            "username": "new@example.com",
+            "nickname": "newbie",
+            "password": "secret",
+            "confirm-password": "secret",
+        },
+    )
+    assert not client.get("/auth/available?email=new@example.com").json["available"]
+    assert not client.get("/auth/available?nickname=newbie").json["available"]
+
+
+def test_without_bloom_filter(app):
+    app = create_app(
+        {"TESTING": True, "DATABASE": app.config["DATABASE"], "AVAILABILITY_BLOOM": False}
+    )
+    client = app.test_client()
+    assert not client.get("/auth/available?nickname=test").json["available"]
+    assert client.get("/auth/available?nickname=newbie").json["available"]
+    assert client.get("/metrics").json["availability"] is None
+
+
+def test_missing_field(client):
+    assert client.get("/auth/available").status_code == 400
@@ -0,0 +1,80 @@
+import gzip
+import zlib
+
+from flask import Response
+from flask import jsonify
+from flaskr.db import get_db
+
+
+def test_compresses_html(client):
+    plain = client.get("/")
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == plain.data
+    assert len(response.data) < len(plain.data)
+
+
+def test_small_and_unlisted_responses_are_not_compressed(app, client):
+    @app.route("/tiny")
+    def tiny():
+        return jsonify(ok=True)
+
+    headers = {"Accept-Encoding": "gzip"}
+    assert "Content-Encoding" not in client.get("/tiny", headers=headers).headers
+    assert "Content-Encoding" not in client.get("/hello", headers=headers).headers
+
+
+def test_not_accepted(client):
+    response = client.get("/", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_level_and_threshold_are_configurable(app, client):
+    # the threshold only applies to buffered pages
+    app.config["STREAM_PAGES"] = False
+    app.config["COMPRESS_MIN_SIZE"] = 10 ** 6
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_streamed_response_is_compressed_per_chunk(app, client):
+    @app.route("/stream")
+    def stream():
+        def generate():
+            for i in range(3):
+                yield f"<p>{i}</p>" * 10
+
+        return Response(generate(), mimetype="text/html")
+
+    response = client.get(
+        "/stream", headers={"Accept-Encoding": "gzip"}, buffered=False
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    first = decompressor.decompress(next(iter(response.response)))
+    # the first chunk can be decoded before the rest is produced
+    assert first == b"<p>0</p>" * 10
+    rest = b"".join(response.response)
+    assert decompressor.decompress(rest) == b"<p>1</p>" * 10 + b"<p>2</p>" * 10
+
+
+def test_streamed_feed_compresses_like_a_buffered_one(app, client):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (title, body, author_id) VALUES (?, ?, 1)",
+            [(f"joke {i}", f"Why did chicken {i} cross the road?") for i in range(150)],
+        )
+        db.commit()
+
+    headers = {"Accept-Encoding": "gzip"}
+    streamed = client.get("/", headers=headers)
+    app.config["STREAM_PAGES"] = False
+    buffered = client.get("/", headers=headers)
+
+    assert gzip.decompress(streamed.data) == gzip.decompress(buffered.data)
+    assert len(streamed.data) < len(buffered.data) * 1.1
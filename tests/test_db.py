@@ -1,7 +1,10 @@
 import sqlite3
+from datetime import datetime
 
 import pytest
 from flaskr.db import get_db
+from flaskr.db import parse_timestamp
+from flaskr.db import records
 
 
 def test_get_close_db(app):
@@ -24,4 +27,24 @@ def test_init_db_command(runner, monkeypatch):
     monkeypatch.setattr('flaskr.db.init_db', fake_init_db)
     result = runner.invoke(args=['init-db'])
     assert 'Initialized' in result.output
-    assert Recorder.called
\ No newline at end of file
+    assert Recorder.called
+
+def test_records(app):
+    with app.app_context():
+        (post,) = records("SELECT id, title, created, NULL AS missing FROM post")
+
+    assert post.id == 1
+    assert post[1] == "test title"
+    # stored as epoch seconds, decoded only when read
+    assert tuple.__getitem__(post, 2) == 1514764800
+    assert post.created == datetime(2018, 1, 1)
+    assert post.missing is None
+
+
+def test_text_timestamps_are_still_read(app):
+    assert parse_timestamp("2018-01-01 00:00:00") == parse_timestamp(1514764800)
+
+    with app.app_context():
+        (post,) = records("SELECT '2018-01-01 00:00:00' AS created")
+
+    assert post.created == datetime(2018, 1, 1)
@@ -0,0 +1,107 @@
+from flaskr import duplicates
+from flaskr.db import get_db
+
+ATOMS = "Why don't scientists trust atoms?\nBecause they make up everything!"
+PASTA = "What do you call a fake noodle?\nAn impasta!"
+CHEESE = "What do you call cheese that isn't yours?\nNacho cheese!"
+
+
+def test_similarity():
+    atoms = duplicates.shingles(ATOMS)
+    reworded = duplicates.shingles(
+        "why dont scientists trust atoms... they make up everything"
+    )
+    assert duplicates.shingles(ATOMS.upper()) == atoms
+    assert duplicates.jaccard(atoms, reworded) > 0.6
+    # same setup, different joke
+    assert duplicates.jaccard(
+        duplicates.shingles(PASTA), duplicates.shingles(CHEESE)
+    ) < 0.4
+
+
+def test_identical_bodies_share_every_bucket():
+    assert duplicates.buckets_of(PASTA) == duplicates.buckets_of(PASTA + " ")
+    assert len(duplicates.buckets_of(PASTA)) == duplicates.BANDS
+
+
+def test_minhash_estimates_jaccard():
+    a = duplicates.shingles(ATOMS)
+    b = duplicates.shingles(ATOMS.replace("everything", "every single thing"))
+    sig_a, sig_b = duplicates.signature(a), duplicates.signature(b)
+    estimate = sum(x == y for x, y in zip(sig_a, sig_b)) / duplicates.PERMUTATIONS
+    assert abs(estimate - duplicates.jaccard(a, b)) < 0.2
+
+
+def test_leave_flags_duplicate(client, auth, app):
+    auth.login()
+    assert client.post("/leave", data={"title": "atoms", "body": ATOMS}).status_code == 302
+
+    response = client.post(
+        "/leave", data={"title": "science", "body": ATOMS.replace("!", "!!")}
+    )
+    assert response.status_code == 200
+    assert b"looks a lot like" in response.data
+    assert b'name="post_anyway"' in response.data
+    # the form keeps what was typed
+    assert b"science" in response.data
+
+    assert client.post("/leave", data={"title": "pasta", "body": PASTA}).status_code == 302
+    assert (
+        client.post(
+            "/leave",
+            data={"title": "science", "body": ATOMS, "post_anyway": "1"},
+        ).status_code
+        == 302
+    )
+
+    with app.app_context():
+        titles = [
+            row[0] for row in get_db().execute("SELECT title FROM post ORDER BY id")
+        ]
+    assert titles == ["test title", "atoms", "pasta", "science"]
+
+
+def test_updated_body_is_found(client, auth, app):
+    auth.login()
+    client.post("/1/update", data={"title": "t", "body": PASTA})
+
+    with app.app_context():
+        found, _ = duplicates.find(get_db(), PASTA, 0.6)
+    assert [(id, title) for _, id, title in found] == [(1, "t")]
+
+
+def test_deleted_joke_is_not_found(client, auth, app):
+    auth.login()
+    client.post("/leave", data={"title": "pasta", "body": PASTA})
+    client.post("/2/delete")
+
+    assert client.post("/leave", data={"title": "again", "body": PASTA}).status_code == 302
+
+
+def test_find_duplicates_command(runner, app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (title, body, author_id) VALUES (?, ?, 1)",
+            [
+                ("atoms", ATOMS),
+                ("pasta", PASTA),
+                ("cheese", CHEESE),
+                ("atoms again", ATOMS.lower()),
+                ("pasta again", PASTA.replace("noodle", "noodle, really")),
+                ("atoms once more", "Never trust atoms. They make up everything!"),
+            ],
+        )
+        db.commit()
+
+    result = runner.invoke(args=["find-duplicates", "--batch-size", "2"])
+
+    assert "indexed 7/7 jokes" in result.output
+    assert "Found 2 clusters" in result.output
+    assert "#2 atoms\n  #5 atoms again\n" in result.output
+    assert "#3 pasta\n  #6 pasta again\n" in result.output
+    assert "cheese" not in result.output
+
+    with app.app_context():
+        count = get_db().execute("SELECT COUNT(*) FROM post_lsh").fetchone()[0]
+    assert count == 7 * duplicates.BANDS
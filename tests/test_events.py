@@ -0,0 +1,121 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flaskr.events import EventHub
+from flaskr.events import HubFull
+
+
+def read_event(response):
+    chunk = next(response.response).decode()
+    event, data = chunk.strip().split("\n")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+
+def test_publish_only_reaches_watchers():
+    hub = EventHub()
+    watching = hub.subscribe({1, 2})
+    other = hub.subscribe({3})
+
+    hub.publish("comment", 2, {"id": 2})
+
+    assert watching.get(0) == [("comment", {"id": 2})]
+    assert other.get(0) == []
+
+
+def test_ratings_are_coalesced():
+    hub = EventHub()
+    subscription = hub.subscribe({1})
+
+    for count in range(1, 4):
+        hub.publish("rating", 1, {"id": 1, "rating_count": count})
+
+    assert subscription.get(0) == [("rating", {"id": 1, "rating_count": 3})]
+
+
+def test_slow_subscriber_is_told_to_resync():
+    hub = EventHub(queue_size=2)
+    subscription = hub.subscribe({1})
+
+    for _ in range(3):
+        hub.publish("comment", 1, {"id": 1})
+
+    assert subscription.get(0) == [("resync", {})]
+
+
+def test_connection_cap():
+    hub = EventHub(max_connections=1)
+    subscription = hub.subscribe({1})
+
+    with pytest.raises(HubFull):
+        hub.subscribe({1})
+
+    hub.unsubscribe(subscription)
+    hub.subscribe({1})
+
+
+def test_stream_rating_and_comments(client, auth, app):
+    auth.login()
+    response = client.get("/events?jokes=1")
+    assert response.mimetype == "text/event-stream"
+    assert next(response.response).startswith(b"retry:")
+
+    client.post("/1/rate", data={"rating": 4})
+    assert read_event(response) == (
+        "rating",
+        {"id": 1, "avg_rating": 4.0, "rating_count": 1},
+    )
+
+    comment_id = client.post("/1/comment", data={"body": "ha"}).json["comment"]["id"]
+    event, data = read_event(response)
+    assert event == "comment"
+    assert data["comment"]["body"] == "ha"
+
+    client.post(f"/comment/{comment_id}/delete")
+    assert read_event(response) == (
+        "comment-deleted",
+        {"id": 1, "comment_id": comment_id},
+    )
+
+    response.close()
+    assert not app.extensions["event_hub"].subscriptions
+
+
+def test_stream_limits(client, app):
+    assert client.get("/events").status_code == 400
+
+    app.extensions["event_hub"].max_connections = 0
+    response = client.get("/events?jokes=1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+
+def test_streams_leave_threads_for_pages(app):
+    """Serve from a pool as big as the documented ``waitress --threads
+    16``, with a stream open from more tabs than there are threads.
+    """
+    threads = app.config["SERVER_THREADS"]
+    app.config["SSE_HEARTBEAT"] = 0.01
+    done = threading.Event()
+
+    def serve(path):
+        response = app.test_client().get(path)
+        # like the server, the thread is held until the body is sent
+        for _ in response.response:
+            if done.is_set():
+                break
+        response.close()
+        return response.status_code
+
+    with ThreadPoolExecutor(threads) as pool:
+        streams = [pool.submit(serve, "/events?jokes=1") for _ in range(threads)]
+        page = pool.submit(serve, "/")
+        try:
+            assert page.result(timeout=5) == 200
+        finally:
+            done.set()
+        statuses = [stream.result(timeout=5) for stream in streams]
+
+    assert statuses.count(200) == threads // 4
+    assert statuses.count(503) == threads - threads // 4
@@ -0,0 +1,155 @@
+import pytest
+from flaskr import create_app
+from flaskr import jokes
+from flaskr.db import get_db
+from flaskr.fragments import FragmentCache
+from jinja2 import FileSystemBytecodeCache
+
+
+def test_lru_eviction():
+    cache = FragmentCache(maxsize=2)
+    cache.get_or_render("a", lambda: "A")
+    cache.get_or_render("b", lambda: "B")
+    cache.get_or_render("a", lambda: "stale")
+    cache.get_or_render("c", lambda: "C")
+
+    assert list(cache.fragments) == ["a", "c"]
+    assert cache.hits == 1
+
+
+def test_bytecode_cache(app, tmp_path):
+    app = create_app(
+        {
+            "TESTING": True,
+            "DATABASE": app.config["DATABASE"],
+            "TEMPLATE_BYTECODE_CACHE": str(tmp_path),
+        }
+    )
+    assert isinstance(app.jinja_env.bytecode_cache, FileSystemBytecodeCache)
+
+    app.test_client().get("/auth/login")
+    assert any(tmp_path.iterdir())
+
+
+def test_index_reuses_cards(client, app):
+    cache = app.extensions["fragment_cache"]
+
+    first = client.get("/").data
+    assert cache.misses == 1
+    assert client.get("/").data == first
+    assert cache.hits == 1
+
+
+def test_changed_card_is_rendered_again(client, auth, app):
+    cache = app.extensions["fragment_cache"]
+    client.get("/").get_data()
+
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO comment (post_id, user_id, body) VALUES (1, 2, 'lol')")
+        db.commit()
+
+    assert b"lol" in client.get("/").data
+    assert cache.misses == 2
+
+
+def test_viewer_specific_parts(client, auth, app):
+    assert b"Edit" not in client.get("/").data
+
+    auth.login()
+    assert b"Edit" in client.get("/").data
+
+    auth.login("other", "other")
+    client.post("/1/rate", data={"rating": 3})
+    response = client.get("/").data
+    assert b"Edit" not in response
+    assert b"user-rated" in response
+
+
+def test_pages_are_streamed(client, auth):
+    response = client.get("/")
+    assert "Content-Length" not in response.headers
+    assert b"test title" in response.data
+
+    auth.login()
+    response = client.get("/auth/profile/test")
+    assert "Content-Length" not in response.headers
+    assert b"profile-jokes-list" in response.data
+
+
+def test_streamed_empty_feed(client, app):
+    with app.app_context():
+        db = get_db()
+        db.execute("DELETE FROM post")
+        db.commit()
+
+    assert b"No jokes yet!" in client.get("/").data
+    assert b"No jokes shared yet!" in client.get("/auth/profile/test").data
+
+
+def test_flashes_are_consumed_before_streaming(client):
+    client.get("/auth/profile/nobody")
+    assert b"not found" in client.get("/").data
+    assert b"not found" not in client.get("/").data
+
+
+def test_streaming_can_be_disabled(client, app):
+    app.config["STREAM_PAGES"] = False
+    response = client.get("/")
+    assert "Content-Length" in response.headers
+    assert b"test title" in response.data
+
+
+@pytest.fixture
+def thread(app):
+    """Five comments on joke 1, "reply 0" to "reply 4", two per second."""
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO comment (post_id, user_id, body, created) VALUES (1, 2, ?, ?)",
+            [(f"reply {i}", 100 + i // 2) for i in range(5)],
+        )
+        db.commit()
+
+
+def test_card_shows_first_comments(client, thread):
+    page = client.get("/").data
+
+    assert b"Comments (5)" in page
+    assert [f"reply {i}".encode() in page for i in range(5)] == [True] * 3 + [False] * 2
+    # reply 2 is comment 3, created at 101
+    assert b'data-after="101.3"' in page
+
+
+def test_comment_count_invalidates_card(client, app, thread):
+    client.get("/").get_data()
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO comment (post_id, user_id, body) VALUES (1, 2, 'reply 5')")
+        db.commit()
+
+    assert b"Comments (6)" in client.get("/").data
+
+
+def test_comment_pages(client, thread, monkeypatch):
+    monkeypatch.setattr(jokes, "COMMENT_PAGE", 1)
+    html = ""
+    after = "101.3"
+    pages = 0
+    while after is not None:
+        page = client.get(f"/1/comments?after={after}").json
+        html += page["html"]
+        after = page["next"]
+        pages += 1
+
+    assert pages == 2
+    assert "reply 2" not in html
+    assert html.index("reply 3") < html.index("reply 4")
+    # anonymous, so no delete buttons
+    assert "deleteComment" not in html
+
+
+def test_comment_page_errors(client):
+    assert client.get("/1/comments").json == {"success": True, "html": "", "next": None}
+    assert client.get("/9/comments").status_code == 404
+    assert client.get("/1/comments?after=x").status_code == 400
@@ -0,0 +1,93 @@
+import time
+
+import pytest
+from flaskr.db import get_db
+from flaskr.maintenance import BudgetExceeded
+from flaskr.maintenance import TASKS
+from flaskr.maintenance import _run_with_budget
+from flaskr.maintenance import run_maintenance
+
+
+def test_schema_pragmas(app):
+    with app.app_context():
+        db = get_db()
+        assert db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_run_all_tasks(app):
+    with app.app_context():
+        results = dict(run_maintenance(get_db(), app.config))
+
+    assert list(results) == list(TASKS)
+    assert results["decay"] == "0 hot scores decayed"
+    assert results["analyze"] == "statistics refreshed"
+    assert results["vacuum"].endswith("pages freed")
+
+
+def test_vacuum_frees_pages(app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (title, body, author_id) VALUES (?, ?, 1)",
+            [("t", "x" * 2000)] * 200,
+        )
+        db.commit()
+        db.execute("DELETE FROM post")
+        db.commit()
+        assert db.execute("PRAGMA freelist_count").fetchone()[0] > 0
+
+        results = dict(run_maintenance(get_db(), app.config, tasks=["vacuum"]))
+
+        assert db.execute("PRAGMA freelist_count").fetchone()[0] == 0
+        assert results["vacuum"] != "0 pages freed"
+
+
+def test_checkpoint_threshold(app):
+    app.config["DB_WAL_CHECKPOINT_BYTES"] = 0
+
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO post (title, body, author_id) VALUES ('a', 'b', 1)")
+        db.commit()
+        results = dict(run_maintenance(db, app.config, tasks=["checkpoint"]))
+
+    assert results["checkpoint"].startswith("checkpointed")
+
+
+def test_budget_interrupts_statement(app):
+    with app.app_context():
+        db = get_db()
+
+        def slow(deadline):
+            db.execute(
+                "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c)"
+                " SELECT count(*) FROM c"
+            ).fetchone()
+
+        start = time.monotonic()
+        with pytest.raises(BudgetExceeded):
+            _run_with_budget(db, 0.05, slow)
+
+        assert time.monotonic() - start < 1
+
+
+def test_analyze_writes_statistics(app):
+    with app.app_context():
+        db = get_db()
+        run_maintenance(db, app.config, tasks=["analyze"])
+
+        tables = {row[0] for row in db.execute("SELECT tbl FROM sqlite_stat1")}
+
+    # empty tables get no rows
+    assert {"post", "user"} <= tables
+
+
+def test_db_maintain_command(runner, app):
+    result = runner.invoke(args=["db-maintain", "--task", "analyze"])
+    assert "analyze: statistics refreshed" in result.output
+
+    with app.app_context():
+        assert get_db().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone()
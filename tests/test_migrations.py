@@ -0,0 +1,173 @@
+import sqlite3
+
+import pytest
+from flaskr.db import get_db
+from flaskr.migrations import SCHEMA_VERSION
+from flaskr.migrations import column_exists
+from flaskr.migrations import get_version
+from flaskr.migrations import table_exists
+from flaskr.migrations import upgrade
+
+# the tables as they were before the migration scripts existed
+LEGACY_SCHEMA = """
+CREATE TABLE user (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  username TEXT UNIQUE NOT NULL,
+  nickname TEXT UNIQUE NOT NULL,
+  password TEXT NOT NULL
+);
+
+CREATE TABLE post (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  author_id INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  title TEXT NOT NULL,
+  body TEXT NOT NULL,
+  FOREIGN KEY (author_id) REFERENCES user (id)
+);
+"""
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    db = sqlite3.connect(tmp_path / "legacy.sqlite", isolation_level=None)
+    db.executescript(LEGACY_SCHEMA)
+    db.executemany(
+        "INSERT INTO user (username, nickname, password) VALUES (?, ?, 'x')",
+        [(f"user{i}@example.com", f"user{i}") for i in range(25)],
+    )
+    yield db
+    db.close()
+
+
+def test_fresh_schema_is_current(app, runner):
+    with app.app_context():
+        assert get_version(get_db()) == SCHEMA_VERSION
+
+    result = runner.invoke(args=["db-upgrade"])
+    assert "up to date" in result.output
+
+
+def test_upgrade_legacy_database(legacy_db):
+    reports = []
+
+    applied = upgrade(legacy_db, chunk_size=10, report=lambda *r: reports.append(r))
+
+    assert applied == [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert get_version(legacy_db) == SCHEMA_VERSION
+    assert table_exists(legacy_db, "rating")
+    assert table_exists(legacy_db, "comment")
+    assert column_exists(legacy_db, "user", "created")
+    assert legacy_db.execute(
+        "SELECT COUNT(*) FROM user WHERE created IS NULL"
+    ).fetchone()[0] == 0
+    assert [r[1:3] for r in reports] == [(10, 25), (20, 25), (25, 25)]
+    assert legacy_db.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'comment_post_created'"
+    ).fetchone() is not None
+    assert upgrade(legacy_db) == []
+
+
+def test_interrupted_backfill_resumes(legacy_db):
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(table, done, total, rate):
+        raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        upgrade(legacy_db, chunk_size=10, report=interrupt)
+
+    # the first chunk was committed and the version was not bumped
+    assert get_version(legacy_db) == 2
+    assert legacy_db.execute(
+        "SELECT COUNT(*) FROM user WHERE created IS NOT NULL"
+    ).fetchone()[0] == 10
+
+    reports = []
+    upgrade(legacy_db, chunk_size=10, report=lambda *r: reports.append(r))
+
+    assert [r[1] for r in reports] == [20, 25]
+    assert get_version(legacy_db) == SCHEMA_VERSION
+    assert legacy_db.execute("SELECT COUNT(*) FROM migration_progress").fetchone()[0] == 0
+
+
+def test_db_upgrade_command(app, runner):
+    with app.app_context():
+        db = get_db()
+        db.execute("DROP INDEX comment_post_created")
+        db.execute("PRAGMA user_version = 3")
+        db.commit()
+
+    result = runner.invoke(args=["db-upgrade"])
+
+    assert "Applying 4: add secondary indexes" in result.output
+    assert f"to {SCHEMA_VERSION}" in result.output
+
+
+def test_compact_storage_migration(legacy_db):
+    legacy_db.executemany(
+        "INSERT INTO post (author_id, title, body, created) VALUES (1, ?, '', ?)",
+        [("first", "2018-01-01 00:00:00"), ("second", "2018-01-02 00:00:00")],
+    )
+    legacy_db.execute("DELETE FROM post WHERE title = 'second'")
+
+    def rate_before_compacting(version, description):
+        if version == 5:
+            legacy_db.execute(
+                "INSERT INTO rating (post_id, user_id, rating, created)"
+                " VALUES (1, 2, 5, '2018-01-03 00:00:00')"
+            )
+
+    upgrade(legacy_db, announce=rate_before_compacting)
+
+    assert legacy_db.execute("SELECT created FROM post").fetchall() == [(1514764800,)]
+    assert legacy_db.execute(
+        "SELECT post_id, user_id, rating, created FROM rating"
+    ).fetchall() == [(1, 2, 5, 1514937600)]
+    # the deleted post's id is not handed out again
+    legacy_db.execute("INSERT INTO post (author_id, title, body) VALUES (1, 'new', '')")
+    assert legacy_db.execute("SELECT MAX(id) FROM post").fetchone()[0] == 3
+
+    table_sql = legacy_db.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'rating'"
+    ).fetchone()[0]
+    assert table_sql.endswith("WITHOUT ROWID")
+    indexes = {
+        row[0]
+        for row in legacy_db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        )
+    }
+    assert indexes == {
+        "post_author_created",
+        "rating_user",
+        "comment_post_created",
+        "post_score",
+        "post_hot",
+        "post_created",
+        "user_nickname_nocase",
+        "post_tag_post",
+        "tag_post_count",
+    }
+
+
+def test_ranking_scores_backfill(legacy_db):
+    legacy_db.executemany(
+        "INSERT INTO post (author_id, title, body) VALUES (1, ?, '')",
+        [("rated",), ("unrated",)],
+    )
+
+    def rate_before_backfill(version, description):
+        if version == 6:
+            legacy_db.executemany(
+                "INSERT INTO rating (post_id, user_id, rating) VALUES (1, ?, ?)",
+                [(1, 5), (2, 4)],
+            )
+
+    upgrade(legacy_db, announce=rate_before_backfill)
+
+    rows = legacy_db.execute(
+        "SELECT rating_sum, rating_count, score, hot > 0 FROM post ORDER BY id"
+    ).fetchall()
+    assert rows == [(9, 2, 24 / 7, 1), (0, 0, 3.0, 0)]
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+from flaskr import create_app
+from flaskr.db import get_db
+from flaskr.moderation import Automaton
+from flaskr.moderation import ContentFilter
+from flaskr.moderation import read_terms
+
+
+def test_automaton_finds_overlapping_patterns():
+    patterns = ["he", "she", "his", "hers"]
+    automaton = Automaton(patterns)
+    found = sorted(
+        (end, patterns[index]) for end, index in automaton.scan("ushers")
+    )
+    assert found == [(3, "he"), (3, "she"), (5, "hers")]
+
+
+@pytest.mark.parametrize(
+    ("text", "allowed"),
+    (
+        ("what a darn good joke", False),
+        ("DARN it", False),
+        ("d4rn", False),
+        ("the darnedest thing", True),
+        ("a classic joke", True),
+        ("what a heckin joke", False),
+        ("check, heck!", False),
+        ("pure pun fun", True),
+        ("pure  pun   intended", False),
+    ),
+)
+def test_banned_terms(text, allowed):
+    content_filter = ContentFilter(["darn", "heck*", "pun intended"], 2, 10)
+    assert (content_filter.check(text) is None) == allowed
+
+
+def test_links_and_repeats():
+    content_filter = ContentFilter([], 2, 5)
+    assert content_filter.check("see https://www.example.com and www.example.org") is None
+    assert "links" in content_filter.check("http://a http://b www.c")
+    assert content_filter.check("hahahaha!!!!!") is None
+    assert "repeat" in content_filter.check("lol!!!!!!")
+
+
+def test_read_terms(tmp_path):
+    path = tmp_path / "terms.txt"
+    path.write_text("# banned\ndarn\n\n  heck*  \n")
+    assert read_terms(path) == ["darn", "heck*"]
+    assert read_terms(tmp_path / "missing.txt") == []
+
+
+@pytest.fixture
+def moderated(app, tmp_path):
+    terms = tmp_path / "banned_terms.txt"
+    terms.write_text("darn\n")
+    app = create_app(
+        {
+            "TESTING": True,
+            "DATABASE": app.config["DATABASE"],
+            "MODERATION_TERMS": str(terms),
+            "MODERATION_RELOAD_INTERVAL": 0,
+        }
+    )
+    return app, terms
+
+
+def test_comment_is_filtered(moderated):
+    app, terms = moderated
+    client = app.test_client()
+    client.post("/auth/login", data={"username": "test", "password": "test"})
+
+    response = client.post("/1/comment", data={"body": "darn good"})
+    assert response.status_code == 400
+    assert "friendly" in response.json["message"]
+    assert client.post("/1/comment", data={"body": "heck yes"}).status_code == 200
+
+    # edited in place, picked up on the next request
+    terms.write_text("darn\nheck\n")
+    os.utime(terms, ns=(0, 0))
+    assert client.post("/1/comment", data={"body": "heck yes"}).status_code == 400
+
+    with app.app_context():
+        bodies = [row[0] for row in get_db().execute("SELECT body FROM comment")]
+    assert bodies == ["heck yes"]
+
+
+@pytest.mark.parametrize(
+    ("path", "data"),
+    (
+        ("/leave", {"title": "darn", "body": "a joke"}),
+        ("/leave", {"title": "a joke", "body": "darn it"}),
+        ("/1/update", {"title": "ok", "body": "darn it"}),
+    ),
+)
+def test_jokes_are_filtered(moderated, path, data):
+    app, _ = moderated
+    client = app.test_client()
+    client.post("/auth/login", data={"username": "test", "password": "test"})
+
+    response = client.post(path, data=data)
+    assert response.status_code == 200
+    assert b"keep it friendly" in response.data
+
+    with app.app_context():
+        db = get_db()
+        assert db.execute("SELECT COUNT(*) FROM post").fetchone()[0] == 1
+        assert db.execute("SELECT title FROM post").fetchone()[0] == "test title"
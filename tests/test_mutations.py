@@ -0,0 +1,127 @@
+import pytest
+from flaskr.db import get_db
+
+
+@pytest.fixture
+def statements(app):
+    """The SQL each request's view runs, without transaction control."""
+    statements = []
+
+    def trace(sql):
+        if sql.split()[0].upper() not in ("BEGIN", "COMMIT", "ROLLBACK"):
+            statements.append(sql)
+
+    # registered last, so loading the logged in user isn't counted
+    app.before_request(lambda: get_db().set_trace_callback(trace))
+    return statements
+
+
+def test_rate_queries(client, auth, statements):
+    auth.login()
+    statements.clear()
+
+    response = client.post("/1/rate", data={"rating": "4"})
+
+    assert response.json["rating_count"] == 1
+    # the upsert and the rescore that returns the new aggregate
+    assert len(statements) == 2
+
+
+def test_rate_missing_joke(client, auth, app, statements):
+    auth.login()
+    statements.clear()
+
+    assert client.post("/2/rate", data={"rating": "4"}).status_code == 404
+    assert len(statements) == 1
+
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM rating").fetchone()[0] == 0
+
+
+def test_add_comment_queries(client, auth, statements):
+    auth.login()
+    statements.clear()
+
+    response = client.post("/1/comment", data={"body": "lol"})
+
+    comment = response.json["comment"]
+    assert comment["id"] == 1
+    assert comment["body"] == "lol"
+    assert comment["username"] == "test"
+    assert len(statements) == 1
+
+
+def test_add_comment_missing_joke(client, auth, app, statements):
+    auth.login()
+    statements.clear()
+
+    assert client.post("/2/comment", data={"body": "lol"}).status_code == 404
+    assert len(statements) == 1
+
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM comment").fetchone()[0] == 0
+
+
+def test_delete_comment_queries(client, auth, app, statements):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO comment (post_id, user_id, body) VALUES (1, 1, 'a')")
+        db.execute("INSERT INTO comment (post_id, user_id, body) VALUES (1, 2, 'b')")
+        db.commit()
+
+    auth.login()
+    statements.clear()
+    assert client.post("/comment/1/delete").status_code == 200
+    assert len(statements) == 1
+
+    # telling "not yours" from "not there" costs one more query
+    statements.clear()
+    assert client.post("/comment/2/delete").status_code == 403
+    assert len(statements) == 2
+    assert client.post("/comment/1/delete").status_code == 404
+
+    with app.app_context():
+        assert [row[0] for row in get_db().execute("SELECT id FROM comment")] == [2]
+
+
+def test_update_queries(client, auth, app, statements):
+    auth.login()
+    statements.clear()
+
+    response = client.post("/1/update", data={"title": "updated", "body": ""})
+
+    assert response.status_code == 302
+    # the update, indexing the new body for duplicate detection and
+    # dropping the tags no longer given
+    assert len(statements) == 3
+    with app.app_context():
+        post = get_db().execute("SELECT title FROM post WHERE id = 1").fetchone()
+        assert post["title"] == "updated"
+
+
+def test_delete_queries(client, auth, app, statements):
+    auth.login()
+    statements.clear()
+
+    assert client.post("/1/delete").status_code == 302
+    # the delete, then the post_untagged trigger and the statement it
+    # runs, which trace as the delete again
+    assert len(statements) == 3
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM post").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("path", ("/1/update", "/1/delete"))
+def test_not_author(client, auth, app, path):
+    auth.login("other", "other")
+
+    assert client.post(path, data={"title": "stolen", "body": ""}).status_code == 403
+    with app.app_context():
+        post = get_db().execute("SELECT title FROM post WHERE id = 1").fetchone()
+        assert post["title"] == "test title"
+
+
+@pytest.mark.parametrize("path", ("/2/update", "/2/delete"))
+def test_missing_joke(client, auth, path):
+    auth.login()
+    assert client.post(path, data={"title": "x", "body": ""}).status_code == 404
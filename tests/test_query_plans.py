@@ -0,0 +1,85 @@
+import pytest
+from flaskr import api
+from flaskr import auth
+from flaskr import duplicates
+from flaskr import ranking
+from flaskr import suggest
+from flaskr import tags
+from flaskr.db import get_db
+from flaskr.jokes import COMMENTS_AFTER
+from flaskr.jokes import FEED
+from flaskr.jokes import FEED_IDS
+from flaskr.jokes import RECOMMENDED
+from flaskr.jokes import SORTS
+
+# (query, params, tables that may be read in full)
+HOT_QUERIES = {
+    **{
+        f"index feed sort={sort}": (FEED.format(where="", order=order), (1,), {"p"})
+        for sort, order in SORTS.items()
+    },
+    # j is the list of ids passed in
+    "tag feed": (
+        FEED.format(where=FEED_IDS, order=SORTS["top"]),
+        (1, "[1]"),
+        {"json_each"},
+    ),
+    "top tags": (tags.TOP, (12,), set()),
+    "tag postings": (tags.POSTINGS, (1, 0, 100), set()),
+    "tag facets": (tags.FACETS, ("[1, 2]", 12), {"j"}),
+    # t is the one row of totals
+    "rescore": (ranking.RESCORE, {"id": 1, "now": 0}, {"t"}),
+    "recommendations": (RECOMMENDED, (1,), set()),
+    # b is the list of buckets passed in
+    "duplicate candidates": (duplicates.CANDIDATES, ("[1, 2]", 50), {"b"}),
+    "nickname prefix": (suggest.LIKE, ("te%", 8), set()),
+    "rescore many": (ranking.RESCORE_MANY, {"ids": "[1, 2]", "now": 0}, {"t", "json_each"}),
+    "api jokes by id": (
+        api.JOKES_BY_ID.format(columns=api.select(api.JOKE_FIELDS, api.JOKE_FIELDS)),
+        ("[1, 2]",),
+        {"json_each"},
+    ),
+    "comments after": (COMMENTS_AFTER, (1, 0, 0, 21), set()),
+    "api comments page": (
+        api.COMMENTS_PAGE.format(columns=api.select(api.COMMENT_FIELDS, api.COMMENT_FIELDS)),
+        (1, 0, 0, 20),
+        set(),
+    ),
+    "login lookup": (auth.USER_BY_NAME, ("test", "test"), set()),
+    "profile jokes": (auth.PROFILE_JOKES, (1,), set()),
+    "profile joke count": (auth.PROFILE_JOKE_COUNT, (1,), set()),
+    "profile ratings": (auth.PROFILE_RATINGS, (1,), set()),
+    "hot decay": (ranking.DECAY, {"now": 0, "cutoff": 0}, set()),
+    "profile comments": (auth.PROFILE_COMMENTS, (1,), set()),
+    "profile average rating": (auth.PROFILE_AVG_RATING, (1,), set()),
+}
+
+
+def scanned_tables(db, query, params):
+    """Return the tables the query plan reads in full. Scans of a
+    subquery's own result, like ``(subquery-2)``, read only the rows the
+    subquery found and don't count.
+    """
+    plan = db.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+    return {
+        row["detail"].split()[1]
+        for row in plan
+        if row["detail"].startswith("SCAN ") and not row["detail"].startswith("SCAN (")
+    }
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_index(app, name):
+    query, params, allowed = HOT_QUERIES[name]
+
+    with app.app_context():
+        assert scanned_tables(get_db(), query, params) <= allowed
+
+
+@pytest.mark.parametrize("order", SORTS.values())
+def test_feed_is_read_in_order(app, order):
+    with app.app_context():
+        plan = get_db().execute("EXPLAIN QUERY PLAN " + FEED.format(where="", order=order), (1,))
+        details = [row["detail"] for row in plan]
+
+    assert not any("TEMP B-TREE" in detail for detail in details), details
@@ -0,0 +1,151 @@
+import logging
+
+import pytest
+from flaskr import create_app
+from flaskr import querystats
+from flaskr.db import get_db
+from flaskr.querystats import QueryBudgetExceeded
+
+
+def set_budget(monkeypatch, app, endpoint, queries, rows):
+    # views are shared between apps, so put the budget back afterwards
+    view = app.view_functions[endpoint]
+    monkeypatch.setattr(view, "query_budget", querystats.Budget(queries, rows))
+
+
+def test_every_route_has_a_budget(app):
+    for endpoint, view in app.view_functions.items():
+        if endpoint != "static":
+            assert hasattr(view, "query_budget"), endpoint
+
+
+def test_config():
+    assert not create_app({"DATABASE": ":memory:"}).config["QUERY_STATS"]
+    assert create_app({"TESTING": True}).config["QUERY_BUDGET_STRICT"]
+
+
+def test_capture_counts_streamed_queries(client, auth, app):
+    auth.login()
+
+    with querystats.capture(app) as captured:
+        client.get("/").get_data()
+
+    (stats,) = captured
+    assert stats.endpoint == "jokes.index"
+    # the logged in user, the tag facets, their recommendations and
+    # the feed
+    assert stats.queries == 4
+    assert stats.rows == 2
+
+
+def test_index_has_no_n_plus_one(client, app):
+    with app.app_context():
+        db = get_db()
+        for i in range(5):
+            post_id = db.execute(
+                "INSERT INTO post (title, body, author_id) VALUES (?, '', 1)", (f"j{i}",)
+            ).lastrowid
+            db.execute(
+                "INSERT INTO comment (post_id, user_id, body) VALUES (?, 2, 'lol')",
+                (post_id,),
+            )
+        db.commit()
+
+    with querystats.capture(app) as captured:
+        assert client.get("/").data.count(b"lol") == 5
+
+    # the tag facets and the feed
+    assert captured[0].queries == 2
+
+
+def test_header_in_debug(client, app):
+    app.config["QUERY_STATS_HEADER"] = True
+    response = client.get("/auth/profile/test")
+    assert response.headers["X-Query-Count"] == "5"
+    assert response.headers["X-Query-Rows"] == "5"
+
+    app.config["QUERY_STATS_HEADER"] = False
+    assert "X-Query-Count" not in client.get("/hello").headers
+
+
+def test_strict_budget(client, auth, app, monkeypatch):
+    set_budget(monkeypatch, app, "auth.logout", 0, None)
+    auth.login()
+
+    with pytest.raises(QueryBudgetExceeded, match="auth.logout ran 1 queries"):
+        client.get("/auth/logout")
+
+
+def test_caught_violation_still_fails(client, auth, app, monkeypatch):
+    # rate turns any exception into a 500 response
+    set_budget(monkeypatch, app, "jokes.rate", 2, None)
+    auth.login()
+
+    with pytest.raises(QueryBudgetExceeded):
+        client.post("/1/rate", data={"rating": "4"})
+
+
+def test_logged_budget(client, app, caplog, monkeypatch):
+    app.config["QUERY_BUDGET_STRICT"] = False
+    set_budget(monkeypatch, app, "auth.login", None, 0)
+
+    with caplog.at_level(logging.WARNING):
+        client.post("/auth/login", data={"username": "test", "password": "a"})
+
+    assert "auth.login read 1 rows, budget is 0" in caplog.text
+
+
+# (method, path, form data), run in order as the logged in author
+ROUTES = [
+    ("get", "/hello", None),
+    ("get", "/metrics", None),
+    ("get", "/", None),
+    ("get", "/auth/profile/test", None),
+    ("get", "/leave", None),
+    ("post", "/leave", {"title": "new", "body": "joke", "tags": "dad pun"}),
+    ("get", "/tag/dad+pun", None),
+    ("get", "/1/update", None),
+    ("post", "/1/update", {"title": "updated", "body": ""}),
+    ("post", "/1/rate", {"rating": "4"}),
+    ("post", "/1/comment", {"body": "lol"}),
+    ("get", "/1/comments?after=0.0", None),
+    ("post", "/comment/1/delete", None),
+    ("post", "/1/delete", None),
+    ("get", "/events?jokes=2", None),
+    ("get", "/assets/style.css", None),
+    ("get", "/auth/users/suggest?q=te", None),
+    ("get", "/auth/available?nickname=test", None),
+    ("get", "/api/v1/jokes?fields=id,tags", None),
+    ("get", "/api/v1/jokes/1", None),
+    ("get", "/api/v1/jokes/1/comments", None),
+    ("get", "/api/v1/users/test", None),
+    ("put", "/api/v1/jokes/1/rating", '{"rating": 4}'),
+    ("post", "/api/v1/ratings", '{"ratings": [{"joke_id": 1, "rating": 5}]}'),
+    ("get", "/auth/register", None),
+    ("post", "/auth/register", {
+        "username": "new@example.com",
+        "nickname": "new_user",
+        "password": "secret",
+        "confirm-password": "secret",
+    }),
+    ("get", "/auth/logout", None),
+    ("get", "/auth/login", None),
+    ("post", "/auth/login", {"username": "test", "password": "test"}),
+]
+
+
+def test_every_route_within_budget(client, auth, app):
+    auth.login()
+
+    with querystats.capture(app) as captured:
+        for method, path, data in ROUTES:
+            response = getattr(client, method)(path, data=data)
+            if path.startswith("/events"):
+                # an event stream never ends on its own
+                response.close()
+            else:
+                response.get_data()
+
+    assert {stats.endpoint for stats in captured} == set(app.view_functions) - {
+        "static"
+    }
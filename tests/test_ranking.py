@@ -0,0 +1,84 @@
+import time
+
+import pytest
+from flaskr import ranking
+from flaskr.db import get_db
+
+
+@pytest.fixture
+def ranked(app):
+    """An old joke with a single 5, an old one with five ratings
+    averaging 4.8, and a new one with a single 4.
+    """
+    now = int(time.time())
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO user (username, nickname, password) VALUES (?, ?, 'x')",
+            [(f"rater{i}", f"rater{i}") for i in range(3, 6)],
+        )
+        db.executemany(
+            "INSERT INTO post (title, body, author_id, created) VALUES (?, '', 1, ?)",
+            [("lucky one", 1514851200), ("fresh one", now)],
+        )
+        db.executemany(
+            "INSERT INTO rating (post_id, user_id, rating) VALUES (?, ?, ?)",
+            [(2, 1, 5), (3, 1, 4)]
+            + [(1, user_id, 5) for user_id in (1, 2, 3, 4)]
+            + [(1, 5, 4)],
+        )
+        for post_id in (1, 2, 3):
+            ranking.rescore(db, post_id)
+        db.commit()
+
+
+def titles(client, sort):
+    page = client.get("/", query_string={"sort": sort}).get_data(as_text=True)
+    found = [(page.index(t), t) for t in ("test title", "lucky one", "fresh one") if t in page]
+    return [t for _, t in sorted(found)]
+
+
+@pytest.mark.parametrize(
+    ("sort", "expected"),
+    (
+        # a single 5 no longer beats 4.8 over five ratings
+        ("top", ["test title", "lucky one", "fresh one"]),
+        # the old jokes have sunk, but more stars still count for more
+        ("hot", ["fresh one", "test title", "lucky one"]),
+        ("new", ["fresh one", "lucky one", "test title"]),
+        ("bogus", ["test title", "lucky one", "fresh one"]),
+    ),
+)
+def test_sort(client, ranked, sort, expected):
+    assert titles(client, sort) == expected
+
+
+def test_rate_updates_scores(client, auth, app):
+    auth.login()
+    client.post("/1/rate", data={"rating": 5})
+
+    with app.app_context():
+        row = get_db().execute(
+            "SELECT rating_sum, rating_count, score, hot FROM post WHERE id = 1"
+        ).fetchone()
+
+    assert tuple(row[:3]) == (5, 1, 20 / 6)
+    assert row["hot"] > 0
+
+
+def test_decay(app, ranked):
+    with app.app_context():
+        db = get_db()
+        before = db.execute("SELECT hot FROM post WHERE id = 3").fetchone()[0]
+
+        # the old jokes are past the window
+        assert ranking.decay(db, time.time() + 3600) == 1
+        after = db.execute("SELECT hot FROM post WHERE id = 3").fetchone()[0]
+        assert 0 < after < before
+
+        assert ranking.decay(db, time.time() + ranking.HOT_WINDOW) == 0
+
+
+def test_rescore_missing_post(app):
+    with app.app_context():
+        assert ranking.rescore(get_db(), 42) is None
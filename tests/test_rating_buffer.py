@@ -0,0 +1,85 @@
+import pytest
+from flaskr.db import get_db
+from flaskr.rating_buffer import RatingBuffer
+
+
+@pytest.fixture
+def buffer(app):
+    buffer = RatingBuffer(app.config["DATABASE"], interval=3600, max_entries=3)
+    app.extensions["rating_buffer"] = buffer
+    yield buffer
+    buffer.close()
+
+
+def stored_ratings(app):
+    with app.app_context():
+        return get_db().execute(
+            "SELECT post_id, user_id, rating FROM rating ORDER BY user_id"
+        ).fetchall()
+
+
+def test_ratings_are_buffered(client, auth, app, buffer):
+    auth.login()
+
+    for stars in (2, 4, 5):
+        response = client.post("/1/rate", data={"rating": stars})
+        assert response.json["avg_rating"] == stars
+        assert response.json["rating_count"] == 1
+
+    # repeated ratings by one user collapse into a single entry
+    assert buffer.pending == {(1, 1): 5}
+    assert stored_ratings(app) == []
+
+    assert buffer.flush() == 1
+    assert [tuple(r) for r in stored_ratings(app)] == [(1, 1, 5)]
+    assert buffer.aggregates == {}
+
+    with app.app_context():
+        totals = get_db().execute(
+            "SELECT rating_sum, rating_count FROM post WHERE id = 1"
+        ).fetchone()
+    assert tuple(totals) == (5, 1)
+
+
+def test_aggregate_includes_stored_ratings(client, auth, app, buffer):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO rating (post_id, user_id, rating) VALUES (1, 2, 1)")
+        db.commit()
+
+    auth.login()
+    response = client.post("/1/rate", data={"rating": 5})
+    assert response.json == {"success": True, "avg_rating": 3.0, "rating_count": 2}
+
+    buffer.flush()
+    response = client.post("/1/rate", data={"rating": 3})
+    assert response.json["avg_rating"] == 2.0
+    assert response.json["rating_count"] == 2
+
+
+def test_flush_when_full(app, buffer):
+    with app.app_context():
+        db = get_db()
+        for user_id in (1, 2, 3):
+            buffer.rate(db, 1, user_id, 4)
+
+    assert buffer.pending == {}
+    assert len(stored_ratings(app)) == 3
+
+
+def test_close_flushes(app, buffer):
+    with app.app_context():
+        buffer.rate(get_db(), 1, 2, 4)
+
+    buffer.close()
+
+    assert [tuple(r) for r in stored_ratings(app)] == [(1, 2, 4)]
+
+
+def test_delete_discards_pending(client, auth, app, buffer):
+    auth.login()
+    client.post("/1/rate", data={"rating": 4})
+    client.post("/1/delete")
+
+    assert buffer.pending == {}
+    assert buffer.flush() == 0
@@ -0,0 +1,93 @@
+import pytest
+from flaskr import recommend
+from flaskr.db import get_db
+
+
+def test_similar_items_match_dense_cosine():
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(0)
+    dense = rng.integers(1, 6, size=(30, 12)) * (rng.random((30, 12)) < 0.4)
+    users, items = np.nonzero(dense)
+    values = recommend.center(users, dense[users, items].astype(float))
+
+    # small batches, so pairs are summed across them
+    item, rank, neighbor, similarity = recommend.similar_items(
+        users, items, values, 12, count=3, max_pairs=20
+    )
+
+    centered = np.zeros(dense.shape)
+    centered[users, items] = values
+    norms = np.linalg.norm(centered, axis=0)
+    expected = centered.T @ centered / np.outer(norms, norms)
+    np.fill_diagonal(expected, 0)
+    for i in range(12):
+        best = np.sort(expected[i][expected[i] > 0])[::-1][:3]
+        assert np.allclose(similarity[item == i], best)
+        assert list(rank[item == i]) == list(range(len(best)))
+        assert np.allclose(expected[i, neighbor[item == i]], best)
+
+
+def test_recommend_command(runner, app, client, auth):
+    pytest.importorskip("numpy")
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO user (username, nickname, password) VALUES (?, ?, 'x')",
+            [(f"rater{i}", f"rater{i}") for i in range(3, 6)],
+        )
+        db.executemany(
+            "INSERT INTO post (title, body, author_id) VALUES (?, '', 3)",
+            [("liked too",), ("disliked",)],
+        )
+        # users 3 to 5 like jokes 1 and 2 together and dislike 3; user 1
+        # wrote joke 1, so it isn't recommended to them
+        db.executemany(
+            "INSERT INTO rating (post_id, user_id, rating) VALUES (?, ?, ?)",
+            [(post, user, stars) for user in (3, 4, 5) for post, stars in ((1, 5), (2, 5), (3, 1))]
+            + [(1, 2, 5), (3, 2, 1), (2, 1, 5), (3, 1, 1)],
+        )
+        db.commit()
+
+    result = runner.invoke(args=["recommend", "--count", "3"])
+    # joke 3 is only ever rated against the others
+    assert "for 2 jokes" in result.output
+
+    with app.app_context():
+        db = get_db()
+        neighbors = db.execute(
+            "SELECT neighbor_id FROM post_neighbor WHERE post_id = 1 ORDER BY rank"
+        ).fetchall()
+        assert [tuple(row) for row in neighbors] == [(2,)]
+        # user 2 hasn't rated joke 2, which is like the joke they liked
+        recommended = db.execute(
+            "SELECT user_id, post_id FROM recommendation ORDER BY user_id, rank"
+        ).fetchall()
+        assert [tuple(row) for row in recommended] == [(2, 2)]
+
+
+def test_recommend_command_needs_numpy(runner, monkeypatch):
+    monkeypatch.setattr(recommend, "np", None)
+    result = runner.invoke(args=["recommend"])
+    assert "needs numpy" in result.output
+
+
+def test_index_shows_recommendations(app, client, auth):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO post (title, body, author_id) VALUES ('rated', '', 2)")
+        db.executemany(
+            "INSERT INTO recommendation (user_id, rank, post_id, score) VALUES (1, ?, ?, 1)",
+            [(0, 2), (1, 1)],
+        )
+        db.execute("INSERT INTO rating (post_id, user_id, rating) VALUES (2, 1, 4)")
+        db.commit()
+
+    assert b"Jokes you might like" not in client.get("/").data
+
+    auth.login()
+    page = client.get("/").get_data(as_text=True)
+    start = page.index("Jokes you might like")
+    recommended = page[start:page.index("</ul>", start)]
+    # joke 2 was rated since the job ran
+    assert 'href="#joke-1"' in recommended
+    assert "#joke-2" not in recommended
@@ -0,0 +1,104 @@
+import pytest
+from flaskr import create_app
+from flaskr.db import get_db
+from flaskr.suggest import NicknameIndex
+from flaskr.suggest import like_prefix
+
+NICKNAMES = ["Bob", "bobby", "bob_2", "Alice", "alfred", "al", "BOBCAT", "zed"]
+
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO user (username, nickname, password) VALUES (?, ?, '')",
+            [(f"{nickname}@example.com", nickname) for nickname in NICKNAMES],
+        )
+        db.commit()
+
+
+def test_index_search():
+    index = NicknameIndex(refresh=60)
+    for nickname in NICKNAMES:
+        index.add(nickname)
+    # already there
+    index.add("bobby")
+
+    assert index.search("bob", 10) == ["Bob", "bob_2", "bobby", "BOBCAT"]
+    assert index.search("BOB", 2) == ["Bob", "bob_2"]
+    assert index.search("al", 10) == ["al", "alfred", "Alice"]
+    assert index.search("q", 10) == []
+
+
+def test_like_prefix():
+    assert like_prefix("bob_2") == "bob\\_2%"
+    assert like_prefix("50%") == "50\\%%"
+
+
+@pytest.mark.parametrize("in_memory", (True, False))
+def test_suggest(app, client, users, in_memory):
+    app = create_app(
+        {
+            "TESTING": True,
+            "DATABASE": app.config["DATABASE"],
+            "SUGGEST_IN_MEMORY": in_memory,
+            "SUGGEST_COUNT": 3,
+        }
+    )
+    client = app.test_client()
+
+    response = client.get("/auth/users/suggest?q=bob")
+    assert response.json == {"q": "bob", "nicknames": ["Bob", "bob_2", "bobby"]}
+    # _ is not a wildcard
+    assert client.get("/auth/users/suggest?q=bob_").json["nicknames"] == ["bob_2"]
+    assert client.get("/auth/users/suggest?q=").json["nicknames"] == []
+    # emails aren't searched
+    assert client.get("/auth/users/suggest?q=example").json["nicknames"] == []
+
+
+def test_registered_user_is_suggested(client, users):
+    assert client.get("/auth/users/suggest?q=car").json["nicknames"] == []
+
+    client.post(
+        "/auth/register",
+        data={
+            "username": "carol@example.com",
+            "nickname": "Carol",
+            "password": "secret",
+            "confirm-password": "secret",
+        },
+    )
+
+    assert client.get("/auth/users/suggest?q=car").json["nicknames"] == ["Carol"]
+
+
+def test_registered_user_is_not_caught_up_twice(app, client, users):
+    app.extensions["nickname_index"].refresh = 0
+    client.get("/auth/users/suggest?q=ne")
+
+    client.post(
+        "/auth/register",
+        data={
+            "username": "newbie@example.com",
+            "nickname": "newbie",
+            "password": "secret",
+            "confirm-password": "secret",
+        },
+    )
+
+    assert client.get("/auth/users/suggest?q=ne").json["nicknames"] == ["newbie"]
+
+
+def test_users_from_elsewhere_are_caught_up(app, client, users):
+    app.extensions["nickname_index"].refresh = 0
+    assert client.get("/auth/users/suggest?q=dave").json["nicknames"] == []
+
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO user (username, nickname, password) VALUES ('d@e.f', 'dave', '')"
+        )
+        db.commit()
+
+    assert client.get("/auth/users/suggest?q=dave").json["nicknames"] == ["dave"]
@@ -0,0 +1,108 @@
+import pytest
+from flaskr import tags
+from flaskr.db import get_db
+
+
+def test_parse_and_check():
+    assert tags.parse(" #Dad, pun  dad,,knock-knock") == ["dad", "pun", "knock-knock"]
+    assert tags.parse("") == []
+    assert tags.check(["dad", "knock-knock"]) is None
+    assert "at most 5" in tags.check(list("abcdef"))
+    assert "dashes" in tags.check(["-dad"])
+    assert "dashes" in tags.check(["x" * 31])
+
+
+def test_intersect():
+    assert tags.intersect([[1, 3, 5, 7, 9], [3, 4, 5, 9, 12], [5, 9, 10]]) == [5, 9]
+    assert tags.intersect([[1, 2], [3, 4], [1, 2]]) == []
+    assert tags.intersect([[2, 4]]) == [2, 4]
+    assert tags.intersect([]) == []
+
+
+@pytest.fixture
+def tagged(app):
+    """Jokes 1-4 tagged dad, pun and programming in different mixes."""
+    with app.app_context():
+        db = get_db()
+        tags.add(db, 1, ["dad", "pun"])
+        for id, names in ((2, ["dad"]), (3, ["programming", "dad", "pun"]), (4, ["pun"])):
+            db.execute(
+                "INSERT INTO post (id, title, body, author_id) VALUES (?, ?, '', 1)",
+                (id, f"joke {id}"),
+            )
+            tags.add(db, id, names)
+        db.commit()
+    return app
+
+
+def counts(db):
+    return dict(db.execute("SELECT name, post_count FROM tag").fetchall())
+
+
+def test_counts_kept_on_write(tagged):
+    with tagged.app_context():
+        db = get_db()
+        assert counts(db) == {"dad": 3, "pun": 3, "programming": 1}
+
+        tags.replace(db, 3, ["dad", "science"])
+        db.execute("DELETE FROM post WHERE id = 1")
+        db.commit()
+
+        assert counts(db) == {"dad": 2, "pun": 1, "programming": 0, "science": 1}
+        assert db.execute("SELECT COUNT(*) FROM post_tag WHERE post_id = 1").fetchone()[0] == 0
+
+
+def test_matching(tagged):
+    with tagged.app_context():
+        db = get_db()
+        assert tags.matching(db, ["dad"]) == [1, 2, 3]
+        assert tags.matching(db, ["dad", "pun"]) == [1, 3]
+        assert tags.matching(db, ["programming", "pun", "dad"]) == [3]
+        assert tags.matching(db, ["programming", "pun"]) == [3]
+        assert tags.matching(db, ["nope"]) is None
+
+
+def test_rarest_postings_read_first(tagged):
+    statements = []
+    with tagged.app_context():
+        db = get_db()
+        db.set_trace_callback(statements.append)
+        tags.add(db, 2, ["science"])
+        statements.clear()
+        # programming and science share no joke, so the common dad
+        # postings are never read
+        assert tags.matching(db, ["dad", "science", "programming"]) == []
+
+    assert len(statements) == 3
+
+
+def test_tag_feed(client, tagged):
+    page = client.get("/tag/dad+pun").data
+    assert b"joke 3" in page
+    assert b"test title" in page
+    assert b"joke 2" not in page
+    # the other tags among the matches, with counts, refine the filter
+    assert b'href="/tag/dad+pun+programming"' in page
+    assert b'href="/tag/dad+pun+dad"' not in page
+
+    assert client.get("/tag/science").status_code == 404
+    assert client.get("/tag/a+b+c+d").status_code == 404
+
+
+def test_index_facets(client, tagged):
+    page = client.get("/").data.decode()
+    assert page.index('href="/tag/dad"') < page.index('href="/tag/programming"')
+    assert "#programming" in page
+
+
+def test_leave_and_update_with_tags(client, auth, app):
+    auth.login()
+    client.post("/leave", data={"title": "new", "body": "a joke", "tags": "Dad, pun"})
+    assert client.get("/2/update").data.count(b"dad pun") == 1
+
+    response = client.post("/2/update", data={"title": "new", "body": "x", "tags": "-bad"})
+    assert b"single dashes" in response.data
+
+    client.post("/2/update", data={"title": "new", "body": "x", "tags": "pun"})
+    with app.app_context():
+        assert counts(get_db()) == {"dad": 0, "pun": 1}
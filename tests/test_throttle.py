@@ -0,0 +1,99 @@
+import pytest
+from flaskr import auth
+from flaskr.throttle import ADDRESS
+from flaskr.throttle import IDENTIFIER
+from flaskr.throttle import LoginThrottle
+
+
+def make_throttle(max_keys=100):
+    return LoginThrottle(
+        window=60, free={IDENTIFIER: 3, ADDRESS: 5}, base=1, cap=8, max_keys=max_keys
+    )
+
+
+def test_backoff_doubles_up_to_cap():
+    throttle = make_throttle()
+    now = 0
+    for _ in range(3):
+        throttle.failed("bob", "1.1.1.1", now=now)
+    assert throttle.retry_after("bob", "1.1.1.1", now=now) == 1
+    throttle.failed("bob", "1.1.1.1", now=now + 1)
+    assert throttle.retry_after("bob", "1.1.1.1", now=now + 1) == 2
+    throttle.failed("bob", "1.1.1.1", now=now + 3)
+    assert throttle.retry_after("bob", "1.1.1.1", now=now + 3) == 4
+    for t in range(4, 10):
+        throttle.failed("bob", "1.1.1.1", now=now + 7 + t)
+    assert throttle.retry_after("bob", "1.1.1.1", now=now + 16) == 8
+
+    # the address is past its free attempts too, for everyone
+    assert throttle.retry_after("alice", "1.1.1.1", now=now + 16) == 8
+    assert throttle.snapshot()["throttled_by_address"] == 1
+
+
+def test_failures_slide_out_of_window():
+    throttle = make_throttle()
+    for t in range(3):
+        throttle.failed("bob", "1.1.1.1", now=t)
+    assert throttle.retry_after("bob", "1.1.1.1", now=2.5) == 0.5
+    # only the failure at 2 is left for both keys
+    assert throttle.retry_after("bob", "1.1.1.1", now=61) == 0
+    assert throttle.snapshot()["keys"] == 2
+    assert throttle.retry_after("bob", "1.1.1.1", now=63) == 0
+    assert throttle.snapshot()["keys"] == 0
+
+
+def test_memory_is_bounded():
+    throttle = make_throttle(max_keys=10)
+    for i in range(20):
+        for _ in range(10):
+            throttle.failed(f"user{i}", "1.1.1.1", now=0)
+
+    assert len(throttle.failures) == 10
+    assert max(len(f) for f in throttle.failures.values()) <= throttle.keep[ADDRESS]
+    # the address is the most recently failed key, so it stays
+    assert (ADDRESS, "1.1.1.1") in throttle.failures
+    assert throttle.snapshot()["evicted"] == 11
+
+
+def test_success_clears_identifier_only():
+    throttle = make_throttle()
+    for t in range(5):
+        throttle.failed("bob", "1.1.1.1", now=t)
+    throttle.succeeded("bob")
+    assert throttle.retry_after("bob", "2.2.2.2", now=4) == 0
+    assert throttle.retry_after("carol", "1.1.1.1", now=4) == 1
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    """The password checks login runs."""
+    calls = []
+    check = auth.check_password_hash
+
+    def counted(*args):
+        calls.append(args)
+        return check(*args)
+
+    monkeypatch.setattr(auth, "check_password_hash", counted)
+    return calls
+
+
+def test_login_is_throttled_before_hashing(client, hashes):
+    for _ in range(5):
+        response = client.post("/auth/login", data={"username": "test", "password": "x"})
+        assert response.status_code == 200
+    assert len(hashes) == 5
+
+    response = client.post("/auth/login", data={"username": " TEST", "password": "test"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert b"Too many failed attempts" in response.data
+    assert len(hashes) == 5
+
+    # other accounts from the same address aren't held up yet
+    response = client.post("/auth/login", data={"username": "other", "password": "other"})
+    assert response.status_code != 429
+
+    metrics = client.get("/metrics").json["login_throttle"]
+    assert metrics["failed"] == 5
+    assert metrics["throttled_by_identifier"] == 1
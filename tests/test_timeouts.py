@@ -0,0 +1,93 @@
+import time
+
+import pytest
+from flaskr.db import get_db
+from flaskr.querystats import Budget
+from flaskr.timeouts import QueryTimeouts
+
+
+@pytest.fixture
+def no_time(app, monkeypatch):
+    """Give the profile and index pages no time for their queries."""
+    for endpoint in ("auth.profile", "jokes.index"):
+        view = app.view_functions[endpoint]
+        monkeypatch.setattr(view, "query_budget", Budget(None, None, 0))
+    app.config["QUERY_PROGRESS_STEPS"] = 1
+    return app.extensions["query_timeouts"]
+
+
+def test_overrun_is_cancelled(client, no_time):
+    response = client.get("/auth/profile/test")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert no_time.cancelled["auth.profile"] == 1
+
+
+def test_cancelled_path_cools_down(client, no_time):
+    client.get("/auth/profile/test")
+
+    assert client.get("/auth/profile/test").status_code == 503
+    assert no_time.rejected["auth.profile"] == 1
+    # turned away before running a query that could be cancelled
+    assert no_time.cancelled["auth.profile"] == 1
+
+    # other pages, and the same page after the cooldown, still run
+    assert client.get("/hello").status_code == 200
+    assert client.get("/auth/profile/test?tab=jokes").status_code == 503
+    assert no_time.cancelled["auth.profile"] == 2
+    no_time.cooling["/auth/profile/test?"] = time.monotonic()
+    assert client.get("/auth/profile/test").status_code == 503
+    assert no_time.cancelled["auth.profile"] == 3
+
+
+def test_streamed_page_is_cut_short(client, no_time):
+    response = client.get("/")
+
+    assert response.status_code == 200
+    assert b"timeout-notice" in response.data
+    assert b"test title" not in response.data
+    assert no_time.cancelled["jokes.index"] == 1
+
+    # only this response ran long; the page isn't cooled down
+    assert not no_time.cooling
+    assert client.get("/").status_code == 200
+
+
+def test_slow_reader_keeps_its_budget(app, client, monkeypatch):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (title, body, author_id) VALUES (?, '', 1)",
+            [(f"joke {i}",) for i in range(5)],
+        )
+        db.commit()
+    view = app.view_functions["jokes.index"]
+    monkeypatch.setattr(view, "query_budget", Budget(None, None, 0.1))
+    app.config["QUERY_PROGRESS_STEPS"] = 1
+
+    response = client.get("/", buffered=False)
+    body = b""
+    for chunk in response.iter_encoded():
+        body += chunk
+        # far more than the budget, in all
+        time.sleep(0.005)
+
+    assert b"timeout-notice" not in body
+    assert b"joke 4" in body
+    assert not app.extensions["query_timeouts"].cancelled
+
+
+def test_within_budget(client, app):
+    assert b"test title" in client.get("/").data
+    assert not app.extensions["query_timeouts"].cancelled
+
+
+def test_cooling_paths_are_bounded():
+    timeouts = QueryTimeouts(cooldown=0, max_paths=2)
+    for path in ("/a", "/b", "/c"):
+        timeouts.cancel("x", path)
+
+    assert len(timeouts.cooling) <= 2
+    assert timeouts.cancelled["x"] == 3
+    assert not timeouts.reject("x", "/c")